@@ -0,0 +1,76 @@
+import gzip
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler
+
+
+class FakeIngestHandler(BaseHTTPRequestHandler):
+    """
+    Handles the requests of the ingest API (POST) and of the S3 API (PUT of
+    an object), according to the settings of the `FakeIngestServer`.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = self._read_body()
+
+        failure = self._failure()
+        if failure:
+            return self._respond(*failure)
+
+        records = json.loads(body)
+        self.server.record_arrivals(records if isinstance(records, list) else [])
+        self._respond(200, '"OK"')
+
+    def do_PUT(self):
+        body = self._read_body()
+
+        failure = self._failure()
+        if failure:
+            return self._respond(*failure)
+
+        try:
+            records = json.loads(body)
+        except ValueError:
+            records = []  # not a batch of records, e.g. a custom payload
+
+        self.server.record_arrivals(records if isinstance(records, list) else [])
+        self._respond(200, "", {"ETag": '"fake"'})
+
+    def log_message(self, format, *args):
+        pass  # keep the benchmark output clean
+
+    def _read_body(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        return body
+
+    def _failure(self):
+        """
+        Returns the failure response to inject, if any.
+        """
+        if random.random() < self.server.throttle_rate:
+            return 429, '"Too Many Requests"', {"Retry-After": "1"}
+
+        if random.random() < self.server.error_rate:
+            return 500, '"Internal Server Error"'
+
+        return None
+
+    def _respond(self, status, text, headers=None):
+        data = text.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
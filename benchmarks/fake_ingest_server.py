@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+A stand-in for the ingest API (and for S3 uploads), for benchmarking.
+
+It accepts all requests (gzipped or not), optionally after some latency, and
+can inject server errors and rate limiting. It keeps track of when each
+record (by `uniqueId`) arrived, using `time.perf_counter()`.
+
+It can also be run on its own, e.g.:
+
+    ./fake_ingest_server.py --port 8080 --latency 0.05 --error-rate 0.01
+"""
+
+import argparse
+import time
+from http.server import ThreadingHTTPServer
+from threading import Lock, Thread
+
+from fake_ingest_handler import FakeIngestHandler
+
+
+class FakeIngestServer(ThreadingHTTPServer):
+    """
+    Runs in a background thread, see `start` and `stop`.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self, port=0, latency=0, error_rate=0, throttle_rate=0, track_arrivals=True
+    ):
+        """
+        port:
+            Port to listen on (on localhost). By default, any free port.
+
+        latency:
+            Seconds to wait before responding to each request.
+
+        error_rate, throttle_rate:
+            Fraction of the requests to fail with 500 and 429, respectively.
+
+        track_arrivals:
+            Whether to record the arrival time of each record.
+        """
+        super().__init__(("127.0.0.1", port), FakeIngestHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.track_arrivals = track_arrivals
+        self.arrivals = {}
+        self.requests = 0
+        self.records = 0
+        self.lock = Lock()
+        self.thread = Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}".format(self.server_address[1])
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self.thread.join()
+
+    def record_arrivals(self, records):
+        now = time.perf_counter()
+
+        with self.lock:
+            self.requests += 1
+            self.records += len(records)
+
+            if not self.track_arrivals:
+                return
+
+            for record in records:
+                if isinstance(record, dict) and "uniqueId" in record:
+                    self.arrivals.setdefault(record["uniqueId"], now)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--throttle-rate", type=float, default=0)
+    args = parser.parse_args()
+
+    server = FakeIngestServer(
+        args.port,
+        args.latency,
+        args.error_rate,
+        args.throttle_rate,
+        track_arrivals=False,
+    )
+    print("Listening on", server.url)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
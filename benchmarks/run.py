@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+Benchmarks of the ingestion path, against a local stand-in of the ingest API
+(see `fake_ingest_server.py`), so they don't need network access or an API
+key.
+
+The results are printed as JSON (or written to `--output`), and can be
+compared against a previous run with `--baseline`, e.g.:
+
+    ./run.py --output baseline.json
+    # upgrade the library, then:
+    ./run.py --baseline baseline.json
+
+in which case the exit status is 1 if any result regressed by more than the
+`--tolerance`.
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+import timeit
+import tracemalloc
+
+from fake_ingest_server import FakeIngestServer
+
+from metering import validators
+from metering.ingest import (
+    IngestApiClient,
+    MeterEvent,
+    ThreadedProducer,
+    create_ingest_payload,
+)
+from metering.ingest.unique_id import SequentialIdGenerator, uuid4_id
+from metering.version import VERSION
+
+try:
+    import boto3
+    from botocore.config import Config
+except ImportError:
+    boto3 = None
+
+
+class _LocalIngestApiClient(IngestApiClient):
+    def __init__(self, api_key, root_url):
+        super().__init__(api_key)
+        self.client.root_url = root_url
+
+
+def _result(name, value, unit, better="higher"):
+    return {"name": name, "value": value, "unit": unit, "better": better}
+
+
+def _percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return None
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def _ops_per_second(function, number):
+    elapsed = min(timeit.repeat(function, number=number, repeat=3))
+    return number / elapsed
+
+
+def _payload(i):
+    return create_ingest_payload(
+        meter_api_name="ApiCalls",
+        meter_value=1,
+        meter_time_in_millis=int(time.time() * 1000),
+        customer_id="customer-{}".format(i % 100),
+        dimensions={"region": "us-west-2", "endpoint": "/v1/items"},
+    )
+
+
+def bench_payload(args):
+    yield _result(
+        "create_ingest_payload",
+        _ops_per_second(lambda: _payload(0), args.events),
+        "ops/s",
+    )
+
+    yield _result("unique_id_uuid4", _ops_per_second(uuid4_id, args.events), "ops/s")
+    yield _result(
+        "unique_id_sequential",
+        _ops_per_second(SequentialIdGenerator(), args.events),
+        "ops/s",
+    )
+
+
+def bench_meter(args):
+    # Without consumers, this measures the calling thread only.
+    producer = ThreadedProducer(
+        {"api_key": "benchmark"}, max_queue_size=args.events * 7, threads=0
+    )
+    dimensions = {"region": "us-west-2", "endpoint": "/v1/items"}
+    api_calls = producer.prepare("ApiCalls", dimensions=dimensions)
+
+    def meter():
+        producer.meter("ApiCalls", 1, 1700000000000, "customer-1", dimensions)
+
+    yield _result("meter", _ops_per_second(meter, args.events), "ops/s")
+    yield _result(
+        "meter_prepared",
+        _ops_per_second(lambda: api_calls(1, "customer-1"), args.events),
+        "ops/s",
+    )
+    producer.join()
+
+
+def bench_validators(args):
+    dimensions = {"region": "us-west-2", "endpoint": "/v1/items"}
+
+    def validate():
+        validators.require_string("name", "ApiCalls")
+        validators.require_positive_int("time", 1700000000000)
+        validators.require_positive_number("value", 1.5)
+        validators.require_string_dictionary("dimensions", dimensions)
+
+    yield _result("validators", _ops_per_second(validate, args.events), "ops/s")
+
+
+_scenarios = {
+    "fast": {},
+    "slow": {"latency": 0.05},
+    "flaky": {"error_rate": 0.02},
+}
+
+
+def bench_producer(args):
+    for scenario, server_args in _scenarios.items():
+        yield from _bench_producer(args, scenario, server_args)
+
+
+def _bench_producer(args, scenario, server_args):
+    server = FakeIngestServer(**server_args).start()
+
+    try:
+        producer = ThreadedProducer(
+            {"api_key": "benchmark", "root_url": server.url},
+            _LocalIngestApiClient,
+            max_queue_size=args.events,
+            threads=args.threads,
+        )
+
+        enqueued = {}
+        start = time.perf_counter()
+
+        for i in range(args.events):
+            payload = _payload(i)
+            enqueued[payload["uniqueId"]] = time.perf_counter()
+            producer.send(payload)
+
+        producer.flush()
+        elapsed = time.perf_counter() - start
+        producer.join()
+    finally:
+        server.stop()
+
+    latencies = [
+        arrival - enqueued[unique_id]
+        for unique_id, arrival in server.arrivals.items()
+        if unique_id in enqueued
+    ]
+
+    name = "producer_{}".format(scenario)
+    yield _result(name + "_throughput", len(latencies) / elapsed, "events/s")
+    yield _result(name + "_latency_p50", _percentile(latencies, 50), "s", "lower")
+    yield _result(name + "_latency_p99", _percentile(latencies, 99), "s", "lower")
+
+
+def _event(i):
+    return MeterEvent(
+        meter_api_name="ApiCalls",
+        meter_value=1,
+        meter_time_in_millis=int(time.time() * 1000),
+        customer_id="customer-{}".format(i % 100),
+        dimensions={"region": "us-west-2", "endpoint": "/v1/items"},
+    )
+
+
+def bench_memory(args):
+    for name, create in (("event", _payload), ("meter_event", _event)):
+        # Without consumers, the queued events stay in memory.
+        producer = ThreadedProducer(
+            {"api_key": "benchmark"}, max_queue_size=args.events, threads=0
+        )
+
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+
+        for i in range(args.events):
+            producer.send(create(i))
+
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        producer.join()
+
+        yield _result(
+            "memory_per_queued_" + name,
+            (after - before) / args.events,
+            "bytes",
+            "lower",
+        )
+
+
+def bench_s3(args):
+    if boto3 is None:
+        print("Skipping S3 benchmark: boto3 is not installed", file=sys.stderr)
+        return
+
+    from metering.ingest import IngestS3Client
+
+    server = FakeIngestServer(track_arrivals=False).start()
+
+    try:
+        client = IngestS3Client("benchmark", "test", "test")
+        client.s3 = _local_s3(server.url)
+
+        batch = [_payload(i) for i in range(100)]
+        batches = max(1, args.events // len(batch))
+        latencies = []
+
+        for _ in range(batches):
+            start = time.perf_counter()
+            client.send(batch)
+            latencies.append(time.perf_counter() - start)
+    finally:
+        server.stop()
+
+    yield _result("s3_throughput", len(batch) / _percentile(latencies, 50), "events/s")
+    yield _result("s3_upload_p50", _percentile(latencies, 50), "s", "lower")
+    yield _result("s3_upload_p99", _percentile(latencies, 99), "s", "lower")
+
+
+def _local_s3(url):
+    options = {"s3": {"addressing_style": "path"}}
+    try:
+        # Recent versions add checksums (and chunked uploads) by default.
+        config = Config(request_checksum_calculation="when_required", **options)
+    except TypeError:
+        config = Config(**options)
+
+    return boto3.resource(
+        "s3",
+        endpoint_url=url,
+        aws_access_key_id="test",
+        aws_secret_access_key="test",
+        region_name="us-east-1",
+        config=config,
+    )
+
+
+_benchmarks = {
+    "payload": bench_payload,
+    "meter": bench_meter,
+    "validators": bench_validators,
+    "producer": bench_producer,
+    "memory": bench_memory,
+    "s3": bench_s3,
+}
+
+
+def compare(results, baseline, tolerance):
+    """
+    Returns the results that are worse than in the baseline by more than the
+    tolerance (a fraction).
+    """
+    previous = {r["name"]: r for r in baseline["results"]}
+    regressions = []
+
+    for result in results:
+        old = previous.get(result["name"])
+        if not old or not old["value"] or result["value"] is None:
+            continue
+
+        change = (result["value"] - old["value"]) / old["value"]
+        if result["better"] == "lower":
+            change = -change
+
+        if change < -tolerance:
+            regressions.append(dict(result, baseline=old["value"], change=change))
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "benchmarks", nargs="*", help="any of: " + ", ".join(_benchmarks)
+    )
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--threads", type=int, default=2)
+    parser.add_argument("--output", help="file to write the results to")
+    parser.add_argument("--baseline", help="results of a previous run")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    unknown = set(args.benchmarks) - set(_benchmarks)
+    if unknown:
+        parser.error("unknown benchmarks: " + ", ".join(sorted(unknown)))
+
+    results = []
+    for name in args.benchmarks or _benchmarks:
+        for result in _benchmarks[name](args):
+            print("{name}: {value:.6g} {unit}".format(**result), file=sys.stderr)
+            results.append(result)
+
+    report = {
+        "library_version": VERSION,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": int(time.time()),
+        "events": args.events,
+        "threads": args.threads,
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+
+        for r in regressions:
+            print(
+                "REGRESSION {name}: {value:.6g} {unit} "
+                "(baseline {baseline:.6g}, {change:+.0%})".format(**r),
+                file=sys.stderr,
+            )
+
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -57,11 +57,24 @@ def meter(*args, **kwargs):
     return _get_default_client().meter(*args, **kwargs)
 
 
-def flush():
+def prepare(*args, **kwargs):
     """
-    Blocks until all messages in the queue are consumed.
+    Returns a function that builds and enqueues meter records, validating
+    their static parts only once.
+
+    See `metering.ingest.ThreadedProducer.prepare`.
     """
-    return _get_default_client().flush()
+    return _get_default_client().prepare(*args, **kwargs)
+
+
+def flush(timeout=None):
+    """
+    Blocks until all messages in the queue are consumed (or until the timeout
+    expires). Returns a delivery report.
+
+    See `metering.ingest.ThreadedProducer.flush`.
+    """
+    return _get_default_client().flush(timeout)
 
 
 def join():
@@ -71,9 +84,11 @@ def join():
     return _get_default_client().join()
 
 
-def shutdown():
+def shutdown(timeout=None):
     """
-    Block until all items are consumed, then ends the consumer threads
-    cleanly.
+    Block until all items are consumed (or until the timeout expires), then
+    ends the consumer threads cleanly. Returns a delivery report.
+
+    See `metering.ingest.ThreadedProducer.shutdown`.
     """
-    return _get_default_client().shutdown()
+    return _get_default_client().shutdown(timeout)
@@ -0,0 +1,116 @@
+"""
+This module contains the JSON encoding used for the ingestion payloads.
+
+It uses `orjson` when it is installed, falling back to the standard library
+otherwise. A different implementation can be plugged in with `use_json_codec`.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class Fragment(bytes):
+    """
+    A JSON value that has already been serialized. Lists of fragments are
+    encoded by concatenation, without serializing their items again.
+    """
+
+
+def _default(obj):
+    """
+    Serializes objects that know their JSON form, such as
+    `metering.ingest.MeterEvent`, through their `to_payload` method.
+    """
+    to_payload = getattr(obj, "to_payload", None)
+    if to_payload is None:
+        raise TypeError(
+            "Object of type {} is not JSON serializable".format(type(obj).__name__)
+        )
+    return to_payload()
+
+
+# Built once, since `json.dumps` builds a new encoder on every call that
+# passes options.
+_json_encoder = json.JSONEncoder(separators=(",", ":"), default=_default)
+
+
+def _json_dumps(obj):
+    return _json_encoder.encode(obj).encode()
+
+
+def _orjson_dumps(obj):
+    try:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    except TypeError:
+        # Let the standard library try (and produce the usual error message).
+        return _json_dumps(obj)
+
+
+_dumps = _orjson_dumps if orjson else _json_dumps
+_loads = orjson.loads if orjson else json.loads
+
+
+def use_json_codec(dumps, loads):
+    """
+    Replace the JSON implementation.
+
+    dumps:
+        Function that serializes an object into `bytes`. To support
+        `metering.ingest.MeterEvent` instances, it should serialize the
+        objects it does not know through their `to_payload` method.
+
+    loads:
+        Function that parses `bytes` (or a string) into an object.
+    """
+    global _dumps, _loads
+    _dumps = dumps
+    _loads = loads
+
+
+def dumps(obj):
+    """
+    Serializes the object into JSON `bytes`.
+    """
+    return _dumps(obj)
+
+
+def loads(data):
+    """
+    Parses JSON `bytes` (or a string).
+    """
+    return _loads(data)
+
+
+def fragment(obj):
+    """
+    Serializes the object once, returning it as a `Fragment`.
+    """
+    if isinstance(obj, Fragment):
+        return obj
+    return Fragment(_dumps(obj))
+
+
+def join(fragments):
+    """
+    Builds a JSON array out of the fragments.
+    """
+    return b"[" + b",".join(fragments) + b"]"
+
+
+def encode(payload):
+    """
+    Serializes a payload into JSON `bytes`. If the payload is a list holding
+    `Fragment` items, they are reused (and the other items are serialized on
+    their own), and the results are concatenated.
+    """
+    if isinstance(payload, list):
+        if not any(isinstance(item, Fragment) for item in payload):
+            return _dumps(payload)
+        return join([fragment(item) for item in payload])
+    if isinstance(payload, Fragment):
+        return bytes(payload)
+    return _dumps(payload)
@@ -1,4 +1,4 @@
-from metering import validators
+from metering import schema, validators
 from metering.session import ApiSession
 
 
@@ -118,3 +118,18 @@ def create_customer_payload(
         payload["traits"] = traits
 
     return payload
+
+
+# The payloads built by `create_customer_payload` (see
+# `metering.schema.Schema`).
+customer_payload_schema = schema.Schema(
+    required={
+        "customerId": schema.string,
+        "customerName": schema.string,
+    },
+    optional={
+        "customerEmail": schema.string,
+        "enabled": schema.boolean,
+        "traits": schema.string_dictionary,
+    },
+)
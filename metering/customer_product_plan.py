@@ -82,7 +82,9 @@ def create_customer_product_plan_payload(
 
     if start_time_in_seconds is not None and end_time_in_seconds is not None:
         msg = "'end_time_in_seconds' must come at least 1 day after the 'start_time_in_seconds'"
-        assert end_time_in_seconds >= start_time_in_seconds + ONE_DAY_IN_SECONDS, msg
+        validators.check(
+            end_time_in_seconds >= start_time_in_seconds + ONE_DAY_IN_SECONDS, msg
+        )
 
     payload = {
         "customerId": customer_id,
@@ -1,11 +1,64 @@
+import time
+from email.utils import parsedate_to_datetime
+
+
 class ApiError(Exception):
     """
     For wrapping API errors.
     """
 
-    def __init__(self, status_code, text):
+    def __init__(self, status_code, text, headers=None):
         self.status_code = status_code
         self.text = text
+        self.headers = headers or {}
 
     def __str__(self):
         return "{0}: {1}".format(self.status_code, self.text)
+
+    @property
+    def retry_after(self):
+        """
+        Number of seconds the server asked to wait before retrying (from the
+        `Retry-After` header), or None.
+        """
+        value = _get_header(self.headers, "Retry-After")
+        if value is None:
+            return None
+
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError, IndexError):
+            return None
+
+
+class ValidationError(AssertionError):
+    """
+    For invalid parameters and records (see `metering.validators` and
+    `metering.schema`). It subclasses `AssertionError` for compatibility,
+    but it is raised explicitly, so it is not disabled by `python -O`.
+    """
+
+    def __init__(self, message, errors=None):
+        super().__init__(message)
+        self.errors = errors or []
+
+
+def _get_header(headers, name):
+    """
+    Case-insensitive lookup, for plain dictionaries of headers.
+    """
+    value = headers.get(name)
+    if value is not None:
+        return value
+
+    name = name.lower()
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+
+    return None
@@ -1,6 +1,21 @@
 from metering.ingest.api_client import IngestApiClient, create_ingest_payload  # noqa
 from metering.ingest.s3_client import IngestS3Client
 from metering.ingest.producer import ThreadedProducer
+from metering.ingest.async_api_client import AsyncIngestApiClient
+from metering.ingest.async_producer import AsyncProducer
+from metering.ingest.spool import DiskSpool  # noqa
+from metering.ingest.batch_controller import AdaptiveBatchController  # noqa
+from metering.ingest.retry_scheduler import RetryScheduler  # noqa
+from metering.ingest.rate_limiter import RateLimiter  # noqa
+from metering.ingest.autoscaler import Autoscaler  # noqa
+from metering.ingest.backend_pool import BackendPool  # noqa
+from metering.ingest.fair_batch_queue import FairBatchQueue  # noqa
+from metering.ingest.memory_budget import MemoryBudget  # noqa
+from metering.ingest.meter_event import MeterEvent  # noqa
+from metering.ingest.unique_id import (  # noqa
+    SequentialIdGenerator,
+    use_unique_id_generator,
+)
 
 
 def create_ingest_client(
@@ -28,3 +43,21 @@ def create_ingest_client(
         "secret_key": secret_key,
     }
     return ThreadedProducer(params, IngestS3Client, **kwargs)
+
+
+def create_async_ingest_client(api_key, max_in_flight=4, **kwargs):
+    """
+    Convenience method to instantiate an `asyncio` ingest client, for use in
+    ASGI applications and other event loop based programs. Requires `aiohttp`.
+
+    This will return a new instance of `metering.ingest.AsyncProducer` with
+    `AsyncIngestApiClient` as backend, allowing up to `max_in_flight`
+    simultaneous requests.
+
+    Additional keyword arguments will be passed to the AsyncProducer
+    constructor.
+    """
+    params = {"api_key": api_key, "max_connections": max_in_flight}
+    return AsyncProducer(
+        params, AsyncIngestApiClient, max_in_flight=max_in_flight, **kwargs
+    )
@@ -0,0 +1,198 @@
+import hashlib
+import time
+from collections import deque
+from threading import Lock
+from uuid import UUID
+
+from metering.ingest.meter_event import MeterEvent
+from metering.ingest.unique_id import new_unique_id
+from metering.usage import AggregationType
+
+_required_keys = ("meterApiName", "customerId", "meterValue", "meterTimeInMillis")
+
+_initial = {
+    AggregationType.SUM: lambda value: value,
+    AggregationType.COUNT: lambda value: 1,
+    AggregationType.MIN: lambda value: value,
+    AggregationType.MAX: lambda value: value,
+}
+
+_fold = {
+    AggregationType.SUM: lambda total, value: total + value,
+    AggregationType.COUNT: lambda total, value: total + 1,
+    AggregationType.MIN: min,
+    AggregationType.MAX: max,
+}
+
+# Number of the latest unique ids folded into a record that are remembered,
+# to skip repeats (e.g. retries) of them.
+_recent_ids = 16
+
+
+class MeterAggregator:
+    """
+    Folds meter records (as built by `metering.ingest.create_ingest_payload`)
+    that share the same meter, customer and dimensions, and whose meter time
+    falls in the same time bucket, into a single record.
+
+    The folded record has the bucket start as its meter time, and a unique id
+    derived from the unique ids of the records folded into it, so it is
+    deterministic and retries of the same record are still deduped by the
+    server. A record whose unique id is among the latest ones folded into the
+    same record (see `_recent_ids`) is skipped, as the server would dedup it;
+    older repeats are folded again, so that the memory taken by a folded
+    record does not grow with the records folded into it. Records without a
+    unique id make the folded record's id random instead.
+
+    This class is not intended to be used directly. Rather, see the
+    `aggregate_interval_in_secs` option of
+    `metering.ingest.producer.ThreadedProducer`.
+    """
+
+    def __init__(
+        self,
+        interval_in_secs=1.0,
+        aggregations=None,
+        default_aggregation=AggregationType.SUM,
+        max_records=100000,
+    ):
+        """
+        interval_in_secs:
+            Width of the time buckets. This is also how long a folded record
+            is held before it is released.
+
+        aggregations:
+            Optional. Dictionary of meter api name to `AggregationType`, for
+            meters that should not use the `default_aggregation`.
+
+        default_aggregation:
+            `AggregationType` (SUM, COUNT, MIN or MAX) used for meters not
+            listed in `aggregations`. If None, only meters listed in
+            `aggregations` are folded.
+
+        max_records:
+            Maximum number of folded records to hold. Beyond that, records
+            that cannot be folded into an existing one are rejected.
+        """
+        self.interval_in_millis = max(1, int(interval_in_secs * 1000))
+        self.interval = interval_in_secs
+        self.aggregations = aggregations or {}
+        self.default_aggregation = default_aggregation
+        self.max_records = max_records
+        self.records = {}
+        self.lock = Lock()
+
+    def __len__(self):
+        return len(self.records)
+
+    def add(self, payload):
+        """
+        Folds the payload into the matching record. Returns whether the
+        payload was folded, otherwise it should be sent as is.
+        """
+        aggregation = self._aggregation_for(payload)
+        if aggregation is None:
+            return False
+
+        key = self._key(payload)
+        value = payload["meterValue"]
+
+        with self.lock:
+            entry = self.records.get(key)
+
+            if entry is None:
+                if len(self.records) >= self.max_records:
+                    return False
+                entry = self.records[key] = _Entry(key, payload, aggregation)
+
+            entry.fold(payload.get("uniqueId"), value)
+
+        return True
+
+    def drain(self, force=False):
+        """
+        Removes and returns the folded records which have been held for at
+        least one interval (or all of them, if `force` is true).
+        """
+        deadline = time.monotonic() - self.interval
+
+        with self.lock:
+            if force:
+                entries = list(self.records.values())
+                self.records = {}
+            else:
+                entries = [e for e in self.records.values() if e.opened <= deadline]
+                for entry in entries:
+                    del self.records[entry.key]
+
+        return [entry.payload() for entry in entries]
+
+    def _aggregation_for(self, payload):
+        if not isinstance(payload, (dict, MeterEvent)):
+            return None
+
+        if any(k not in payload for k in _required_keys):
+            return None
+
+        return self.aggregations.get(payload["meterApiName"], self.default_aggregation)
+
+    def _key(self, payload):
+        dimensions = payload.get("dimensions")
+        bucket = payload["meterTimeInMillis"] // self.interval_in_millis
+        return (
+            payload["meterApiName"],
+            payload["customerId"],
+            tuple(sorted(dimensions.items())) if dimensions else (),
+            bucket * self.interval_in_millis,
+        )
+
+
+class _Entry:
+    """
+    A folded record, accumulating the value and the digest of the unique ids.
+    """
+
+    __slots__ = ("key", "aggregation", "value", "digest", "opened", "count", "recent")
+
+    def __init__(self, key, payload, aggregation):
+        self.key = key
+        self.aggregation = aggregation
+        self.value = None
+        self.digest = hashlib.sha1(repr(key).encode())
+        self.opened = time.monotonic()
+        self.count = 0
+        self.recent = deque(maxlen=_recent_ids)
+
+    def fold(self, unique_id, value):
+        if unique_id is None:
+            # Nothing to derive the id from, so make it unique instead.
+            unique_id = new_unique_id()
+        elif unique_id in self.recent:
+            return
+        else:
+            self.recent.append(unique_id)
+
+        if self.count:
+            self.value = _fold[self.aggregation](self.value, value)
+        else:
+            self.value = _initial[self.aggregation](value)
+
+        self.count += 1
+        self.digest.update(str(unique_id).encode())
+        self.digest.update(b"\0")
+
+    def payload(self):
+        meter_api_name, customer_id, dimensions, meter_time = self.key
+
+        payload = {
+            "uniqueId": str(UUID(bytes=self.digest.digest()[:16], version=5)),
+            "meterApiName": meter_api_name,
+            "meterValue": self.value,
+            "customerId": customer_id,
+            "meterTimeInMillis": meter_time,
+        }
+
+        if dimensions:
+            payload["dimensions"] = dict(dimensions)
+
+        return payload
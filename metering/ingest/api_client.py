@@ -1,6 +1,7 @@
-from uuid import uuid4, UUID
+from uuid import UUID
 
-from metering import validators
+from metering import schema, validators
+from metering.ingest.unique_id import new_unique_id
 from metering.session import IngestSession
 
 
@@ -35,6 +36,32 @@ class IngestApiClient:
         """
         return self.client.post(self.path + "?schemaDetection=AUTO", payload)
 
+    def encode(self, payload):
+        """
+        Encode a payload into a request body, so it can be sent (possibly many
+        times) with `send_encoded` or `send_custom_encoded`.
+        """
+        return self.client.encode(payload)
+
+    def compress(self, data):
+        """
+        Same as `encode`, but for a payload already serialized to JSON (by
+        `metering.codec.encode`).
+        """
+        return self.client.compress(data)
+
+    def send_encoded(self, data):
+        """
+        Same as `send`, but for a payload encoded with `encode`.
+        """
+        return self.client.post_encoded(self.path + "/", data)
+
+    def send_custom_encoded(self, data):
+        """
+        Same as `send_custom`, but for a payload encoded with `encode`.
+        """
+        return self.client.post_encoded(self.path + "?schemaDetection=AUTO", data)
+
 
 def create_ingest_payload(
     meter_api_name,
@@ -56,7 +83,8 @@ def create_ingest_payload(
 
     customer_id: String.
 
-    unique_id: Optional. String. Defaults to a uuid4 value.
+    unique_id: Optional. String. Defaults to a new id, a uuid4 value unless
+        another generator is set (see `metering.ingest.unique_id`).
         This parameter can help the server tell if the meter is indeed a dup or
         not in case there are two meters with the same name that are sent to
         the server at the same time.
@@ -82,7 +110,7 @@ def create_ingest_payload(
     validators.require_string_dictionary("dimensions", dimensions)
 
     payload = {
-        "uniqueId": unique_id or str(uuid4()),
+        "uniqueId": unique_id or new_unique_id(),
         "meterApiName": meter_api_name,
         "meterValue": meter_value,
         "customerId": customer_id,
@@ -93,3 +121,19 @@ def create_ingest_payload(
         payload["dimensions"] = dimensions
 
     return payload
+
+
+# The payloads built by `create_ingest_payload`, e.g. for checking whole
+# batches of payloads built elsewhere (see `metering.schema.Schema`).
+ingest_payload_schema = schema.Schema(
+    required={
+        "meterApiName": schema.string,
+        "meterValue": schema.number,
+        "customerId": schema.string,
+        "meterTimeInMillis": schema.positive_int,
+    },
+    optional={
+        "uniqueId": schema.string,
+        "dimensions": schema.string_dictionary,
+    },
+)
@@ -0,0 +1,44 @@
+from metering.session import AsyncIngestSession
+
+
+class AsyncIngestApiClient:
+    """
+    The `asyncio` counterpart of `IngestApiClient`. Requires `aiohttp`.
+
+    See: https://docs.amberflo.io/reference/post_ingest
+    """
+
+    path = "/ingest"
+
+    def __init__(self, api_key, max_connections=4):
+        """
+        Initialize the API client session.
+
+        max_connections:
+            Maximum number of simultaneous connections to the ingest API.
+        """
+        self.client = AsyncIngestSession(api_key, max_connections=max_connections)
+
+    async def send(self, payload):
+        """
+        Send one or many meter events.
+
+        Create a payload using the `create_ingest_payload` function.
+
+        See: https://docs.amberflo.io/reference/post_ingest
+        """
+        return await self.client.post(self.path + "/", payload)
+
+    async def send_custom(self, payload):
+        """
+        Send one or many meter event.
+
+        The payload format can be arbitrary. Events will be parsed using custom schemas defined for the account.
+        """
+        return await self.client.post(self.path + "?schemaDetection=AUTO", payload)
+
+    async def close(self):
+        """
+        Close the underlying HTTP session.
+        """
+        await self.client.close()
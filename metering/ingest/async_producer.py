@@ -0,0 +1,278 @@
+import asyncio
+import logging
+
+import backoff
+
+from metering.ingest.api_client import create_ingest_payload
+from metering.ingest.async_api_client import AsyncIngestApiClient
+from metering.ingest.consumer import backoff_delay, _should_give_up
+
+_nothing = object()
+
+
+class AsyncProducer:
+    """
+    This is the `asyncio` counterpart of `ThreadedProducer`. Items are batched
+    by tasks running on the event loop and handed to a backend implementing
+    the coroutines `send(batch)` and `send_custom(batch)`, so no threads are
+    involved.
+
+    The producer must be used from within a running event loop. Its background
+    tasks are started on first use.
+    """
+
+    def __init__(
+        self,
+        backend_params,
+        backend_class=AsyncIngestApiClient,
+        max_queue_size=100000,
+        max_in_flight=4,
+        retries=6,
+        batch_size=100,
+        send_interval_in_secs=0.5,
+        on_error=None,
+        backoff_delay=backoff_delay,
+    ):
+        """
+        backend_class:
+            Class that implements the work to be perfomed, i.e. the coroutines
+            `send(batch)` and `send_custom(batch)`, and optionally `close()`.
+            The default backend is the `AsyncIngestApiClient`.
+
+        backend_params:
+            Parameters for instantiating the backend. For the default backend,
+            this is:
+                {"api_key": <api-key>}
+
+        max_queue_size:
+            Maximum number of items that each queue will hold. If the queue is
+            full, `send` rejects new items, while `send_wait` waits for room.
+
+        max_in_flight:
+            Maximum number of batches being sent at the same time.
+
+        retries, batch_size, send_interval_in_secs, on_error, backoff_delay:
+            Same as for `metering.ingest.consumer.ThreadedConsumer`.
+        """
+        self.backend_params = backend_params
+        self.backend_class = backend_class
+        self.max_queue_size = max_queue_size
+        self.max_in_flight = max_in_flight
+        self.retries = retries
+        self.batch_size = batch_size
+        self.send_interval = send_interval_in_secs
+        self.on_error = on_error
+        self.backoff_delay = backoff_delay
+        self.logger = logging.getLogger(__name__)
+
+        # These are bound to the event loop, so they are created on first use.
+        self.queue = None
+        self.custom_queue = None
+        self.in_flight = None
+        self.backend = None
+        self.tasks = []
+        self.pending = set()
+
+    def _start(self):
+        if self.tasks:
+            return
+
+        if self.queue is None:
+            self.queue = asyncio.Queue(self.max_queue_size)
+            self.custom_queue = asyncio.Queue(self.max_queue_size)
+            self.in_flight = asyncio.Semaphore(self.max_in_flight)
+
+        if self.backend is None:
+            self.backend = self.backend_class(**self.backend_params)
+
+        self.tasks = [
+            asyncio.ensure_future(self._run(self.queue, is_custom=False)),
+            asyncio.ensure_future(self._run(self.custom_queue, is_custom=True)),
+        ]
+
+    def send(self, payload):
+        """
+        Enqueue a payload to be sent. Returns whether it was successful or not.
+
+        See `metering.ingest.IngestApiClient.send` for details on the payload.
+        """
+        self._start()
+        try:
+            self.queue.put_nowait(payload)
+            return True
+        except asyncio.QueueFull:
+            self.logger.warning("Queue is full!")
+
+        return False
+
+    def send_custom(self, payload):
+        """
+        Enqueue a custom payload to be sent. Returns whether it was successful or not.
+        """
+        self._start()
+        try:
+            self.custom_queue.put_nowait(payload)
+            return True
+        except asyncio.QueueFull:
+            self.logger.warning("Custom queue is full!")
+
+        return False
+
+    def meter(self, *args, **kwargs):
+        """
+        Build and enqueue a meter record to be sent. Returns whether it was
+        successful or not.
+
+        See `metering.ingest.create_ingest_payload` for details on the payload.
+        """
+        payload = create_ingest_payload(*args, **kwargs)
+        return self.send(payload)
+
+    async def send_wait(self, payload, timeout=None):
+        """
+        Enqueue a payload to be sent, waiting for room in the queue if it is
+        full. Returns whether it was successful or not (i.e. timed out).
+        """
+        self._start()
+        return await self._put(self.queue, payload, timeout)
+
+    async def send_custom_wait(self, payload, timeout=None):
+        """
+        Enqueue a custom payload to be sent, waiting for room in the queue if it
+        is full. Returns whether it was successful or not (i.e. timed out).
+        """
+        self._start()
+        return await self._put(self.custom_queue, payload, timeout)
+
+    async def meter_wait(self, *args, timeout=None, **kwargs):
+        """
+        Build and enqueue a meter record to be sent, waiting for room in the
+        queue if it is full. Returns whether it was successful or not.
+
+        See `metering.ingest.create_ingest_payload` for details on the payload.
+        """
+        payload = create_ingest_payload(*args, **kwargs)
+        return await self.send_wait(payload, timeout=timeout)
+
+    async def _put(self, queue, payload, timeout):
+        try:
+            await asyncio.wait_for(queue.put(payload), timeout)
+            return True
+        except asyncio.TimeoutError:
+            self.logger.warning("Timed out waiting for room in the queue!")
+
+        return False
+
+    async def flush(self):
+        """
+        Waits until all messages in the queue are consumed.
+        """
+        if self.queue is None:
+            return
+
+        await self.queue.join()
+        await self.custom_queue.join()
+
+    async def join(self):
+        """
+        Ends the background tasks cleanly, without trying to empty the queue
+        first. Batches already being sent are allowed to finish.
+        """
+        for task in self.tasks:
+            task.cancel()
+
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        await asyncio.gather(*self.pending, return_exceptions=True)
+        self.tasks = []
+
+    async def shutdown(self):
+        """
+        Wait until all items are consumed, then end the background tasks
+        cleanly and close the backend.
+        """
+        await self.flush()
+        await self.join()
+
+        if self.backend is not None and hasattr(self.backend, "close"):
+            await self.backend.close()
+
+    async def _run(self, queue, is_custom):
+        while True:
+            batch = await self._next_batch(queue)
+            await self.in_flight.acquire()
+            task = asyncio.ensure_future(self._consume(queue, batch, is_custom))
+            self.pending.add(task)
+            task.add_done_callback(self.pending.discard)
+
+    async def _next_batch(self, queue):
+        """
+        Waits for the first item, then keeps collecting items until either the
+        batch is complete or the send interval has elapsed.
+        """
+        batch = [await queue.get()]
+
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + self.send_interval
+
+        while len(batch) < self.batch_size:
+            if not queue.empty():
+                batch.append(queue.get_nowait())
+                continue
+
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+
+            item = await self._get(queue, timeout)
+            if item is _nothing:
+                break
+            batch.append(item)
+
+        return batch
+
+    async def _get(self, queue, timeout):
+        """
+        Like `asyncio.wait_for(queue.get(), timeout)`, but never loses an item
+        that arrives just as the timeout expires.
+        """
+        getter = asyncio.ensure_future(queue.get())
+        try:
+            await asyncio.wait({getter}, timeout=timeout)
+        finally:
+            if not getter.done():
+                getter.cancel()
+
+        try:
+            return await getter
+        except asyncio.CancelledError:
+            return _nothing
+
+    async def _consume(self, queue, batch, is_custom):
+        try:
+            await self._send(batch, is_custom)
+            self.logger.debug("Sent batch of %s", len(batch))
+        except Exception as e:
+            self.logger.exception("Failed to send batch of %s: %s", len(batch), e)
+            if self.on_error:
+                self.on_error(e, batch)
+        finally:
+            for _ in batch:
+                queue.task_done()
+            self.in_flight.release()
+
+    async def _send(self, batch, is_custom):
+        """
+        Try sending with back-off strategy.
+        """
+        send = self.backend.send_custom if is_custom else self.backend.send
+
+        @backoff.on_exception(
+            self.backoff_delay,
+            Exception,
+            max_tries=self.retries + 1,
+            giveup=_should_give_up,
+        )
+        async def send_batch():
+            await send(batch)
+
+        await send_batch()
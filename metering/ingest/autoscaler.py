@@ -0,0 +1,71 @@
+from metering import validators
+
+
+class Autoscaler:
+    """
+    Decides when a `metering.ingest.ThreadedProducer` should start or stop
+    consumer threads, between its initial number of `threads` and
+    `max_threads`:
+
+    - When the queues hold at least `queue_depth` items, or their oldest item
+      has been waiting for at least `queue_age_in_secs`, one more consumer is
+      started.
+    - When a consumer has not sent anything for `idle_in_secs`, it is
+      stopped.
+
+    The decision is made every `interval_in_secs`, and only one consumer is
+    started or stopped at a time. For example:
+
+        create_ingest_client(api_key=..., threads=1, autoscaler=Autoscaler(8))
+    """
+
+    def __init__(
+        self,
+        max_threads=8,
+        queue_depth=1000,
+        queue_age_in_secs=2,
+        idle_in_secs=60,
+        interval_in_secs=1,
+    ):
+        validators.require_positive_int("max_threads", max_threads, allow_none=False)
+        validators.require_positive_int("queue_depth", queue_depth, allow_none=False)
+        validators.require_positive_number(
+            "queue_age_in_secs", queue_age_in_secs, allow_none=False
+        )
+        validators.require_positive_number(
+            "idle_in_secs", idle_in_secs, allow_none=False
+        )
+        validators.require_positive_number(
+            "interval_in_secs", interval_in_secs, allow_none=False
+        )
+
+        self.max_threads = max_threads
+        self.queue_depth = queue_depth
+        self.queue_age = queue_age_in_secs
+        self.idle = idle_in_secs
+        self.interval = interval_in_secs
+
+    def decide(self, threads, min_threads, queue_depth, queue_age, idle):
+        """
+        Returns +1 to start a consumer, -1 to stop the most idle one, or 0.
+
+        threads, min_threads:
+            Current and minimum number of consumers.
+
+        queue_depth, queue_age:
+            Number of items in the queues, and how long (in seconds) the
+            oldest one has been waiting.
+
+        idle:
+            How long (in seconds) the most idle consumer has not sent
+            anything.
+        """
+        backlog = queue_depth >= self.queue_depth or queue_age >= self.queue_age
+
+        if backlog and threads < self.max_threads:
+            return 1
+
+        if not backlog and idle >= self.idle and threads > min_threads:
+            return -1
+
+        return 0
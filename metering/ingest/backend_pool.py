@@ -0,0 +1,51 @@
+from threading import Lock
+
+
+class BackendPool:
+    """
+    Pool of backend instances (e.g. `metering.ingest.IngestApiClient`), so
+    that consumer threads started later reuse the instances (and thus the
+    connections) of the ones that stopped, instead of creating new ones.
+
+    Each instance is used by a single consumer at a time. The number of idle
+    instances is available as `len(...)`, and the number of instances created
+    so far as `created`. This class is thread-safe.
+    """
+
+    def __init__(self, backend_class, backend_params, max_idle=None):
+        """
+        backend_class, backend_params:
+            How to create a new instance, as `backend_class(**backend_params)`.
+
+        max_idle:
+            Optional. Maximum number of idle instances to keep. Instances
+            released beyond that are discarded.
+        """
+        self.backend_class = backend_class
+        self.backend_params = backend_params
+        self.max_idle = max_idle
+        self.idle = []
+        self.created = 0
+        self.lock = Lock()
+
+    def __len__(self):
+        return len(self.idle)
+
+    def acquire(self):
+        """
+        Returns an idle instance, or a new one if there is none.
+        """
+        with self.lock:
+            if self.idle:
+                return self.idle.pop()
+            self.created += 1
+
+        return self.backend_class(**self.backend_params)
+
+    def release(self, backend):
+        """
+        Returns an instance to the pool, once its consumer has stopped.
+        """
+        with self.lock:
+            if self.max_idle is None or len(self.idle) < self.max_idle:
+                self.idle.append(backend)
@@ -0,0 +1,131 @@
+from threading import Lock
+
+from metering.exceptions import ApiError
+
+
+class AdaptiveBatchController:
+    """
+    Tunes the batch size and the send interval (i.e. how long to linger for
+    an incomplete batch) of the consumers, based on what they observe, using
+    additive-increase/multiplicative-decrease:
+
+    - A full batch sent faster than the target latency grows the batch size
+      by `batch_size_step`.
+    - A request slower than the target latency shrinks the batch size by
+      `decrease_factor`.
+    - Being rate limited (429) doubles the send interval, so fewer requests
+      are made.
+    - A queue backlog of at least one batch halves the send interval, since
+      there is no point in waiting for more items; otherwise it slowly
+      recovers towards its initial value.
+
+    The same instance should be shared by all consumers of a producer, for
+    example:
+
+        create_ingest_client(api_key=..., batch_controller=AdaptiveBatchController())
+
+    The current settings are available through `settings()`. This class is
+    thread-safe.
+    """
+
+    def __init__(
+        self,
+        batch_size=100,
+        min_batch_size=10,
+        max_batch_size=1000,
+        batch_size_step=10,
+        send_interval_in_secs=0.5,
+        min_send_interval_in_secs=0.05,
+        max_send_interval_in_secs=5.0,
+        target_latency_in_secs=1.0,
+        decrease_factor=0.5,
+    ):
+        """
+        batch_size, send_interval_in_secs:
+            Initial values, which are also the values the send interval
+            recovers to.
+
+        min_batch_size, max_batch_size, min_send_interval_in_secs,
+        max_send_interval_in_secs:
+            The bounds of the adjustments.
+
+        batch_size_step:
+            Additive increase of the batch size.
+
+        target_latency_in_secs:
+            Requests that take longer than this shrink the batch size.
+
+        decrease_factor:
+            Multiplicative decrease of the batch size.
+        """
+        self.batch_size = batch_size
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.batch_size_step = batch_size_step
+        self.send_interval = send_interval_in_secs
+        self.base_send_interval = send_interval_in_secs
+        self.min_send_interval = min_send_interval_in_secs
+        self.max_send_interval = max_send_interval_in_secs
+        self.target_latency = target_latency_in_secs
+        self.decrease_factor = decrease_factor
+        self.last_latency = None
+        self.throttled = 0
+        self.lock = Lock()
+
+    def settings(self):
+        """
+        Returns the current settings, for observability.
+        """
+        with self.lock:
+            return {
+                "batch_size": self.batch_size,
+                "send_interval_in_secs": self.send_interval,
+                "last_latency_in_secs": self.last_latency,
+                "throttled": self.throttled,
+            }
+
+    def record(self, batch_size, latency, queue_depth, error=None):
+        """
+        Record the outcome of a request.
+
+        batch_size:
+            Number of items sent.
+
+        latency:
+            Round-trip time of the request, in seconds.
+
+        queue_depth:
+            Number of items still waiting in the queue.
+
+        error:
+            The exception raised by the request, if any.
+        """
+        with self.lock:
+            self.last_latency = latency
+
+            if isinstance(error, ApiError) and error.status_code == 429:
+                self.throttled += 1
+                self.send_interval = min(self.max_send_interval, self.send_interval * 2)
+                return
+
+            self._adjust_batch_size(batch_size, latency, error)
+            self._adjust_send_interval(queue_depth)
+
+    def _adjust_batch_size(self, batch_size, latency, error):
+        if latency > self.target_latency:
+            size = int(self.batch_size * self.decrease_factor)
+            self.batch_size = max(self.min_batch_size, size)
+        elif error is None and batch_size >= self.batch_size:
+            size = self.batch_size + self.batch_size_step
+            self.batch_size = min(self.max_batch_size, size)
+
+    def _adjust_send_interval(self, queue_depth):
+        if queue_depth >= self.batch_size:
+            interval = self.send_interval / 2
+            self.send_interval = max(self.min_send_interval, interval)
+        elif self.send_interval < self.base_send_interval:
+            interval = self.send_interval + self.min_send_interval
+            self.send_interval = min(self.base_send_interval, interval)
+        elif self.send_interval > self.base_send_interval:
+            interval = self.send_interval * 0.9
+            self.send_interval = max(self.base_send_interval, interval)
@@ -0,0 +1,281 @@
+import time
+from collections import deque
+from queue import Full, Queue
+from threading import local
+
+
+def _time_left(deadline):
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def _full(evicted):
+    """
+    Returns a `queue.Full` error, with the items removed from the queue
+    before giving up (see `BatchQueue.put_evicting`).
+    """
+    error = Full()
+    error.evicted = evicted
+    return error
+
+
+class BatchQueue(Queue):
+    """
+    A `queue.Queue` that can also enqueue many items at once, acquiring its
+    lock (and notifying the consumers) only once for all of them.
+
+    Optionally, it rings a `metering.ingest.doorbell.Doorbell` (which may be
+    shared with other queues) whenever items are enqueued.
+
+    Optionally, it also bounds the bytes taken by its items with a
+    `metering.ingest.memory_budget.MemoryBudget` (which may be shared with
+    other queues). The bytes taken by the items of this queue are available
+    as `bytes`.
+
+    It also keeps track of when each item was enqueued: after a `get`, the
+    time (from `time.monotonic()`) the item was enqueued is available to the
+    same thread as `last_enqueued_at`.
+    """
+
+    def __init__(self, maxsize=0, doorbell=None, budget=None):
+        super().__init__(maxsize)
+        self.doorbell = doorbell
+        self.budget = budget
+        self.local = local()
+
+    @property
+    def last_enqueued_at(self):
+        return getattr(self.local, "enqueued_at", None)
+
+    def age(self):
+        """
+        Returns how long (in seconds) the oldest item has been waiting, or 0
+        if the queue is empty.
+        """
+        with self.mutex:
+            if not self.enqueued_at:
+                return 0
+            return time.monotonic() - self.enqueued_at[0]
+
+    def _init(self, maxsize):
+        super()._init(maxsize)
+        self.enqueued_at = deque()
+        self.sizes = deque()
+        self.bytes = 0
+
+    # The following methods are where the items are stored (see
+    # `FairBatchQueue` for another layout). They are called with the mutex
+    # held, except for `_key`.
+
+    def _key(self, item, key):
+        """
+        Returns the key of the item. Only used by `FairBatchQueue`.
+        """
+        return None
+
+    def _has_room(self, key, n=1):
+        """
+        Returns whether `n` more items of the key fit (besides `maxsize`).
+        """
+        return True
+
+    def _put_entry(self, key, item, size):
+        super()._put(item)
+        self.enqueued_at.append(time.monotonic())
+        self.sizes.append(size)
+        self.bytes += size
+
+    def _put(self, item):
+        self._put_entry(self._key(item, None), item, 0)
+
+    def _get(self):
+        self.local.enqueued_at = self.enqueued_at.popleft()
+        self._release(self.sizes.popleft())
+        return super()._get()
+
+    def _evict(self, key):
+        """
+        Removes and returns an item to make room for an item of the key.
+        """
+        return self._get()
+
+    def _measure(self, item):
+        if self.budget is None:
+            return 0
+        return self.budget.measure(item)
+
+    def _reserve(self, size):
+        return self.budget is None or self.budget.reserve(size)
+
+    def _release(self, size):
+        if size:
+            self.bytes -= size
+            self.budget.release(size)
+
+    def put(self, item, block=True, timeout=None, key=None):
+        """
+        See `queue.Queue.put`. With a budget, it may also block until there
+        are enough bytes left for the item.
+
+        key:
+            Only used by `FairBatchQueue`.
+        """
+        key = self._key(item, key)
+        size = self._measure(item)
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while not self._try_put(item, key, size, block, deadline):
+            # Over budget, wait for items to be taken out (of any queue).
+            if not block or not self.budget.wait(size, _time_left(deadline)):
+                raise Full
+
+        if self.doorbell is not None:
+            self.doorbell.ring()
+
+    def _try_put(self, item, key, size, block, deadline):
+        """
+        Enqueue the item, waiting for room (in items) if `block`. Returns
+        false if there are not enough bytes left in the budget.
+        """
+        with self.not_full:
+            if not self._has_room(key):
+                raise Full
+
+            while self.maxsize > 0 and self._qsize() >= self.maxsize:
+                remaining = _time_left(deadline)
+                if not block or (remaining is not None and remaining <= 0):
+                    raise Full
+                self.not_full.wait(remaining)
+
+            if not self._reserve(size):
+                return False
+
+            self._put_entry(key, item, size)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+        return True
+
+    def join(self, timeout=None):
+        """
+        Blocks until all items have been processed (see `queue.Queue.join`),
+        or until the timeout (in seconds) expires. Returns whether all items
+        have been processed.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        with self.all_tasks_done:
+            while self.unfinished_tasks:
+                if deadline is None:
+                    self.all_tasks_done.wait()
+                    continue
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.all_tasks_done.wait(remaining)
+
+        return True
+
+    def put_evicting(self, item, key=None):
+        """
+        Enqueue the item without blocking, removing the oldest items in the
+        queue to make room for it, if needed. Returns the removed items.
+
+        Raises `queue.Full` if there is no room even after removing all of
+        them (i.e. the budget is taken by other queues). Items are only
+        removed in vain if other queues take the bytes in the meantime, in
+        which case they are the `evicted` attribute of the exception.
+
+        key:
+            Only used by `FairBatchQueue`.
+        """
+        key = self._key(item, key)
+        size = self._measure(item)
+        evicted = []
+
+        if self.budget is not None and size > self.budget.max_bytes:
+            raise _full(evicted)
+
+        with self.not_full:
+            if self.budget is not None:
+                # Even removing all the items would not free enough bytes.
+                if size > self.budget.max_bytes - self.budget.used + self.bytes:
+                    raise _full(evicted)
+
+            full = self.maxsize > 0 and self._qsize() >= self.maxsize
+            if full or not self._has_room(key):
+                evicted.append(self._evict(key))
+
+            while not self._reserve(size):
+                if not self._qsize():
+                    self.unfinished_tasks -= len(evicted)
+                    if not self.unfinished_tasks:
+                        self.all_tasks_done.notify_all()
+                    raise _full(evicted)
+                evicted.append(self._evict(key))
+
+            self._put_entry(key, item, size)
+            # The removed items are replaced, so they are never `task_done`.
+            self.unfinished_tasks += 1 - len(evicted)
+            self.not_empty.notify()
+
+        if self.doorbell is not None:
+            self.doorbell.ring()
+
+        return evicted
+
+    def put_many(self, items, all_or_nothing=False, keys=None):
+        """
+        Enqueue as many of the items as there is room for, without blocking.
+        Returns the number of items enqueued (the first ones, unless there
+        are per-key quotas or a budget).
+
+        all_or_nothing:
+            If true, enqueue either all the items, or none of them.
+
+        keys:
+            Only used by `FairBatchQueue`.
+        """
+        items = list(items)
+        keys = keys or [None] * len(items)
+        entries = [
+            (self._key(item, key), item, self._measure(item))
+            for key, item in zip(keys, items)
+        ]
+
+        with self.not_full:
+            room = self.maxsize - self._qsize() if self.maxsize > 0 else len(items)
+            added = {}
+            accepted = []
+
+            for key, item, size in entries:
+                fits = (
+                    len(accepted) < room
+                    and self._has_room(key, added.get(key, 0) + 1)
+                    and self._reserve(size)
+                )
+
+                if not fits:
+                    if all_or_nothing:
+                        reserved = sum(entry[2] for entry in accepted)
+                        if reserved:
+                            self.budget.release(reserved)
+                        return 0
+                    continue
+
+                added[key] = added.get(key, 0) + 1
+                accepted.append((key, item, size))
+
+            for key, item, size in accepted:
+                self._put_entry(key, item, size)
+
+            if accepted:
+                self.unfinished_tasks += len(accepted)
+                self.not_empty.notify(len(accepted))
+
+        if accepted and self.doorbell is not None:
+            self.doorbell.ring()
+
+        return len(accepted)
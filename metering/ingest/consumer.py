@@ -3,11 +3,14 @@ import backoff
 import logging
 import random
 import string
-from queue import Empty
+from queue import Empty, Queue
 from time import sleep
 from threading import Thread
 
+from metering import codec
 from metering.exceptions import ApiError
+from metering.ingest.delivery_tracker import SPOOLED
+from metering.ingest.pending_batch import PendingBatch
 
 
 def _random_string(n=5):
@@ -28,6 +31,17 @@ def _should_give_up(error):
     return False
 
 
+def _shared_doorbell(queue, custom_queue):
+    doorbell = getattr(queue, "doorbell", None)
+    if doorbell is not None and doorbell is getattr(custom_queue, "doorbell", None):
+        return doorbell
+    return None
+
+
+# Number of bad records a failed batch is bisected for, at most (see
+# `ThreadedConsumer._bisect`).
+_bisect_bad_records = 4
+
 # Sequence of times to wait between requests.
 _backoff_delays = [None, 2, 6, 12, 20, 40, 80]
 
@@ -61,6 +75,17 @@ class ThreadedConsumer:
         sleep_interval_in_secs=0.1,
         on_error=None,
         backoff_delay=backoff_delay,
+        spool=None,
+        replay_interval_in_secs=5,
+        batch_target_bytes=None,
+        batch_max_bytes=None,
+        batch_controller=None,
+        pipeline_depth=0,
+        retry_scheduler=None,
+        rate_limiter=None,
+        metrics=None,
+        bisect_failed_batches=False,
+        delivery_tracker=None,
     ):
         """
         backend:
@@ -70,6 +95,11 @@ class ThreadedConsumer:
         queue:
             Queue from which to consume new items.
 
+            If both queues are `metering.ingest.batch_queue.BatchQueue`
+            instances sharing a `metering.ingest.doorbell.Doorbell`, the
+            consumer collects batches from both at once and sleeps until new
+            items arrive (or a batch is due), instead of polling them in turns.
+
         retries:
             Number of additional attempts to consume a batch to perform, using
             exponential back-off.  Items in a failed batch are lost.
@@ -77,6 +107,29 @@ class ThreadedConsumer:
         batch_size:
             Maximum number of items to inclued in a single batch.
 
+        batch_target_bytes:
+            Optional. Stop adding items to a batch once its serialized (JSON)
+            size reaches this many bytes.
+
+        batch_max_bytes:
+            Optional. Hard limit on the serialized size of a batch. An item
+            that would take the batch over the limit is kept for the next
+            batch. An item that is larger than the limit on its own is never
+            sent; it is handed to `on_error` instead.
+
+        batch_controller:
+            Optional `metering.ingest.batch_controller.AdaptiveBatchController`
+            instance (usually shared by all consumers). When given, it decides
+            the batch size and send interval, instead of `batch_size` and
+            `send_interval_in_secs`.
+
+        pipeline_depth:
+            When greater than zero, sending happens in a separate thread, so
+            that the next batch is collected and encoded while the previous
+            one is being sent. This is the number of encoded batches that may
+            be waiting to be sent; when it is reached, collecting more
+            batches waits for the sender.
+
         send_interval_in_secs:
             How long to wait for new items before sending an incomplete batch.
 
@@ -97,18 +150,83 @@ class ThreadedConsumer:
             Note that we use "full jitter" on these values, so on average the
             wait time will be half of the nominal one.
             (see https://github.com/litl/backoff#jitter)
+
+        spool:
+            Optional `metering.ingest.spool.DiskSpool` instance (usually shared
+            by all consumers). Batches that still fail after all retries with
+            a retriable error are stored there instead of being handed to
+            `on_error`, and are replayed in the background once the backend
+            recovers.
+
+        replay_interval_in_secs:
+            How long to wait before trying to replay spooled batches again,
+            after a replay attempt fails.
+
+        retry_scheduler:
+            Optional `metering.ingest.retry_scheduler.RetryScheduler` instance
+            (usually shared by all consumers). When given, a failed batch does
+            not block the consumer while it waits for the next attempt;
+            instead, it is scheduled there and retried once due, while the
+            consumer keeps sending fresh batches.
+
+        rate_limiter:
+            Optional `metering.ingest.rate_limiter.RateLimiter` instance
+            (usually shared by all consumers, possibly of several producers).
+            When given, every request waits for its permission, so that
+            throttling and outages pause all consumers at once.
+
+        metrics:
+            Optional `metering.ingest.metrics.ProducerMetrics` instance, to
+            record what happens to the batches.
+
+        bisect_failed_batches:
+            When true, a batch rejected with a client error (400s, other than
+            429), e.g. because of a malformed record, is split in halves that
+            are sent separately, and the failing halves are split again, so
+            that only the bad records are handed to `on_error`, while the rest
+            are sent. This takes a number of extra requests logarithmic in
+            the batch size.
+
+        delivery_tracker:
+            Optional `metering.ingest.delivery_tracker.DeliveryTracker`
+            instance (usually shared by all consumers), whose futures are
+            resolved as the items are sent, spooled or given up on.
         """
         self.queue = queue
         self.custom_queue = custom_queue
+        self.doorbell = _shared_doorbell(queue, custom_queue)
         self.backend = backend
         self.retries = retries
         self.batch_size = batch_size
+        self.batch_target_bytes = batch_target_bytes
+        self.batch_max_bytes = batch_max_bytes
+        self.measure_batches = bool(batch_target_bytes or batch_max_bytes)
+        self.carried_over = {}
+        self.batch_controller = batch_controller
         self.send_interval = send_interval_in_secs
         self.sleep_interval = sleep_interval_in_secs
         self.on_error = on_error
         self.backoff_delay = backoff_delay
+        self.spool = spool
+        self.replay_interval = replay_interval_in_secs
+        self.next_replay_time = 0
+        self.retry_scheduler = retry_scheduler
+        self.rate_limiter = rate_limiter
+        self.metrics = metrics
+        self.bisect_failed_batches = bisect_failed_batches
+        self.delivery_tracker = delivery_tracker
+        self.hurried = False
+        self.deadline = None
+        self.last_active = time.monotonic()
         self.name = _random_string()
         self.thread = Thread(target=self._run, daemon=True, name=self.name)
+        self.outbox = None
+
+        if pipeline_depth > 0:
+            self.outbox = Queue(pipeline_depth)
+            self.sender = Thread(
+                target=self._run_sender, daemon=True, name=self.name + "-sender"
+            )
         self.logger = logging.getLogger(__name__)
 
     def start(self):
@@ -118,22 +236,170 @@ class ThreadedConsumer:
         self.running = True
         self.thread.start()
 
-    def join(self):
+        if self.outbox is not None:
+            self.sender.start()
+
+    def hurry(self, deadline=None):
+        """
+        Send what is left as fast as possible: without waiting for batches to
+        fill up, and giving up on failed batches at the deadline (a
+        `time.monotonic()` value), if any.
+        """
+        self.deadline = deadline
+        self.hurried = True
+
+        if self.doorbell is not None:
+            # The doorbell is shared, so make sure this consumer wakes up.
+            self.doorbell.ring(everyone=True)
+
+    def relax(self):
+        """
+        Undo `hurry`.
+        """
+        self.hurried = False
+        self.deadline = None
+
+    def join(self, abandon_retries=True):
         """
         Stop the worker thread cleanly, without trying to empty the queue
         first.
+
+        abandon_retries:
+            Whether to give up on the batches waiting in the retry scheduler
+            (if any), since no consumer is going to retry them.
         """
         self.running = False
+
+        if self.doorbell is not None:
+            # The doorbell is shared, so make sure this consumer wakes up.
+            self.doorbell.ring(everyone=True)
+
         self.thread.join()
 
+        if self.outbox is not None and self.sender.is_alive():
+            # Batches already in the pipeline are still sent (and the outbox
+            # is bounded, so the sender is only stopped once).
+            self.outbox.put(None)
+            self.sender.join()
+
+        if self.retry_scheduler is not None and abandon_retries:
+            for work, error in self.retry_scheduler.drain():
+                self._give_up(work, error)
+
     def _run(self):
         self.logger.debug("Consumer is running")
 
+        if self.doorbell is not None:
+            self._run_until_stopped()
+        else:
+            self._poll_until_stopped()
+
+        self._send_carried_over()
+        self.logger.debug("Consumer is finished")
+
+    def _poll_until_stopped(self):
+        """
+        Alternate between the queues, sleeping when there is nothing to do.
+        """
         while self.running:
-            if self.consume() < 1 and self.consume_custom() < 1:
+            idle = self.consume() < 1 and self.consume_custom() < 1
+            idle = self.retry() < 1 and idle
+            if self.replay() < 1 and idle:
                 sleep(self.sleep_interval)
 
-        self.logger.debug("Consumer is finished")
+    def _run_until_stopped(self):
+        """
+        Collect batches from both queues at the same time, sending each one
+        as soon as it is complete or its send interval has elapsed, and
+        otherwise wait for the doorbell.
+        """
+        lanes = ((self.queue, False), (self.custom_queue, True))
+        batches = {}
+
+        while True:
+            seq = self.doorbell.seq
+            sent = [self._step(queue, is_custom, batches) for queue, is_custom in lanes]
+
+            if not self.running:
+                break
+
+            if self.retry() > 0:
+                continue
+
+            if self.replay() < 1 and not any(sent):
+                self.doorbell.wait(seq, self._wait_timeout(batches))
+
+        # Items already taken from the queues are still sent.
+        for queue, is_custom in lanes:
+            batch = batches.pop(is_custom, None)
+            if batch:
+                self._dispatch(queue, batch, is_custom)
+
+    def _send_carried_over(self):
+        """
+        Send the items carried over to the next batch (see `_append`), since
+        they were already taken from the queues.
+        """
+        for queue, is_custom in ((self.queue, False), (self.custom_queue, True)):
+            batch = self._new_batch(queue)
+            if batch:
+                self._dispatch(queue, batch, is_custom)
+
+    def _step(self, queue, is_custom, batches):
+        """
+        Move the available items into the lane's batch, and send it if it is
+        due. Returns whether it was sent.
+        """
+        batch_size, send_interval = self._batch_limits()
+        batch = batches.get(is_custom) or self._new_batch(queue)
+
+        self._fill(queue, batch, batch_size)
+
+        if not self._is_due(batch, batch_size, send_interval):
+            batches[is_custom] = batch
+            return False
+
+        batches.pop(is_custom, None)
+        self._dispatch(queue, batch, is_custom)
+        return True
+
+    def _is_due(self, batch, batch_size, send_interval):
+        if not batch:
+            return False
+
+        return (
+            batch.closed
+            or len(batch) >= batch_size
+            or self._is_full(batch.size)
+            or batch.age(time.monotonic()) >= send_interval
+        )
+
+    def _wait_timeout(self, batches):
+        """
+        How long to wait for new items before something else needs to be done.
+        """
+        now = time.monotonic()
+        _, send_interval = self._batch_limits()
+        deadlines = [send_interval - b.age(now) for b in batches.values() if b]
+
+        if self.spool is not None:
+            deadlines.append(
+                max(0, self.next_replay_time - now) or self.replay_interval
+            )
+
+        if self.retry_scheduler is not None:
+            due = self.retry_scheduler.next_due()
+            if due is not None:
+                deadlines.append(due - now)
+
+        return max(0, min(deadlines)) if deadlines else None
+
+    def _run_sender(self):
+        while True:
+            work = self.outbox.get()
+            if work is None:
+                break
+            self._deliver(*work)
 
     def consume(self):
         """
@@ -170,74 +436,535 @@ class ThreadedConsumer:
             self.logger.debug("Empty batch, nothing to do")
             return 0
 
+        return self._dispatch(queue, batch, is_custom)
+
+    def _dispatch(self, queue, batch, is_custom):
+        """
+        Encode the batch (a `PendingBatch`), then send it or hand it to the
+        sender thread.
+        """
+        self.last_active = time.monotonic()
+        self._observe("batch_size", len(batch))
+        data = self._encode(batch.fragments or batch.items)
+        work = (queue, batch.items, is_custom, data, batch.enqueued_at)
+
+        if self.outbox is not None:
+            self.outbox.put(work)
+            return len(batch)
+
+        return self._deliver(*work)
+
+    def _encode(self, batch):
+        """
+        Encodes the batch once, if the backend supports it, so that the same
+        request body is reused by all attempts to send it.
+
+        The batch may be made of `metering.codec.Fragment` items, which the
+        backends join without serializing them again.
+        """
+        if not hasattr(self.backend, "encode"):
+            return None
+
+        try:
+            start_time = time.monotonic()
+
+            if not hasattr(self.backend, "compress"):
+                data = self.backend.encode(batch)
+                self._observe("encode_seconds", time.monotonic() - start_time)
+                return data
+
+            data = codec.encode(batch)
+            encoded_time = time.monotonic()
+            data = self.backend.compress(data)
+            self._observe("encode_seconds", encoded_time - start_time)
+            self._observe("compress_seconds", time.monotonic() - encoded_time)
+            return data
+        except Exception as e:
+            self.logger.warning("Failed to encode batch of %s: %s", len(batch), e)
+            return None
+
+    def _deliver(self, queue, batch, is_custom, data=None, enqueued_at=None):
+        """
+        Sends the batch (or its encoded form, if given). Returns the number of
+        items sent.  In case of failure, returns the negative of this number.
+        """
+        if self.retry_scheduler is not None:
+            work = (queue, batch, is_custom, data, enqueued_at)
+            return self._deliver_once(work, 0)
+
         n = len(batch)
 
         try:
-            if is_custom:
+            if data is not None:
+                self._send_encoded(data, n, is_custom)
+            elif is_custom:
                 self._send_custom(batch)
             else:
                 self._send(batch)
             self.logger.debug("Sent batch of %s", len(batch))
+            self._sent(batch, is_custom, enqueued_at)
         except Exception as e:
             self.logger.exception("Failed to send batch of %s: %s", len(batch), e)
-            if self.on_error:
-                self.on_error(e, batch)
+            self._handle_failure(e, batch, is_custom)
             n = -n
+        finally:
+            # Sending (with its retries) may take long, and is not idleness.
+            self.last_active = time.monotonic()
+            for item in batch:
+                queue.task_done()
+
+        return n
+
+    def _deliver_once(self, work, attempts):
+        """
+        Makes a single attempt to send the batch, scheduling a retry if it
+        fails and it has attempts left. Returns the number of items sent.  In
+        case of failure, returns the negative of this number.
+        """
+        queue, batch, is_custom, data, enqueued_at = work
+        n = len(batch)
+        attempts += 1
+
+        try:
+            if data is not None:
+                send, payload = self._encoded_sender(is_custom), data
+            else:
+                send, payload = self._sender(is_custom), batch
+            self._attempt(send, payload, n)
+        except Exception as e:
+            self.last_active = time.monotonic()
+            if attempts <= self.retries and not self._should_give_up(e):
+                delay = self._retry_delay(attempts)
+                if self.retry_scheduler.schedule(work, n, attempts, e, delay):
+                    self._count("retries", is_custom)
+                    self.logger.warning(
+                        "Attempt %s to send batch of %s failed (%s), retrying in %.1fs",
+                        attempts,
+                        n,
+                        e,
+                        delay,
+                    )
+                    return -n
+
+            self.logger.error(
+                "Failed to send batch of %s after %s attempts: %s", n, attempts, e
+            )
+            self._give_up(work, e)
+            return -n
+
+        self.last_active = time.monotonic()
+        self.logger.debug("Sent batch of %s after %s attempts", n, attempts)
+        self._sent(batch, is_custom, enqueued_at)
+        for item in batch:
+            queue.task_done()
+
+        return n
+
+    def _retry_delay(self, attempts):
+        """
+        Returns how long to wait after the given number of failed attempts,
+        following `backoff_delay` (with full jitter).
+        """
+        delays = self.backoff_delay()
+        next(delays)  # like `backoff`, skip the initial value
+        for _ in range(attempts - 1):
+            next(delays)
+        delay = backoff.full_jitter(next(delays))
+
+        time_left = self._time_left()
+        return delay if time_left is None else min(delay, time_left)
+
+    def _backoff_delays(self, *args, **kwargs):
+        """
+        The `backoff_delay` sequence, without going past the deadline.
+        """
+        for delay in self.backoff_delay(*args, **kwargs):
+            time_left = self._time_left()
+            if delay is None or time_left is None:
+                yield delay
+            else:
+                yield min(delay, time_left)
+
+    def _should_give_up(self, error):
+        return _should_give_up(error) or self._time_left() == 0
+
+    def _time_left(self):
+        """
+        Returns the seconds left until the deadline, if any.
+        """
+        if self.deadline is None:
+            return None
+        return max(0, self.deadline - time.monotonic())
+
+    def retry(self):
+        """
+        Tries to send the next batch whose retry is due, if any. Returns the
+        number of items sent.  In case of failure, returns the negative of
+        this number.
+        """
+        if self.retry_scheduler is None:
+            return 0
+
+        due = self.retry_scheduler.pop_due()
+        if due is None:
+            return 0
+
+        work, attempts = due
+        return self._deliver_once(work, attempts)
+
+    def _give_up(self, work, error):
+        queue, batch, is_custom = work[:3]
+        try:
+            self._handle_failure(error, batch, is_custom)
         finally:
             for item in batch:
                 queue.task_done()
 
+    def _sent(self, batch, is_custom, enqueued_at):
+        self._count("sent", is_custom, len(batch))
+        if enqueued_at is not None:
+            self._observe("delivery_seconds", time.monotonic() - enqueued_at)
+        self._resolve(batch)
+
+    def _resolve(self, batch, result="sent", error=None):
+        if self.delivery_tracker is not None:
+            self.delivery_tracker.resolve(batch, result, error)
+
+    def _count(self, name, is_custom, n=1):
+        if self.metrics is not None:
+            self.metrics.count(name, is_custom, n)
+
+    def _observe(self, name, value):
+        if self.metrics is not None:
+            self.metrics.observe(name, value)
+
+    def _handle_failure(self, error, batch, is_custom):
+        """
+        Spool the failed batch if possible, otherwise hand it to `on_error`
+        (only its bad records, with `bisect_failed_batches`).
+        """
+        if self.bisect_failed_batches and len(batch) > 1 and _should_give_up(error):
+            self._bisect(error, batch, is_custom)
+        else:
+            self._fail(error, batch, is_custom)
+
+    def _bisect(self, error, batch, is_custom):
+        """
+        Sends the records of a batch that failed with a client error, except
+        for the bad ones, which are handed to `on_error`. The batch is split
+        in halves, the first one is sent and, if it fails too, so is the
+        second one (otherwise the second one holds the bad records); then the
+        failing halves are split again, and so on.
+
+        Each bad record takes at most about 2 * log2(len(batch)) requests.
+        Once enough requests for a few of them have been made, the failing
+        parts left are handed to `on_error` as they are.
+        """
+        send = self._sender(is_custom)
+        requests_left = 2 * len(batch).bit_length() * _bisect_bad_records
+        failed = [(batch, error)]
+
+        while failed:
+            part, error = failed.pop()
+
+            if (
+                len(part) == 1
+                or requests_left < 1
+                or not _should_give_up(error)
+                or self._time_left() == 0
+            ):
+                self._fail(error, part, is_custom)
+                continue
+
+            middle = len(part) // 2
+            first, second = part[:middle], part[middle:]
+
+            requests_left -= 1
+            first_error = self._try_send(send, first, is_custom)
+            if first_error is None:
+                failed.append((second, error))
+                continue
+
+            failed.append((first, first_error))
+
+            requests_left -= 1
+            second_error = self._try_send(send, second, is_custom)
+            if second_error is not None:
+                failed.append((second, second_error))
+
+    def _try_send(self, send, batch, is_custom):
+        """
+        Makes a single attempt to send the batch. Returns the error, if any.
+        """
+        try:
+            self._attempt(send, batch, len(batch))
+        except Exception as e:
+            return e
+
+        self._sent(batch, is_custom, None)
+        return None
+
+    def _fail(self, error, batch, is_custom):
+        """
+        Spool the failed batch if possible, otherwise hand it to `on_error`.
+        """
+        if self.spool is not None and not _should_give_up(error):
+            try:
+                if self.spool.append(batch, is_custom):
+                    self.logger.warning("Spooled batch of %s", len(batch))
+                    self._count("spooled", is_custom, len(batch))
+                    self._resolve(batch, SPOOLED)
+                    return
+            except Exception as e:
+                self.logger.exception("Failed to spool batch: %s", e)
+
+        self._count("failed", is_custom, len(batch))
+        self._resolve(batch, error=error)
+
+        if self.on_error:
+            self.on_error(error, batch)
+
+    def replay(self):
+        """
+        Tries to send the oldest spooled batch, if any. Returns the number of
+        items sent.  In case of failure, returns the negative of this number.
+        """
+        if self.spool is None or time.monotonic() < self.next_replay_time:
+            return 0
+
+        if not self.spool.replay_lock.acquire(blocking=False):
+            return 0  # another consumer is replaying
+
+        try:
+            return self._replay()
+        finally:
+            self.spool.replay_lock.release()
+
+    def _replay(self):
+        entry = self.spool.peek()
+
+        if entry is None:
+            return 0
+
+        position, batch, is_custom = entry
+        n = len(batch)
+
+        try:
+            self._attempt(self._sender(is_custom), batch, n)
+            self.logger.debug("Replayed spooled batch of %s", n)
+            self._count("sent", is_custom, n)
+        except Exception as e:
+            self.logger.warning("Failed to replay batch of %s: %s", n, e)
+
+            if not _should_give_up(e):
+                self.next_replay_time = time.monotonic() + self.replay_interval
+                return -n
+
+            # The batch will never be accepted, so drop it.
+            self._handle_failure(e, batch, is_custom)
+            n = -n
+
+        self.spool.ack(position)
         return n
 
     def _next_batch(self, queue):
         """
-        Returns the next batch of items to be consumed.
+        Returns the next batch of items to be consumed (a `PendingBatch`),
+        waiting for new items for up to the send interval.
         """
-        batch = []
+        batch = self._new_batch(queue)
+        batch_size, send_interval = self._batch_limits()
 
-        start_time = time.monotonic()
+        if send_interval > 0:
+            self._fill(queue, batch, batch_size, time.monotonic() + send_interval)
+        else:
+            self._fill(queue, batch, batch_size)
 
-        while len(batch) < self.batch_size:
-            elapsed = time.monotonic() - start_time
-            if elapsed >= self.send_interval:
-                break
+        return batch
 
+    def _new_batch(self, queue):
+        batch = PendingBatch()
+
+        carried_over = self.carried_over.pop(queue, None)
+        if carried_over:
+            batch.add(*carried_over)
+
+        return batch
+
+    def _fill(self, queue, batch, batch_size, deadline=None):
+        """
+        Moves items from the queue into the batch, until it is complete. If a
+        deadline is given, waits for new items until then.
+        """
+        while len(batch) < batch_size and not self._is_full(batch.size):
             try:
-                item = queue.get(block=True, timeout=self.send_interval - elapsed)
-                batch.append(item)
+                item = self._get(queue, deadline)
             except Empty:
-                break
+                return
 
-        return batch
+            enqueued_at = getattr(queue, "last_enqueued_at", None)
 
-    def _send(self, batch):
+            if not self._append(queue, batch, item, enqueued_at):
+                batch.closed = True
+                return
+
+    def _get(self, queue, deadline):
+        if deadline is None:
+            return queue.get(block=False)
+
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            raise Empty
+
+        return queue.get(block=True, timeout=timeout)
+
+    def _append(self, queue, batch, item, enqueued_at=None):
         """
-        Try sending with back-off strategy.
+        Appends the item to the batch, keeping track of its serialized size if
+        necessary. Returns False if the item does not fit in the batch, in
+        which case it is kept for the next batch.
         """
+        if not self.measure_batches:
+            batch.add(item, enqueued_at=enqueued_at)
+            return True
 
-        @backoff.on_exception(
-            self.backoff_delay,
-            Exception,
-            max_tries=self.retries + 1,
-            giveup=_should_give_up,
+        fragment = self._serialize(queue, item)
+        if fragment is None:
+            return True
+
+        if self._is_too_big(batch.size + len(fragment) + 1):
+            if batch:
+                self.carried_over[queue] = (item, fragment, enqueued_at)
+                return False
+            self._reject_oversized(queue, item, len(fragment))
+            return True
+
+        batch.add(item, fragment, enqueued_at)
+        return True
+
+    def _serialize(self, queue, item):
+        """
+        Serializes the item, or rejects it if it is not serializable.
+        """
+        try:
+            return codec.fragment(item)
+        except Exception as e:
+            self._reject(queue, item, e)
+            return None
+
+    def _batch_limits(self):
+        """
+        Returns the current batch size and send interval.
+        """
+        if self.batch_controller is None:
+            batch_size, send_interval = self.batch_size, self.send_interval
+        else:
+            batch_size = self.batch_controller.batch_size
+            send_interval = self.batch_controller.send_interval
+
+        if self.hurried:
+            send_interval = 0
+
+        return batch_size, send_interval
+
+    def _is_full(self, size):
+        return self.batch_target_bytes and size >= self.batch_target_bytes
+
+    def _is_too_big(self, size):
+        return self.batch_max_bytes and size > self.batch_max_bytes
+
+    def _reject_oversized(self, queue, item, item_size):
+        error = ValueError(
+            "Item of {} bytes exceeds batch_max_bytes ({})".format(
+                item_size, self.batch_max_bytes
+            )
         )
-        def send():
-            self.backend.send(batch)
+        self._reject(queue, item, error)
 
-        send()
+    def _reject(self, queue, item, error):
+        """
+        Hands an item that can never be sent to `on_error`.
+        """
+        self.logger.error("Rejected item: %s", error)
+        self._count("failed", queue is self.custom_queue)
+        self._resolve([item], error=error)
+        try:
+            if self.on_error:
+                self.on_error(error, [item])
+        finally:
+            queue.task_done()
+
+    def _send(self, batch):
+        """
+        Try sending with back-off strategy.
+        """
+        self._send_with_backoff(self.backend.send, batch, len(batch))
 
     def _send_custom(self, batch):
         """
         Try sending custom messages with back-off strategy.
         """
+        self._send_with_backoff(self.backend.send_custom, batch, len(batch), True)
+
+    def _send_encoded(self, data, n, is_custom):
+        """
+        Try sending an encoded batch of `n` items with back-off strategy.
+        """
+        self._send_with_backoff(self._encoded_sender(is_custom), data, n, is_custom)
+
+    def _sender(self, is_custom):
+        return self.backend.send_custom if is_custom else self.backend.send
+
+    def _encoded_sender(self, is_custom):
+        if is_custom:
+            return self.backend.send_custom_encoded
+        return self.backend.send_encoded
 
+    def _send_with_backoff(self, send, payload, n, is_custom=False):
         @backoff.on_exception(
-            self.backoff_delay,
+            self._backoff_delays,
             Exception,
             max_tries=self.retries + 1,
-            giveup=_should_give_up,
+            giveup=self._should_give_up,
+            on_backoff=lambda details: self._count("retries", is_custom),
         )
-        def send_custom():
-            self.backend.send_custom(batch)
+        def attempt():
+            self._attempt(send, payload, n)
+
+        attempt()
+
+    def _attempt(self, send, payload, n):
+        """
+        Make a single request (once the rate limiter allows it), reporting its
+        outcome to the rate limiter and the batch controller.
+        """
+        if (
+            self.batch_controller is None
+            and self.rate_limiter is None
+            and self.metrics is None
+        ):
+            return send(payload)
+
+        if self.rate_limiter is not None and not self.rate_limiter.acquire(
+            self._time_left()
+        ):
+            # Past the deadline (see `hurry`), so this is given up on.
+            raise TimeoutError("Deadline reached while waiting to send")
+
+        error = None
+        start_time = time.monotonic()
+        try:
+            return send(payload)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            latency = time.monotonic() - start_time
+            self._observe("request_seconds", latency)
+
+            if self.rate_limiter is not None:
+                self.rate_limiter.record(error)
 
-        send_custom()
+            if self.batch_controller is not None:
+                depth = self.queue.qsize() + self.custom_queue.qsize()
+                self.batch_controller.record(n, latency, depth, error)
@@ -0,0 +1,83 @@
+from concurrent.futures import Future
+from threading import Lock
+
+# Results of the futures of the items that were not sent (yet) but are not
+# lost either.
+SPOOLED = "spooled"  # stored in the spool, to be sent later
+FOLDED = "folded"  # folded into an aggregated record, to be sent later
+
+
+def new_future(on_delivery=None):
+    """
+    Returns a new `concurrent.futures.Future` for the delivery of an item,
+    which calls back `on_delivery` (if given) with itself once resolved. It
+    cannot be cancelled.
+    """
+    future = Future()
+    future.set_running_or_notify_cancel()
+
+    if on_delivery is not None:
+        future.add_done_callback(on_delivery)
+
+    return future
+
+
+class DeliveryTracker:
+    """
+    The futures of the items whose delivery is being tracked (usually shared
+    by a producer and its consumers), keyed by the identity of the items, as
+    enqueued. Each future is resolved once, when what happens to its item is
+    known:
+
+    - with the result "sent", when its batch is sent;
+    - with the result `SPOOLED` or `FOLDED`, when it is stored in the spool
+      or folded into an aggregated record, which are sent later;
+    - with the error, when it is given up on (e.g. its batch failed, or the
+      queue was full).
+
+    Items that are not tracked are ignored, so this is cheap when nothing is
+    tracked. This class is thread-safe.
+    """
+
+    def __init__(self):
+        # id(item) -> list of (item, future), keeping the items alive so
+        # that their ids are not reused while tracked.
+        self.futures = {}
+        self.lock = Lock()
+
+    def __len__(self):
+        with self.lock:
+            return sum(len(entries) for entries in self.futures.values())
+
+    def track(self, item, future):
+        """
+        Resolves the future (see `new_future`) with what happens to the item,
+        which must be tracked before it is enqueued.
+        """
+        with self.lock:
+            self.futures.setdefault(id(item), []).append((item, future))
+
+    def resolve(self, items, result="sent", error=None):
+        """
+        Resolves the futures of the items (if tracked), with the error if
+        given, or else with the result.
+        """
+        if not self.futures:
+            return
+
+        futures = []
+        with self.lock:
+            for item in items:
+                entries = self.futures.get(id(item))
+                if entries is None:
+                    continue
+
+                futures.append(entries.pop(0)[1])
+                if not entries:
+                    del self.futures[id(item)]
+
+        for future in futures:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
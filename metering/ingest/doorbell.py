@@ -0,0 +1,51 @@
+import itertools
+from threading import Condition
+
+
+class Doorbell:
+    """
+    Lets producers wake up the consumers waiting for new items, across any
+    number of queues.
+
+    Consumers read `seq` before checking the queues, and then `wait` with
+    it, so that items enqueued in between are never missed.
+
+    Ringing is cheap when no consumer is waiting: the lock is only taken
+    (and a consumer woken up) when some are.
+    """
+
+    def __init__(self):
+        self.condition = Condition()
+        self.counter = itertools.count(1)
+        self.seq = 0
+        self.waiters = 0
+
+    def ring(self, everyone=False):
+        """
+        Wake up a waiting consumer (or all of them, if `everyone`).
+        """
+        # Each ring sets a new value (taking the next one is atomic), so a
+        # consumer waiting with an older value notices it. It is set before
+        # checking for waiters, who register before checking `seq`.
+        self.seq = next(self.counter)
+
+        if self.waiters:
+            with self.condition:
+                if everyone:
+                    self.condition.notify_all()
+                else:
+                    self.condition.notify()
+
+    def wait(self, seq, timeout=None):
+        """
+        Wait until the doorbell rings after `seq` was read, or until the
+        timeout (in seconds) expires. Returns the current `seq`.
+        """
+        with self.condition:
+            self.waiters += 1
+            try:
+                if self.seq == seq:
+                    self.condition.wait(timeout)
+            finally:
+                self.waiters -= 1
+            return self.seq
@@ -0,0 +1,135 @@
+import time
+from collections import deque
+
+from metering.ingest.batch_queue import BatchQueue
+from metering.ingest.meter_event import MeterEvent
+
+
+def _field(name):
+    def key(item):
+        if isinstance(item, (dict, MeterEvent)):
+            return item.get(name)
+        return None
+
+    return key
+
+
+class FairBatchQueue(BatchQueue):
+    """
+    A `metering.ingest.batch_queue.BatchQueue` that keeps a sub-queue per key
+    (e.g. per customer), and hands out items from them in turns (round-robin,
+    one item per key per turn), so that a key with a large backlog does not
+    delay the items of the others.
+
+    With `max_size_per_key`, each key also has its own quota: once a key
+    holds that many items, its new items are rejected (`queue.Full` is
+    raised, without blocking), while the other keys can still enqueue theirs.
+    When making room for new items (see `put_evicting`), the oldest item of
+    the same key is removed if the key is over its quota, or else the oldest
+    item of the key with the most items.
+
+    The number of items of a key is available as `depth(key)`. The methods
+    that enqueue items take their keys as an optional argument, for items
+    whose key cannot be computed from the item itself (e.g. because it has
+    already been serialized).
+    """
+
+    def __init__(
+        self,
+        maxsize=0,
+        doorbell=None,
+        key="customerId",
+        max_size_per_key=0,
+        budget=None,
+    ):
+        """
+        maxsize, doorbell, budget:
+            See `metering.ingest.batch_queue.BatchQueue`.
+
+        key:
+            Function that returns the key of an item, or the name of the
+            field of the (dictionary) items to use as key. Items without a
+            key share the `None` key.
+
+        max_size_per_key:
+            Maximum number of items a single key may hold. If 0 (the
+            default), keys are only bounded by `maxsize`.
+        """
+        self.key = _field(key) if isinstance(key, str) else key
+        self.max_size_per_key = max_size_per_key
+        super().__init__(maxsize, doorbell, budget)
+
+    def _init(self, maxsize):
+        super()._init(maxsize)
+        # key -> deque of (item, enqueued_at, size)
+        self.lanes = {}
+        # Keys with items, in the order they take their turns.
+        self.turns = deque()
+        self.size = 0
+
+    def _qsize(self):
+        return self.size
+
+    def _key(self, item, key):
+        return self.key(item) if key is None else key
+
+    def _has_room(self, key, n=1):
+        lane = self.lanes.get(key)
+        return (
+            not self.max_size_per_key
+            or (len(lane) if lane else 0) + n <= self.max_size_per_key
+        )
+
+    def _put_entry(self, key, item, size):
+        lane = self.lanes.get(key)
+        if lane is None:
+            lane = self.lanes[key] = deque()
+            self.turns.append(key)
+
+        lane.append((item, time.monotonic(), size))
+        self.size += 1
+        self.bytes += size
+
+    def _get(self):
+        key = self.turns[0]
+        item = self._pop(key)
+
+        if key in self.lanes:
+            self.turns.rotate(-1)
+
+        return item
+
+    def _pop(self, key):
+        """
+        Removes and returns the oldest item of the key.
+        """
+        lane = self.lanes[key]
+        item, self.local.enqueued_at, size = lane.popleft()
+        self.size -= 1
+        self._release(size)
+
+        if not lane:
+            self.turns.remove(key)
+            del self.lanes[key]
+
+        return item
+
+    def _evict(self, key):
+        if key not in self.lanes or self._has_room(key):
+            key = max(self.lanes, key=lambda k: len(self.lanes[k]))
+        return self._pop(key)
+
+    def depth(self, key):
+        """
+        Returns the number of items of the key.
+        """
+        with self.mutex:
+            lane = self.lanes.get(key)
+            return len(lane) if lane else 0
+
+    def age(self):
+        with self.mutex:
+            if not self.size:
+                return 0
+            oldest = min(lane[0][1] for lane in self.lanes.values())
+            return time.monotonic() - oldest
@@ -0,0 +1,36 @@
+from bisect import bisect_left
+
+
+class Histogram:
+    """
+    Counts observed values into buckets with the given upper bounds (in
+    increasing order), plus an implicit `+Inf` bucket.
+
+    This class is not thread-safe.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self):
+        """
+        Returns the cumulative counts, as a dictionary with the `buckets`
+        (list of `(upper_bound, count)` tuples), the `sum` and the `count` of
+        the observed values.
+        """
+        cumulative = []
+        total = 0
+
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            cumulative.append((bound, total))
+
+        return {"buckets": cumulative, "sum": self.sum, "count": self.count}
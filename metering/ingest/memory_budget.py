@@ -0,0 +1,80 @@
+from threading import Condition
+
+from metering import codec, validators
+
+
+def serialized_size(item):
+    """
+    Returns the size of the item serialized to JSON, in bytes. This is cheap
+    for `metering.codec.Fragment` instances (see the `encode_on_send` option
+    of `metering.ingest.ThreadedProducer`).
+    """
+    if isinstance(item, codec.Fragment):
+        return len(item)
+
+    try:
+        return len(codec.encode(item))
+    except Exception:
+        return len(repr(item))
+
+
+class MemoryBudget:
+    """
+    A budget of bytes, shared by the queues of a producer, that bounds the
+    (approximate) memory taken by the items waiting to be sent. Each item is
+    measured when it is enqueued, and its size is returned to the budget when
+    it is taken out.
+
+    By default, items are measured by their serialized size, which is lower
+    than the memory an unserialized payload (e.g. a dictionary) takes. The
+    bytes currently in use are available as `used`. This class is
+    thread-safe.
+    """
+
+    def __init__(self, max_bytes, measure=serialized_size):
+        """
+        max_bytes:
+            Maximum number of bytes the queued items may take, in total.
+
+        measure:
+            Function that returns the size of an item, in bytes.
+        """
+        validators.require_positive_int("max_bytes", max_bytes, allow_none=False)
+
+        self.max_bytes = max_bytes
+        self.measure = measure
+        self.used = 0
+        self.condition = Condition()
+
+    def reserve(self, n):
+        """
+        Takes `n` bytes from the budget, if there is room for them. Returns
+        whether there was.
+        """
+        with self.condition:
+            if self.used + n > self.max_bytes:
+                return False
+            self.used += n
+            return True
+
+    def release(self, n):
+        """
+        Returns `n` bytes to the budget.
+        """
+        with self.condition:
+            self.used -= n
+            self.condition.notify_all()
+
+    def wait(self, n, timeout=None):
+        """
+        Blocks until there is room for `n` bytes, or until the timeout (in
+        seconds) expires. Returns whether there is room (which may be taken
+        by someone else before it can be reserved).
+        """
+        if n > self.max_bytes:
+            return False
+
+        with self.condition:
+            return self.condition.wait_for(
+                lambda: self.used + n <= self.max_bytes, timeout
+            )
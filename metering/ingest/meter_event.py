@@ -0,0 +1,135 @@
+from uuid import UUID
+
+from metering import validators
+from metering.ingest.unique_id import new_unique_id
+
+# Wire (JSON) name of each field.
+_fields = {
+    "uniqueId": "unique_id",
+    "meterApiName": "meter_api_name",
+    "meterValue": "meter_value",
+    "customerId": "customer_id",
+    "meterTimeInMillis": "meter_time_in_millis",
+    "dimensions": "dimensions",
+}
+
+
+class MeterEvent:
+    """
+    A meter record, as built by `metering.ingest.create_ingest_payload`, but
+    much smaller while it waits in a queue: its fields are stored in slots
+    rather than in a dictionary, and its unique id (unless given) is only
+    generated when the record is serialized, e.g. when its batch is encoded.
+
+    It can be sent as is with `metering.ingest.ThreadedProducer.send`. It also
+    supports read-only dictionary access by wire name (e.g.
+    `event["customerId"]`), and `to_payload` returns the dictionary form.
+    """
+
+    __slots__ = (
+        "meter_api_name",
+        "meter_value",
+        "meter_time_in_millis",
+        "customer_id",
+        "dimensions",
+        "_unique_id",
+    )
+
+    def __init__(
+        self,
+        meter_api_name,
+        meter_value,
+        meter_time_in_millis,
+        customer_id,
+        dimensions=None,
+        unique_id=None,
+    ):
+        """
+        See `metering.ingest.create_ingest_payload` for the arguments.
+        """
+        validators.require_string("meter_api_name", meter_api_name, allow_none=False)
+        validators.require("meter_value", meter_value, (int, float), allow_none=False)
+        validators.require_positive_int(
+            "meter_time_in_millis", meter_time_in_millis, allow_none=False
+        )
+        validators.require_string("customer_id", customer_id, allow_none=False)
+
+        if isinstance(unique_id, UUID):
+            unique_id = str(unique_id)
+
+        validators.require_string("unique_id", unique_id)
+        validators.require_string_dictionary("dimensions", dimensions)
+
+        self.meter_api_name = meter_api_name
+        self.meter_value = meter_value
+        self.meter_time_in_millis = meter_time_in_millis
+        self.customer_id = customer_id
+        self.dimensions = dimensions
+        self._unique_id = unique_id
+
+    @classmethod
+    def _unchecked(
+        cls,
+        meter_api_name,
+        meter_value,
+        meter_time_in_millis,
+        customer_id,
+        dimensions=None,
+        unique_id=None,
+    ):
+        """
+        Builds an event out of values that have already been validated.
+        """
+        event = cls.__new__(cls)
+        event.meter_api_name = meter_api_name
+        event.meter_value = meter_value
+        event.meter_time_in_millis = meter_time_in_millis
+        event.customer_id = customer_id
+        event.dimensions = dimensions
+        event._unique_id = unique_id
+        return event
+
+    @property
+    def unique_id(self):
+        """
+        The unique id, generated (once) on first access if not given.
+        """
+        if self._unique_id is None:
+            self._unique_id = new_unique_id()
+        return self._unique_id
+
+    def to_payload(self):
+        """
+        Returns the dictionary form, i.e. the payload sent to the API.
+        """
+        payload = {
+            "uniqueId": self.unique_id,
+            "meterApiName": self.meter_api_name,
+            "meterValue": self.meter_value,
+            "customerId": self.customer_id,
+            "meterTimeInMillis": self.meter_time_in_millis,
+        }
+
+        if self.dimensions is not None:
+            payload["dimensions"] = self.dimensions
+
+        return payload
+
+    def __getitem__(self, name):
+        if name not in self:
+            raise KeyError(name)
+        return getattr(self, _fields[name])
+
+    def __contains__(self, name):
+        return name in _fields and (name != "dimensions" or self.dimensions is not None)
+
+    def get(self, name, default=None):
+        return self[name] if name in self else default
+
+    def __eq__(self, other):
+        if not isinstance(other, MeterEvent):
+            return NotImplemented
+        return self.to_payload() == other.to_payload()
+
+    def __repr__(self):
+        return "MeterEvent({!r})".format(self.to_payload())
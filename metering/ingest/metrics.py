@@ -0,0 +1,191 @@
+from threading import Lock, current_thread, local
+
+from metering.ingest.histogram import Histogram
+
+_lanes = ("regular", "custom")
+
+_counters = (
+    "enqueued",  # accepted into the queue (or folded by the aggregator)
+    "dropped",  # rejected because the queue was full
+    "invalid",  # rejected by validation (`validate_payloads`)
+    "sent",  # delivered (including replays from the spool)
+    "failed",  # given up on (handed to `on_error`)
+    "spooled",  # stored in the spool, to be replayed
+    "retries",  # additional attempts to send a batch
+    # What the overflow policies did when the queue was full:
+    "blocked",  # waited for room ("block")
+    "evicted",  # removed to make room for newer items ("drop_oldest")
+    "spilled",  # stored in the spool instead ("spill")
+    "folded",  # folded into an aggregated record instead ("aggregate")
+)
+
+# Number of per-thread counters above which those of finished threads are
+# folded when a thread starts counting (see `ProducerMetrics.count`).
+_min_fold_at = 16
+
+_latency_buckets = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+)
+
+_histograms = {
+    "batch_size": (1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000),
+    "encode_seconds": _latency_buckets,
+    "compress_seconds": _latency_buckets,
+    "request_seconds": _latency_buckets,
+    "delivery_seconds": _latency_buckets,
+}
+
+
+class ProducerMetrics:
+    """
+    Counters (per lane, i.e. regular or custom queue) and histograms of a
+    producer and its consumers:
+
+    - `batch_size`: number of items per batch;
+    - `encode_seconds`, `compress_seconds`: time to serialize and to gzip a
+      batch;
+    - `request_seconds`: time taken by each request (attempt);
+    - `delivery_seconds`: time from enqueueing the oldest item of a batch
+      until the batch is sent.
+
+    This class is not intended to be used directly. Rather, see
+    `metering.ingest.producer.ThreadedProducer.stats`. It is thread-safe.
+    """
+
+    def __init__(self):
+        # The counters of the threads that have finished.
+        self.counters = _new_counters()
+        # Each thread has its own counters, so counting takes no lock. They
+        # are listed (with their thread) in `shards`, to be summed.
+        self.local = local()
+        self.shards = []
+        # Finished threads are folded once there are this many shards, so
+        # that short-lived threads do not pile up.
+        self.fold_at = _min_fold_at
+        self.histograms = {name: Histogram(b) for name, b in _histograms.items()}
+        self.lock = Lock()
+
+    def count(self, name, is_custom=False, n=1):
+        try:
+            counters = self.local.counters
+        except AttributeError:
+            counters = self.local.counters = _new_counters()
+            with self.lock:
+                if len(self.shards) >= self.fold_at:
+                    self._fold_finished()
+                    self.fold_at = max(_min_fold_at, 2 * len(self.shards))
+                self.shards.append((current_thread(), counters))
+
+        counters[_lanes[is_custom]][name] += n
+
+    def observe(self, name, value):
+        with self.lock:
+            self.histograms[name].observe(value)
+
+    def snapshot(self):
+        """
+        Returns a copy of the current values, as a dictionary with a key per
+        lane (holding the counters) and a key per histogram.
+        """
+        with self.lock:
+            self._fold_finished()
+
+            stats = {lane: dict(counters) for lane, counters in self.counters.items()}
+            for _, counters in self.shards:
+                _add(stats, counters)
+
+            for name, histogram in self.histograms.items():
+                stats[name] = histogram.snapshot()
+
+        return stats
+
+    def _fold_finished(self):
+        """
+        Adds the counters of the finished threads, which no longer change, to
+        `counters`, and drops their shards. Must be called with the lock.
+        """
+        alive = []
+        for thread, counters in self.shards:
+            if thread.is_alive():
+                alive.append((thread, counters))
+            else:
+                _add(self.counters, counters)
+        self.shards = alive
+
+
+def _new_counters():
+    return {lane: dict.fromkeys(_counters, 0) for lane in _lanes}
+
+
+def _add(total, counters):
+    for lane in _lanes:
+        for name, value in counters[lane].items():
+            total[lane][name] += value
+
+
+def to_openmetrics(stats, prefix="amberflo_ingest"):
+    """
+    Formats the statistics returned by
+    `metering.ingest.producer.ThreadedProducer.stats` in the Prometheus /
+    OpenMetrics text format, e.g. to be served on a `/metrics` endpoint.
+    """
+    lines = []
+
+    for name in _counters:
+        metric = "{}_{}".format(prefix, name)
+        lines.append("# TYPE {} counter".format(metric))
+        for lane in _lanes:
+            lines.append(
+                '{}_total{{lane="{}"}} {}'.format(metric, lane, stats[lane][name])
+            )
+
+    metric = "{}_queue_depth".format(prefix)
+    lines.append("# TYPE {} gauge".format(metric))
+    for lane in _lanes:
+        lines.append(
+            '{}{{lane="{}"}} {}'.format(metric, lane, stats[lane]["queue_depth"])
+        )
+
+    if "queue_bytes" in stats["regular"]:
+        metric = "{}_queue_bytes".format(prefix)
+        lines.append("# TYPE {} gauge".format(metric))
+        for lane in _lanes:
+            lines.append(
+                '{}{{lane="{}"}} {}'.format(metric, lane, stats[lane]["queue_bytes"])
+            )
+
+    if "threads" in stats:
+        metric = "{}_threads".format(prefix)
+        lines.append("# TYPE {} gauge".format(metric))
+        lines.append("{} {}".format(metric, stats["threads"]))
+
+    for name in _histograms:
+        metric = "{}_{}".format(prefix, name)
+        histogram = stats[name]
+        lines.append("# TYPE {} histogram".format(metric))
+        for bound, count in histogram["buckets"]:
+            lines.append('{}_bucket{{le="{}"}} {}'.format(metric, _le(bound), count))
+        lines.append("{}_sum {}".format(metric, histogram["sum"]))
+        lines.append("{}_count {}".format(metric, histogram["count"]))
+
+    lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+
+def _le(bound):
+    if bound == float("inf"):
+        return "+Inf"
+    return repr(float(bound))
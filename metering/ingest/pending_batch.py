@@ -0,0 +1,45 @@
+import time
+
+
+class PendingBatch:
+    """
+    A batch of items being collected by a consumer, along with their
+    serialized form (if known) and the size of the serialized batch.
+    """
+
+    __slots__ = ("items", "fragments", "size", "opened", "closed", "enqueued_at")
+
+    # Size of the brackets around a serialized batch.
+    overhead = 2
+
+    def __init__(self):
+        self.items = []
+        self.fragments = []
+        self.size = self.overhead
+        self.opened = None
+        self.closed = False
+        self.enqueued_at = None
+
+    def __len__(self):
+        return len(self.items)
+
+    def add(self, item, fragment=None, enqueued_at=None):
+        if not self.items:
+            self.opened = time.monotonic()
+
+        if enqueued_at is not None and (
+            self.enqueued_at is None or enqueued_at < self.enqueued_at
+        ):
+            self.enqueued_at = enqueued_at  # of the oldest item
+
+        self.items.append(item)
+
+        if fragment is not None:
+            self.fragments.append(fragment)
+            self.size += len(fragment) + 1  # including the separator
+
+    def age(self, now):
+        """
+        Seconds since the first item was added.
+        """
+        return now - self.opened if self.items else 0
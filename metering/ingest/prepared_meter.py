@@ -0,0 +1,139 @@
+import time
+from uuid import UUID
+
+from metering import codec, validators
+from metering.ingest.meter_event import MeterEvent
+from metering.ingest.unique_id import new_unique_id
+
+
+class PreparedMeter:
+    """
+    Enqueues meter records that share their meter, dimensions and (possibly)
+    customer, which are validated (and serialized, if possible) only once.
+    Each call only validates what changes: the value, and the customer and
+    time, if given.
+
+    This class is not intended to be used directly. Rather, see
+    `metering.ingest.producer.ThreadedProducer.prepare`.
+    """
+
+    def __init__(self, producer, meter_api_name, customer_id=None, dimensions=None):
+        validators.require_string("meter_api_name", meter_api_name, allow_none=False)
+        validators.require_string("customer_id", customer_id)
+        validators.require_string_dictionary("dimensions", dimensions)
+
+        self.producer = producer
+        self.meter_api_name = meter_api_name
+        self.customer_id = customer_id
+        # A copy, so that later changes to the dictionary are not sent unchecked.
+        self.dimensions = dict(dimensions) if dimensions is not None else None
+        self.compact = producer.event_class is MeterEvent
+
+        # Records are serialized right away, unless the producer has to look
+        # into them (to aggregate or fold them, or to pick their sub-queue).
+        self.prefix = None
+        if (
+            producer.encode_on_send
+            and producer.aggregator is None
+            and producer.overflow != "aggregate"
+            and producer.fair_queue_key is None
+        ):
+            static = {"meterApiName": meter_api_name}
+            if self.dimensions is not None:
+                static["dimensions"] = self.dimensions
+            self.prefix = codec.dumps(static)[:-1] + b',"customerId":'
+            if customer_id is not None:
+                self.customer = codec.dumps(customer_id)
+
+    def __call__(
+        self,
+        meter_value,
+        customer_id=None,
+        meter_time_in_millis=None,
+        unique_id=None,
+        overflow=None,
+        on_delivery=None,
+    ):
+        """
+        Enqueues a meter record. Returns whether it was successful or not (or
+        a future, see `metering.ingest.producer.ThreadedProducer.send`).
+
+        meter_value: Number.
+
+        customer_id: String. Required unless given to `prepare`.
+
+        meter_time_in_millis: Optional. Positive integer. Defaults to now.
+
+        unique_id: Optional. String. Defaults to a new id (see
+        `metering.ingest.unique_id`).
+
+        overflow, on_delivery: See
+        `metering.ingest.producer.ThreadedProducer.send`.
+        """
+        validators.require("meter_value", meter_value, (int, float), allow_none=False)
+
+        if customer_id is None:
+            customer_id = self.customer_id
+            validators.check(customer_id is not None, "'customer_id' is required")
+        else:
+            validators.require_string("customer_id", customer_id)
+
+        if meter_time_in_millis is None:
+            meter_time_in_millis = int(time.time() * 1000)
+        else:
+            validators.require_positive_int(
+                "meter_time_in_millis", meter_time_in_millis
+            )
+
+        if unique_id is not None:
+            if isinstance(unique_id, UUID):
+                unique_id = str(unique_id)
+            validators.require_string("unique_id", unique_id)
+
+        if self.prefix is not None:
+            payload = self._encode(
+                meter_value, customer_id, meter_time_in_millis, unique_id
+            )
+        elif self.compact:
+            payload = MeterEvent._unchecked(
+                self.meter_api_name,
+                meter_value,
+                meter_time_in_millis,
+                customer_id,
+                self.dimensions,
+                unique_id,
+            )
+        else:
+            payload = {
+                "uniqueId": unique_id or new_unique_id(),
+                "meterApiName": self.meter_api_name,
+                "meterValue": meter_value,
+                "customerId": customer_id,
+                "meterTimeInMillis": meter_time_in_millis,
+            }
+            if self.dimensions is not None:
+                payload["dimensions"] = self.dimensions
+
+        return self.producer.send(payload, overflow, on_delivery)
+
+    def _encode(self, meter_value, customer_id, meter_time_in_millis, unique_id):
+        if customer_id is self.customer_id:
+            customer = self.customer
+        else:
+            customer = codec.dumps(customer_id)
+
+        return codec.Fragment(
+            b"".join(
+                (
+                    self.prefix,
+                    customer,
+                    b',"meterValue":',
+                    codec.dumps(meter_value),
+                    b',"meterTimeInMillis":',
+                    str(meter_time_in_millis).encode(),
+                    b',"uniqueId":',
+                    codec.dumps(unique_id or new_unique_id()),
+                    b"}",
+                )
+            )
+        )
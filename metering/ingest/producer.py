@@ -1,9 +1,123 @@
 import atexit
 import logging
-from queue import Queue, Full
+import os
+import time
+import weakref
+from queue import Empty, Full
+from threading import Event, Lock, Thread
 
-from metering.ingest.api_client import IngestApiClient, create_ingest_payload
+from metering import codec, validators
+from metering.exceptions import ValidationError
+from metering.ingest.aggregator import MeterAggregator
+from metering.ingest.api_client import (
+    IngestApiClient,
+    create_ingest_payload,
+    ingest_payload_schema,
+)
+from metering.ingest.backend_pool import BackendPool
+from metering.ingest.batch_queue import BatchQueue
 from metering.ingest.consumer import ThreadedConsumer
+from metering.ingest.delivery_tracker import (
+    FOLDED,
+    SPOOLED,
+    DeliveryTracker,
+    new_future,
+)
+from metering.ingest.doorbell import Doorbell
+from metering.ingest.fair_batch_queue import FairBatchQueue
+from metering.ingest.memory_budget import MemoryBudget
+from metering.ingest.meter_event import MeterEvent
+from metering.ingest.metrics import ProducerMetrics, to_openmetrics
+from metering.ingest.prepared_meter import PreparedMeter
+
+_overflow_policies = (
+    "reject",
+    "reject_all",
+    "block",
+    "drop_oldest",
+    "spill",
+    "aggregate",
+)
+
+_lanes = ("regular", "custom")
+
+
+def _time_left(deadline):
+    if deadline is None:
+        return None
+    return max(0, deadline - time.monotonic())
+
+
+def _take(queue, n):
+    """
+    Takes up to `n` items from the queue, without blocking.
+    """
+    items = []
+    while len(items) < n:
+        try:
+            items.append(queue.get(block=False))
+        except Empty:
+            break
+    return items
+
+
+# Producers to restart in forked child processes.
+_producers = weakref.WeakSet()
+
+# Locks held while forking.
+_fork_locks = []
+
+
+def _before_fork():
+    seen = set()
+
+    for producer in list(_producers):
+        for lock in producer._fork_locks():
+            if id(lock) not in seen:
+                seen.add(id(lock))
+                _fork_locks.append(lock)
+
+    for lock in _fork_locks:
+        lock.acquire()
+
+
+def _after_fork_in_parent():
+    while _fork_locks:
+        _fork_locks.pop().release()
+
+
+def _after_fork_in_child():
+    _after_fork_in_parent()
+
+    for producer in list(_producers):
+        producer._restart_after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(
+        before=_before_fork,
+        after_in_parent=_after_fork_in_parent,
+        after_in_child=_after_fork_in_child,
+    )
+
+
+def _require_overflow_policy(overflow):
+    validators.check(
+        overflow in _overflow_policies,
+        "'overflow' must be one of {}".format(_overflow_policies),
+    )
+
+
+def _require_spool(spool):
+    validators.check(
+        spool is not None, "The 'spill' overflow policy requires a 'spool'"
+    )
+
+
+def _create_payload(row, create=create_ingest_payload):
+    if isinstance(row, dict):
+        return create(**row)
+    return create(*row)
 
 
 class ThreadedProducer:
@@ -20,7 +134,19 @@ class ThreadedProducer:
         backend_params,
         backend_class=IngestApiClient,
         max_queue_size=100000,
+        max_queue_bytes=None,
         threads=2,
+        aggregate_interval_in_secs=None,
+        aggregations=None,
+        encode_on_send=False,
+        compact_events=False,
+        autoscaler=None,
+        fair_queue_key=None,
+        max_queue_size_per_key=0,
+        overflow="reject",
+        overflow_timeout_in_secs=None,
+        validate_payloads=False,
+        track_delivery=False,
         **consumer_args
     ):
         """
@@ -35,10 +161,100 @@ class ThreadedProducer:
 
         max_queue_size:
             Maximum number of items that the queue will hold. If the queue is
-            full, new items will be rejected.
+            full, new items are handled according to the `overflow` policy.
+
+        max_queue_bytes:
+            Optional. Maximum number of bytes that the items in both queues
+            may take, in total, measured by their serialized (JSON) size. If
+            it is reached, new items are handled according to the `overflow`
+            policy, like when the queue is full. Measuring is cheap with
+            `encode_on_send`; otherwise each item is serialized once more, and
+            the actual memory taken by a (dictionary) payload is a few times
+            larger. See `metering.ingest.memory_budget.MemoryBudget`.
 
         threads:
-            Number of consumer threads to use.
+            Number of consumer threads to use. With an `autoscaler`, this is
+            the minimum number of threads.
+
+        aggregate_interval_in_secs:
+            Optional. When set, meter records sent to the regular queue that
+            share the same meter, customer and dimensions, and whose meter
+            time falls in the same time bucket of this width, are folded into
+            a single record before being enqueued. See
+            `metering.ingest.aggregator.MeterAggregator`.
+
+        aggregations:
+            Optional. Dictionary of meter api name to
+            `metering.usage.AggregationType` (SUM, COUNT, MIN or MAX). Meters
+            not listed here are summed.
+
+        encode_on_send:
+            When true, payloads are serialized to JSON as they are enqueued
+            (on the calling thread), and batches are built by concatenating
+            them. Items handed to `on_error` are then
+            `metering.codec.Fragment` instances (i.e. JSON bytes).
+
+        compact_events:
+            When true, `meter` and `meter_many` enqueue
+            `metering.ingest.MeterEvent` instances instead of dictionaries,
+            which take much less memory while they wait to be sent. Items
+            handed to `on_error` are then `MeterEvent` instances too (see
+            their `to_payload` method).
+
+        fair_queue_key:
+            Optional. When set, the regular queue keeps a sub-queue per key
+            and batches take items from them in turns, so that a customer (or
+            meter) with a large backlog does not delay the others. Either the
+            name of the payload field to use as key (e.g. "customerId" or
+            "meterApiName") or a function of the payload. See
+            `metering.ingest.fair_batch_queue.FairBatchQueue`.
+
+        max_queue_size_per_key:
+            With `fair_queue_key`, the maximum number of items a single key
+            may hold. Once reached, new items of that key are rejected,
+            while the other keys can still enqueue theirs.
+
+        overflow:
+            What to do with new items when the queue is full (by default,
+            for each call, see `send_many`):
+            - "reject": reject them (they are dropped);
+            - "reject_all": same, but calls enqueuing many items reject
+              either all of them or none;
+            - "block": wait for room, for up to `overflow_timeout_in_secs`
+              (e.g. for backfills, where completeness matters most);
+            - "drop_oldest": remove the oldest items in the queue to make
+              room (e.g. for telemetry, where freshness matters most);
+            - "spill": store them in the `spool` (which must be given),
+              to be sent once the backend catches up;
+            - "aggregate": fold them into aggregated records (see
+              `aggregate_interval_in_secs`, which is 1 second unless set),
+              which are enqueued later. Items that cannot be folded are
+              rejected. Not available for custom payloads, which are
+              rejected instead when it is the producer's policy.
+            What each policy did is counted in `stats`.
+
+        overflow_timeout_in_secs:
+            With the "block" policy, how long a call may wait for room, in
+            total. By default, it waits as long as needed.
+
+        validate_payloads:
+            When true, the payloads given to `send` and `send_many` (but not
+            custom payloads) are checked against
+            `metering.ingest.api_client.ingest_payload_schema`, and invalid
+            ones are rejected (and counted as "invalid" in `stats`), rather
+            than failing their whole batch at the API. Payloads built by
+            `meter` and `meter_many` are always valid.
+
+        track_delivery:
+            When true, `send`, `send_custom` and `meter` return a
+            `concurrent.futures.Future` for the delivery of the item, instead
+            of whether it was enqueued. See `send`.
+
+        autoscaler:
+            Optional `metering.ingest.autoscaler.Autoscaler` instance. When
+            given, consumer threads are started as the queues back up (up to
+            its `max_threads`) and stopped when idle. The backend instances
+            of stopped consumers are reused by the ones started later.
 
         **consumer_args:
             Additional parameters will be passed to the consumer.
@@ -46,8 +262,27 @@ class ThreadedProducer:
         self.backend_params = backend_params
         self.backend_class = backend_class
         self.logger = logging.getLogger(__name__)
-        self.queue = Queue(max_queue_size)
-        self.custom_queue = Queue(max_queue_size)
+        self.max_queue_size = max_queue_size
+        self.max_queue_bytes = max_queue_bytes
+        self.threads = threads
+        self.aggregate_interval = aggregate_interval_in_secs
+        self.aggregations = aggregations
+        self.encode_on_send = encode_on_send
+        self.event_class = MeterEvent if compact_events else create_ingest_payload
+        self.autoscaler = autoscaler
+        self.fair_queue_key = fair_queue_key
+        self.max_queue_size_per_key = max_queue_size_per_key
+        self.overflow = overflow
+        self.overflow_timeout = overflow_timeout_in_secs
+        self.validate_payloads = validate_payloads
+        self.track_delivery = track_delivery
+        self.consumer_args = consumer_args
+
+        _require_overflow_policy(overflow)
+        if overflow == "spill":
+            _require_spool(consumer_args.get("spool"))
+
+        self._start()
 
         # On program exit, allow the consumer thread to exit cleanly.
         # This prevents exceptions and a messy shutdown when the interpreter is
@@ -56,70 +291,756 @@ class ThreadedProducer:
         # been delivered, you'll still need to call flush().
         atexit.register(self.join)
 
-        self.consumers = []
+        # Forked processes get their own queues and consumer threads.
+        _producers.add(self)
 
-        for _ in range(threads):
-            backend = self.backend_class(**backend_params)
-            consumer = self.consumer_class(
-                self.queue, self.custom_queue, backend, **consumer_args
+    def _start(self):
+        """
+        Create the queues, and start the aggregator and consumer threads.
+        """
+        # Wakes up the consumers as soon as items are enqueued in either queue.
+        self.doorbell = Doorbell()
+        # Shared by both queues.
+        self.budget = None
+        if self.max_queue_bytes:
+            self.budget = MemoryBudget(self.max_queue_bytes)
+
+        if self.fair_queue_key is None:
+            self.queue = BatchQueue(
+                self.max_queue_size, doorbell=self.doorbell, budget=self.budget
+            )
+        else:
+            self.queue = FairBatchQueue(
+                self.max_queue_size,
+                doorbell=self.doorbell,
+                key=self.fair_queue_key,
+                max_size_per_key=self.max_queue_size_per_key,
+                budget=self.budget,
+            )
+        self.custom_queue = BatchQueue(
+            self.max_queue_size, doorbell=self.doorbell, budget=self.budget
+        )
+        self.aggregator = None
+        self.metrics = ProducerMetrics()
+        self.delivery_tracker = DeliveryTracker()
+
+        if self.aggregate_interval or self.overflow == "aggregate":
+            self.aggregator = MeterAggregator(
+                self.aggregate_interval or 1,
+                aggregations=self.aggregations,
+                max_records=self.max_queue_size,
             )
-            consumer.start()
-            self.consumers.append(consumer)
+            self._start_aggregator_thread()
+
+        self.backend_pool = BackendPool(self.backend_class, self.backend_params)
+        self.consumers = [self._start_consumer() for _ in range(self.threads)]
+        # Held while the set of consumers changes (or must not change).
+        self.consumers_lock = Lock()
+
+        if self.autoscaler is not None:
+            self._start_scaler_thread()
+
+    def _start_consumer(self):
+        backend = self.backend_pool.acquire()
+        consumer = self.consumer_class(
+            self.queue,
+            self.custom_queue,
+            backend,
+            metrics=self.metrics,
+            delivery_tracker=self.delivery_tracker,
+            **self.consumer_args
+        )
+        consumer.start()
+        return consumer
 
-    def send(self, payload):
+    def _stop_consumer(self, consumer):
+        # Other consumers are still around to retry the scheduled batches.
+        consumer.join(abandon_retries=False)
+        self.backend_pool.release(consumer.backend)
+
+    def send(self, payload, overflow=None, on_delivery=None):
         """
-        Enqueue a payload to be sent. Returns whether it was successful or not.
+        Enqueue a payload to be sent. Returns whether it was successful or not
+        or, with `track_delivery`, a `concurrent.futures.Future` for its
+        delivery, which is resolved:
+        - with the result "sent", once its batch is sent;
+        - with the result "spooled" or "folded", once it is stored in the
+          spool or folded into an aggregated record, to be sent later;
+        - with the error, once it is given up on (e.g. `queue.Full` if it
+          was rejected, or the error its batch failed with).
+        Items left in the queues when the producer is stopped without being
+        flushed are never resolved.
 
-        See `metering.ingest.IngestApiClient.send` for details on the payload.
+        overflow:
+            What to do if the queue is full. By default, the producer's
+            `overflow` policy.
+
+        on_delivery:
+            Optional. Function called with the future once it is resolved,
+            from any thread (even without `track_delivery`).
+
+        See `metering.ingest.IngestApiClient.send` for details on the payload,
+        which may also be a `metering.ingest.MeterEvent`.
         """
+        overflow = self._overflow_policy(overflow, is_custom=False)
+        future = self._new_future(on_delivery)
+
+        if self.validate_payloads and not self._drop_invalid([payload]):
+            if future is None:
+                return False
+            errors = ingest_payload_schema.errors(payload)
+            return self._settle(future, False, error=ValidationError("; ".join(errors)))
+
+        if self.aggregate_interval and self.aggregator.add(payload):
+            self.metrics.count("enqueued")
+            return self._settle(future, True, FOLDED)
+
+        if overflow not in ("reject", "reject_all"):
+            accepted = self._put_each(self.queue, [payload], overflow, future) == 1
+            return self._outcome(future, accepted)
+
         try:
-            self.queue.put(payload, block=False)
-            return True
+            self._put(self.queue, payload, future)
+            self.metrics.count("enqueued")
+            return self._outcome(future, True)
         except Full:
             self.logger.warning("Queue is full!")
+            self.metrics.count("dropped")
 
-        return False
+        return self._outcome(future, False)
 
-    def send_custom(self, payload):
+    def send_custom(self, payload, overflow=None, on_delivery=None):
         """
         Enqueue a custom payload to be sent. Returns whether it was successful or not.
+
+        See `send` for the `overflow` and `on_delivery` options, and for the
+        future returned with `track_delivery`.
         """
+        overflow = self._overflow_policy(overflow, is_custom=True)
+        future = self._new_future(on_delivery)
+
+        if overflow not in ("reject", "reject_all"):
+            accepted = self._put_each(self.custom_queue, [payload], overflow, future)
+            return self._outcome(future, accepted == 1)
+
         try:
-            self.custom_queue.put(payload, block=False)
-            return True
+            self._put(self.custom_queue, payload, future)
+            self.metrics.count("enqueued", is_custom=True)
+            return self._outcome(future, True)
         except Full:
             self.logger.warning("Custom queue is full!")
+            self.metrics.count("dropped", is_custom=True)
+
+        return self._outcome(future, False)
+
+    def _new_future(self, on_delivery):
+        """
+        Returns a new future for the delivery of an item, if it is tracked.
+        """
+        if not self.track_delivery and on_delivery is None:
+            return None
+        return new_future(on_delivery)
+
+    def _settle(self, future, accepted, result=None, error=None):
+        """
+        Resolves the future (if any) of an item that was not enqueued, and
+        returns the outcome of sending it.
+        """
+        if future is not None:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+        return self._outcome(future, accepted)
+
+    def _outcome(self, future, accepted):
+        return future if self.track_delivery else accepted
+
+    def _put(self, queue, payload, future=None):
+        """
+        Enqueue the payload without blocking, serialized if `encode_on_send`.
+        """
+        item, options = self._prepare(queue, payload, future)
+        try:
+            queue.put(item, block=False, **options)
+        except Full as e:
+            self.delivery_tracker.resolve([item], error=e)
+            raise
+
+    def _prepare(self, queue, payload, future=None):
+        """
+        Returns the item to enqueue for the payload (serialized if
+        `encode_on_send`), and the options for enqueuing it. The future (if
+        given) is resolved with what happens to the item.
+        """
+        item, options = payload, {}
+
+        if self.encode_on_send:
+            item = codec.fragment(payload)
+            if isinstance(queue, FairBatchQueue):
+                # The key is taken from the payload, not its serialized form.
+                options["key"] = queue.key(payload)
+
+        if future is not None:
+            self.delivery_tracker.track(item, future)
+
+        return item, options
+
+    def _put_each(self, queue, payloads, overflow, future=None):
+        """
+        Enqueue the payloads one by one, applying the overflow policy to
+        each one that does not fit. Returns the number of payloads accepted
+        (i.e. enqueued, spilled or folded).
+
+        future:
+            Optional. The future of the delivery of the (single) payload.
+        """
+        is_custom = queue is self.custom_queue
+        deadline = None
+        if overflow == "block" and self.overflow_timeout is not None:
+            deadline = time.monotonic() + self.overflow_timeout
+
+        enqueued = 0
+        overflowed = []
+        overflowed_items = []
 
-        return False
+        for payload in payloads:
+            item, options = self._prepare(queue, payload, future)
 
-    def meter(self, *args, **kwargs):
+            if overflow == "drop_oldest":
+                fits = self._put_evicting(queue, item, options, is_custom)
+            else:
+                block = overflow == "block"
+                fits = self._put_or_wait(queue, item, options, block, deadline)
+
+            if fits:
+                enqueued += 1
+            else:
+                overflowed.append(payload)
+                overflowed_items.append(item)
+
+        self.metrics.count("enqueued", is_custom, enqueued)
+
+        handled = self._overflow(overflowed, overflow, is_custom)
+        rejected = len(overflowed) - sum(handled)
+
+        if rejected:
+            self.logger.warning("Queue is full! Rejected %s items", rejected)
+            self.metrics.count("dropped", is_custom, rejected)
+
+        self._resolve_overflowed(overflowed_items, handled, overflow)
+        return enqueued + sum(handled)
+
+    def _put_evicting(self, queue, item, options, is_custom):
+        """
+        Enqueue the item, removing the oldest items to make room for it.
+        Returns whether it was enqueued.
+        """
+        try:
+            evicted = queue.put_evicting(item, **options)
+            fits = True
+        except Full as e:
+            evicted = e.evicted
+            fits = False
+
+        self.metrics.count("evicted", is_custom, len(evicted))
+        self.delivery_tracker.resolve(evicted, error=Full())
+        return fits
+
+    def _put_or_wait(self, queue, item, options, block, deadline):
+        """
+        Enqueue the item, waiting for room until the deadline if `block`.
+        Returns whether it was enqueued.
+        """
+        try:
+            queue.put(item, block=False, **options)
+            return True
+        except Full:
+            if not block:
+                return False
+
+        self.metrics.count("blocked", queue is self.custom_queue)
+
+        try:
+            queue.put(item, timeout=_time_left(deadline), **options)
+            return True
+        except Full:
+            return False
+
+    def _resolve_overflowed(self, items, handled, overflow):
+        """
+        Resolves the futures of the items that did not fit in the queue,
+        according to whether the overflow policy handled them.
+        """
+        result = SPOOLED if overflow == "spill" else FOLDED
+        for item, was_handled in zip(items, handled):
+            if was_handled:
+                self.delivery_tracker.resolve([item], result)
+            else:
+                self.delivery_tracker.resolve([item], error=Full())
+
+    def _overflow(self, payloads, overflow, is_custom):
+        """
+        Spill or fold the payloads that did not fit in the queue, according
+        to the policy. Returns, for each of them, whether it was handled.
+        """
+        if overflow == "spill" and payloads:
+            try:
+                if self.consumer_args["spool"].append(payloads, is_custom):
+                    self.metrics.count("spilled", is_custom, len(payloads))
+                    return [True] * len(payloads)
+            except Exception as e:
+                self.logger.exception("Failed to spill items: %s", e)
+
+        if overflow == "aggregate":
+            handled = [self.aggregator.add(p) for p in payloads]
+            self.metrics.count("folded", is_custom, sum(handled))
+            return handled
+
+        return [False] * len(payloads)
+
+    def _overflow_policy(self, overflow, is_custom):
+        """
+        Returns the policy to use (by default, the producer's one), after
+        checking it can be used.
+        """
+        if overflow is None:
+            if is_custom and self.overflow == "aggregate":
+                # Custom payloads are not meter records, so they are never
+                # folded (into the regular queue's records).
+                return "reject"
+            return self.overflow
+
+        _require_overflow_policy(overflow)
+
+        if overflow == "spill":
+            _require_spool(self.consumer_args.get("spool"))
+
+        if overflow == "aggregate":
+            validators.check(not is_custom, "Custom payloads cannot be aggregated")
+            validators.check(
+                self.aggregator is not None,
+                "The 'aggregate' overflow policy requires either "
+                "'aggregate_interval_in_secs' or overflow='aggregate'",
+            )
+
+        return overflow
+
+    def meter(self, *args, overflow=None, on_delivery=None, **kwargs):
         """
         Build and enqueue a meter record to be sent. Returns whether it was
-        successful or not.
+        successful or not (or a future, see `send`).
+
+        See `metering.ingest.create_ingest_payload` for details on the payload,
+        and `send` for the `overflow` and `on_delivery` options.
+        """
+        payload = self.event_class(*args, **kwargs)
+        return self.send(payload, overflow, on_delivery)
+
+    def prepare(self, meter_api_name, customer_id=None, dimensions=None):
+        """
+        Returns a function that builds and enqueues meter records of the
+        meter, with the given dimensions and (optionally) customer, which are
+        validated only once. It is called with the value, and optionally the
+        customer, the time and the unique id, e.g.:
+
+            api_calls = producer.prepare("ApiCalls", dimensions={"region": "us"})
+            api_calls(1, customer_id="customer-123")
+
+        See `metering.ingest.prepared_meter.PreparedMeter`.
+        """
+        return PreparedMeter(self, meter_api_name, customer_id, dimensions)
+
+    def send_many(self, payloads, overflow=None):
+        """
+        Enqueue many payloads to be sent, all at once. Returns a tuple with
+        the number of accepted and rejected payloads.
+
+        overflow:
+            What to do when there is not enough room in the queue for all the
+            payloads. By default, the producer's `overflow` policy. With
+            "reject", the first ones that fit are enqueued and the rest are
+            rejected; with "reject_all", either all of them are enqueued or
+            none. See `ThreadedProducer` for the other policies.
+
+        See `metering.ingest.IngestApiClient.send` for details on the payload.
+        """
+        overflow = self._overflow_policy(overflow, is_custom=False)
+        payloads = list(payloads)
+        invalid = 0
+
+        if self.validate_payloads:
+            valid = self._drop_invalid(payloads)
+            invalid = len(payloads) - len(valid)
+            payloads = valid
+
+        total = len(payloads)
+
+        if self.aggregate_interval:
+            payloads = [p for p in payloads if not self.aggregator.add(p)]
+
+        accepted, rejected = self._put_many(self.queue, payloads, overflow, total)
+        return accepted, rejected + invalid
+
+    def _drop_invalid(self, payloads):
+        """
+        Returns the payloads that are valid (or already validated, i.e.
+        `MeterEvent` and `metering.codec.Fragment` instances, which are built
+        from validated parts), logging and counting the invalid ones.
+        """
+        checked = [
+            p for p in payloads if not isinstance(p, (MeterEvent, codec.Fragment))
+        ]
+        invalid = ingest_payload_schema.invalid(checked)
+
+        if not invalid:
+            return payloads
+
+        for i, errors in invalid[:10]:
+            self.logger.warning("Invalid payload: %s", "; ".join(errors))
+        self.metrics.count("invalid", n=len(invalid))
+
+        rejected = {id(checked[i]) for i, _ in invalid}
+        return [p for p in payloads if id(p) not in rejected]
+
+    def send_custom_many(self, payloads, overflow=None):
+        """
+        Enqueue many custom payloads to be sent, all at once. Returns a tuple
+        with the number of accepted and rejected payloads.
+
+        See `send_many` for the `overflow` options.
+        """
+        overflow = self._overflow_policy(overflow, is_custom=True)
+        payloads = list(payloads)
+        return self._put_many(self.custom_queue, payloads, overflow, len(payloads))
+
+    def meter_many(self, rows, overflow=None):
+        """
+        Build and enqueue many meter records to be sent, all at once. Returns
+        a tuple with the number of accepted and rejected records.
+
+        Each row holds the arguments of `metering.ingest.create_ingest_payload`,
+        either as a dictionary (keyword arguments) or as a tuple (positional
+        arguments). Invalid rows are rejected.
+
+        See `send_many` for the `overflow` options.
+        """
+        payloads = []
+        invalid = 0
+
+        for row in rows:
+            try:
+                payloads.append(_create_payload(row, self.event_class))
+            except (AssertionError, TypeError) as e:
+                self.logger.warning("Invalid meter record: %s", e)
+                invalid += 1
+
+        accepted, rejected = self.send_many(payloads, overflow)
+        return accepted, rejected + invalid
+
+    def _put_many(self, queue, payloads, overflow, total):
+        if overflow not in ("reject", "reject_all"):
+            accepted = self._put_each(queue, payloads, overflow)
+            return total - len(payloads) + accepted, len(payloads) - accepted
+
+        options = {"all_or_nothing": overflow == "reject_all"}
+
+        if self.encode_on_send:
+            if isinstance(queue, FairBatchQueue):
+                options["keys"] = [queue.key(p) for p in payloads]
+            payloads = [codec.fragment(p) for p in payloads]
+
+        accepted = queue.put_many(payloads, **options)
+        rejected = len(payloads) - accepted
+        is_custom = queue is self.custom_queue
+
+        self.metrics.count("enqueued", is_custom, total - rejected)
+
+        if rejected:
+            self.logger.warning("Queue is full! Rejected %s items", rejected)
+            self.metrics.count("dropped", is_custom, rejected)
+
+        return total - rejected, rejected
+
+    def stats(self):
+        """
+        Returns the current statistics of the producer and its consumers, as
+        a dictionary with:
+
+        - "regular" and "custom": the counters of each queue, i.e. the number
+          of items "enqueued", "dropped" (queue full), "invalid" (see
+          `validate_payloads`), "sent", "failed" (handed to `on_error`) and
+          "spooled", the number of "retries" (of batches), the "queue_depth"
+          and, with `max_queue_bytes`, the "queue_bytes";
+        - "threads": the number of consumer threads;
+        - "batch_size", "encode_seconds", "compress_seconds",
+          "request_seconds" and "delivery_seconds" (enqueue to send):
+          histograms, as dictionaries with the cumulative "buckets" (list of
+          `(upper_bound, count)` tuples), "sum" and "count".
+
+        See `metering.ingest.metrics.ProducerMetrics`.
+        """
+        stats = self.metrics.snapshot()
+        stats["regular"]["queue_depth"] = self.queue.qsize()
+        stats["custom"]["queue_depth"] = self.custom_queue.qsize()
+
+        if self.budget is not None:
+            stats["regular"]["queue_bytes"] = self.queue.bytes
+            stats["custom"]["queue_bytes"] = self.custom_queue.bytes
+        stats["threads"] = len(self.consumers)
+        return stats
+
+    def openmetrics(self, prefix="amberflo_ingest"):
+        """
+        Returns the current statistics (see `stats`) in the Prometheus /
+        OpenMetrics text format.
+        """
+        return to_openmetrics(self.stats(), prefix=prefix)
+
+    def flush(self, timeout=None, extra_threads=0):
+        """
+        Blocks until all messages in the queue are consumed, or until the
+        timeout (in seconds) expires.
+
+        Meanwhile, the consumers send batches without waiting for them to fill
+        up, and give up on failed batches at the deadline (which are then
+        spooled, if possible, or handed to `on_error`).
 
-        See `metering.ingest.create_ingest_payload` for details on the payload.
+        extra_threads:
+            Number of additional consumer threads to start (and stop) to help
+            send what is left.
+
+        Returns a report, i.e. a dictionary with the number of items
+        "delivered", "failed" and "spooled" during the flush, and the number
+        of items still "pending".
         """
-        payload = create_ingest_payload(*args, **kwargs)
-        return self.send(payload)
+        before = self.metrics.snapshot()
+
+        try:
+            self._flush(timeout, extra_threads)
+        finally:
+            for consumer in self.consumers:
+                consumer.relax()
+
+        return self._report(before)
 
-    def flush(self):
+    def _flush(self, timeout, extra_threads):
         """
-        Blocks until all messages in the queue are consumed.
+        Hurry the consumers (see `flush`), and wait for the queues to be
+        consumed. The consumers are left hurried.
         """
-        self.queue.join()
-        self.custom_queue.join()
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        self._drain_aggregator(force=True)
+
+        with self.consumers_lock:
+            helpers = [self._start_consumer() for _ in range(extra_threads)]
+
+            for consumer in self.consumers + helpers:
+                consumer.hurry(deadline)
+
+            try:
+                for queue in (self.queue, self.custom_queue):
+                    if not queue.join(timeout=_time_left(deadline)):
+                        break
+            finally:
+                for consumer in helpers:
+                    self._stop_consumer(consumer)
 
     def join(self):
         """
         Ends the consumer threads cleanly.
         """
+        _producers.discard(self)
+
+        if self.aggregator is not None:
+            self.aggregator_stopped.set()
+            self.aggregator_thread.join()
+
+        if self.autoscaler is not None:
+            self.scaler_stopped.set()
+            self.scaler_thread.join()
+
         for consumer in self.consumers:
             consumer.join()
 
-    def shutdown(self):
+    def shutdown(self, timeout=None, extra_threads=0):
         """
-        Block until all items are consumed, then ends the consumer threads
-        cleanly.
+        Block until all items are consumed (or until the timeout expires),
+        then ends the consumer threads cleanly. The items still in the queues
+        are spooled, if possible, and the spool is closed.
+
+        See `flush` for the parameters and the report returned.
         """
-        self.flush()
+        before = self.metrics.snapshot()
+
+        # The consumers stay hurried, so they give up on failed batches at
+        # the deadline instead of retrying them while being joined.
+        self._flush(timeout, extra_threads)
         self.join()
+        self._spool_remaining()
+
+        spool = self.consumer_args.get("spool")
+        if spool is not None:
+            spool.close()
+
+        return self._report(before)
+
+    def _report(self, before):
+        after = self.metrics.snapshot()
+
+        def delta(name):
+            return sum(after[lane][name] - before[lane][name] for lane in _lanes)
+
+        pending = self.queue.unfinished_tasks + self.custom_queue.unfinished_tasks
+        if self.aggregator is not None:
+            pending += len(self.aggregator)
+
+        return {
+            "delivered": delta("sent"),
+            "failed": delta("failed"),
+            "spooled": delta("spooled"),
+            "pending": pending,
+        }
+
+    def _spool_remaining(self):
+        """
+        Move the items left in the queues (after the consumers have stopped)
+        to the spool, if there is one.
+        """
+        spool = self.consumer_args.get("spool")
+        if spool is None:
+            return
+
+        batch_size = self.consumer_args.get("batch_size", 100)
+
+        for is_custom, queue in enumerate((self.queue, self.custom_queue)):
+            while True:
+                batch = _take(queue, batch_size)
+                if not batch:
+                    break
+
+                try:
+                    spooled = spool.append(batch, bool(is_custom))
+                except Exception as e:
+                    self.logger.exception("Failed to spool batch: %s", e)
+                    spooled = False
+
+                for _ in batch:
+                    queue.task_done()
+
+                if spooled:
+                    self.metrics.count("spooled", bool(is_custom), len(batch))
+                    self.delivery_tracker.resolve(batch, SPOOLED)
+                else:
+                    self.logger.warning("Dropped %s items on shutdown", len(batch))
+                    self.metrics.count("failed", bool(is_custom), len(batch))
+                    error = RuntimeError("Dropped on shutdown")
+                    self.delivery_tracker.resolve(batch, error=error)
+
+    def _fork_locks(self):
+        """
+        Returns the locks to hold while the process forks, so that the child
+        does not inherit them in the middle of an update.
+        """
+        locks = [
+            self.doorbell.condition,
+            self.queue.mutex,
+            self.custom_queue.mutex,
+            self.metrics.lock,
+        ]
+
+        if self.aggregator is not None:
+            locks.append(self.aggregator.lock)
+
+        for helper in self.consumer_args.values():
+            lock = getattr(helper, "lock", None) or getattr(helper, "condition", None)
+            if lock is not None:
+                locks.append(lock)
+
+        return locks
+
+    def _restart_after_fork(self):
+        """
+        In a forked child process, start over with new queues, backends (and
+        thus connections) and threads, since the threads are not copied. The
+        items inherited from the parent process are left to the parent, and
+        so is the spool (see `DiskSpool.for_child`).
+        """
+        retry_scheduler = self.consumer_args.get("retry_scheduler")
+        if retry_scheduler is not None:
+            retry_scheduler.drain()
+
+        spool = self.consumer_args.get("spool")
+        if spool is not None:
+            self.consumer_args["spool"] = spool.for_child()
+
+        self._start()
+
+    def _start_scaler_thread(self):
+        self.scaler_stopped = Event()
+        self.scaler_thread = Thread(target=self._run_scaler, daemon=True)
+        self.scaler_thread.start()
+
+    def _run_scaler(self):
+        while not self.scaler_stopped.wait(self.autoscaler.interval):
+            try:
+                self._scale()
+            except Exception as e:
+                self.logger.exception("Failed to scale the consumers: %s", e)
+
+    def _scale(self):
+        """
+        Start or stop a consumer, as decided by the autoscaler.
+        """
+        stopped = None
+
+        with self.consumers_lock:
+            now = time.monotonic()
+            queues = (self.queue, self.custom_queue)
+            idlest = min(self.consumers, key=lambda c: c.last_active, default=None)
+
+            change = self.autoscaler.decide(
+                len(self.consumers),
+                self.threads,
+                sum(queue.qsize() for queue in queues),
+                max(queue.age() for queue in queues),
+                now - idlest.last_active if idlest else 0,
+            )
+
+            if change > 0:
+                self.consumers = self.consumers + [self._start_consumer()]
+                self.logger.debug("Started consumer (%s)", len(self.consumers))
+            elif change < 0:
+                self.consumers = [c for c in self.consumers if c is not idlest]
+                stopped = idlest
+
+        if stopped is not None:
+            # Not holding the lock, since it may be in the middle of a send
+            # (e.g. while a flush waits for the lock).
+            self._stop_consumer(stopped)
+            self.logger.debug("Stopped consumer (%s)", len(self.consumers))
+
+    def _start_aggregator_thread(self):
+        self.aggregator_stopped = Event()
+        self.aggregator_thread = Thread(target=self._run_aggregator, daemon=True)
+        self.aggregator_thread.start()
+
+    def _run_aggregator(self):
+        interval = self.aggregator.interval / 2
+        while not self.aggregator_stopped.wait(interval):
+            self._drain_aggregator()
+
+    def _drain_aggregator(self, force=False):
+        """
+        Enqueue the folded records which are ready to be sent.
+        """
+        if self.aggregator is None:
+            return
+
+        for payload in self.aggregator.drain(force=force):
+            try:
+                self.queue.put(payload, block=False)
+            except Full:
+                self.logger.warning("Queue is full! Dropped aggregated record")
+                self.metrics.count("dropped")
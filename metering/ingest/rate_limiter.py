@@ -0,0 +1,182 @@
+import time
+from threading import Condition
+
+from metering import validators
+from metering.exceptions import ApiError
+
+
+class RateLimiter:
+    """
+    Token-bucket rate limiter and circuit breaker for the requests made by the
+    consumers.
+
+    - Requests are limited to `rate` per second, with bursts of up to `burst`
+      requests.
+    - A rate limited (429) response pauses all requests for as long as its
+      `Retry-After` header says (or `reset_timeout_in_secs`, if missing).
+    - After `failure_threshold` consecutive failures (server errors or
+      network errors), the circuit opens and all requests are paused for
+      `reset_timeout_in_secs`. Then a single trial request is let through:
+      if it succeeds the circuit closes, otherwise it opens again.
+
+    The same instance should be shared by all consumers of a producer (and
+    may be shared by several producers, to limit the whole process), for
+    example:
+
+        create_ingest_client(api_key=..., rate_limiter=RateLimiter(rate=20))
+
+    The current state is available through `state()`. This class is
+    thread-safe.
+    """
+
+    def __init__(
+        self,
+        rate=None,
+        burst=None,
+        failure_threshold=5,
+        reset_timeout_in_secs=30,
+        max_retry_after_in_secs=300,
+    ):
+        """
+        rate:
+            Optional. Maximum number of requests per second.
+
+        burst:
+            Maximum number of requests that can be made at once, after an idle
+            period. Defaults to `rate` (or 1, whichever is greater).
+
+        failure_threshold:
+            Number of consecutive failures that opens the circuit.
+
+        reset_timeout_in_secs:
+            How long the circuit stays open before a trial request.
+
+        max_retry_after_in_secs:
+            Upper bound on the pauses requested by the server.
+        """
+        validators.require_positive_number("rate", rate)
+        validators.require_positive_number("burst", burst)
+        validators.require_positive_int(
+            "failure_threshold", failure_threshold, allow_none=False
+        )
+
+        self.rate = rate
+        self.burst = burst or max(1, rate or 1)
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout_in_secs
+        self.max_retry_after = max_retry_after_in_secs
+
+        self.tokens = self.burst
+        self.refilled = time.monotonic()
+        self.paused_until = 0
+        self.failures = 0
+        self.is_open = False
+        self.trial_in_flight = False
+        self.throttled = 0
+        self.condition = Condition()
+
+    def state(self):
+        """
+        Returns the current state, for observability.
+        """
+        with self.condition:
+            if self.is_open:
+                circuit = "half-open" if self.trial_in_flight else "open"
+            else:
+                circuit = "closed"
+
+            return {
+                "circuit": circuit,
+                "consecutive_failures": self.failures,
+                "paused_for_in_secs": max(0, self.paused_until - time.monotonic()),
+                "throttled": self.throttled,
+            }
+
+    def acquire(self, timeout=None):
+        """
+        Block until a request may be made, or until the timeout (in seconds)
+        expires. Returns whether the request may be made.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                delay = self._delay(now)
+                if delay <= 0:
+                    return True
+
+                if deadline is not None:
+                    if now >= deadline:
+                        return False
+                    delay = min(delay, deadline - now)
+
+                self.condition.wait(delay)
+
+    def record(self, error=None):
+        """
+        Record the outcome of a request made after `acquire`.
+
+        error:
+            The exception raised by the request, if any.
+        """
+        with self.condition:
+            self.trial_in_flight = False
+
+            if isinstance(error, ApiError) and error.status_code == 429:
+                self.throttled += 1
+                self._pause(error.retry_after)
+            elif _is_failure(error):
+                self.failures += 1
+                if self.is_open or self.failures >= self.failure_threshold:
+                    self.is_open = True
+                    self._pause(None)
+            else:
+                self.failures = 0
+                self.is_open = False
+
+            self.condition.notify_all()
+
+    def _delay(self, now):
+        """
+        Returns how long to wait before making a request, or takes a token
+        (and returns 0) if there is no need to wait.
+        """
+        if self.paused_until > now:
+            return self.paused_until - now
+
+        if self.is_open:
+            if self.trial_in_flight:
+                return self.reset_timeout
+            self.trial_in_flight = True
+            return 0
+
+        if self.rate is None:
+            return 0
+
+        elapsed = now - self.refilled
+        self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+        self.refilled = now
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+
+        return (1 - self.tokens) / self.rate
+
+    def _pause(self, seconds):
+        if seconds is None:
+            seconds = self.reset_timeout
+        seconds = min(seconds, self.max_retry_after)
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+def _is_failure(error):
+    """
+    Client errors (other than 429) are not the service's fault.
+    """
+    if error is None:
+        return False
+    if isinstance(error, ApiError):
+        return error.status_code >= 500
+    return True
@@ -0,0 +1,101 @@
+import heapq
+import itertools
+import time
+from threading import Lock
+
+from metering import validators
+
+
+class RetryScheduler:
+    """
+    Time-ordered heap of failed batches waiting to be retried.
+
+    With a scheduler, a consumer makes a single attempt to send each batch.
+    If it fails with a retriable error, the batch is scheduled here, after the
+    next `backoff_delay`, and the consumer goes back to its queues. Due
+    batches are retried by whichever consumer gets to them first, in between
+    fresh batches.
+
+    The same instance should be shared by all consumers of a producer, for
+    example:
+
+        create_ingest_client(api_key=..., retry_scheduler=RetryScheduler())
+
+    The number of batches and items waiting are available as `len(...)` and
+    `items`, and the number of batches that did not fit as `rejected`. This
+    class is thread-safe.
+    """
+
+    def __init__(self, max_batches=1000, max_items=100000):
+        """
+        max_batches, max_items:
+            Bounds on what can be waiting to be retried. A failed batch that
+            would go over them is not retried; it is spooled or handed to
+            `on_error` instead.
+        """
+        validators.require_positive_int("max_batches", max_batches, allow_none=False)
+        validators.require_positive_int("max_items", max_items, allow_none=False)
+
+        self.max_batches = max_batches
+        self.max_items = max_items
+        self.heap = []
+        self.counter = itertools.count()
+        self.items = 0
+        self.rejected = 0
+        self.lock = Lock()
+
+    def __len__(self):
+        return len(self.heap)
+
+    def schedule(self, work, size, attempts, error, delay):
+        """
+        Schedule a retry of `work` (of `size` items) in `delay` seconds,
+        recording the number of `attempts` made so far and the last `error`.
+        Returns whether it was scheduled (or there is no room left).
+        """
+        due = time.monotonic() + delay
+
+        with self.lock:
+            if len(self.heap) >= self.max_batches or self.items + size > self.max_items:
+                self.rejected += 1
+                return False
+
+            entry = (due, next(self.counter), work, size, attempts, error)
+            heapq.heappush(self.heap, entry)
+            self.items += size
+
+        return True
+
+    def next_due(self):
+        """
+        Returns when (in `time.monotonic()` terms) the next retry is due, or
+        None if there is nothing scheduled.
+        """
+        with self.lock:
+            return self.heap[0][0] if self.heap else None
+
+    def pop_due(self):
+        """
+        Removes and returns the next due retry as a tuple `(work, attempts)`,
+        or None if no retry is due yet.
+        """
+        with self.lock:
+            if not self.heap or self.heap[0][0] > time.monotonic():
+                return None
+
+            _, _, work, size, attempts, _ = heapq.heappop(self.heap)
+            self.items -= size
+
+        return work, attempts
+
+    def drain(self):
+        """
+        Removes all the scheduled retries, and returns them (in order) as a
+        list of `(work, error)` tuples.
+        """
+        with self.lock:
+            entries = sorted(self.heap)
+            self.heap = []
+            self.items = 0
+
+        return [(work, error) for _, _, work, _, _, error in entries]
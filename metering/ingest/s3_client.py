@@ -1,8 +1,9 @@
-import json
 import logging
 from uuid import uuid4
 from datetime import datetime
 
+from metering import codec
+
 try:
     import boto3
 except ImportError:
@@ -37,11 +38,7 @@ class IngestS3Client:
         Create meter records with `metering.ingest.create_ingest_payload`.
         """
 
-        file_name = "{}-{}.json".format(
-            uuid4(), datetime.now().strftime(r"%d-%b-%Y-%H-%M-%S-%f")
-        )
-
-        return self._put_object(file_name, payload)
+        return self.send_encoded(self.encode(payload))
 
     def send_custom(self, payload):
         """
@@ -50,15 +47,36 @@ class IngestS3Client:
         The payload format can be arbitrary. Events will be parsed using custom schemas defined for the account.
         """
 
-        file_name = "ingest/schema_detection=AUTO/{}-{}.json".format(
+        return self.send_custom_encoded(self.encode(payload))
+
+    def encode(self, payload):
+        """
+        Encode a payload into the object contents, so it can be uploaded
+        (possibly many times) with `send_encoded` or `send_custom_encoded`.
+        """
+        return codec.encode(payload)
+
+    def send_encoded(self, data):
+        """
+        Same as `send`, but for a payload encoded with `encode`.
+        """
+        file_name = "{}-{}.json".format(
             uuid4(), datetime.now().strftime(r"%d-%b-%Y-%H-%M-%S-%f")
         )
 
-        return self._put_object(file_name, payload)
+        return self._put_object(file_name, data)
+
+    def send_custom_encoded(self, data):
+        """
+        Same as `send_custom`, but for a payload encoded with `encode`.
+        """
+        file_name = "ingest/schema_detection=AUTO/{}-{}.json".format(
+            uuid4(), datetime.now().strftime(r"%d-%b-%Y-%H-%M-%S-%f")
+        )
 
-    def _put_object(self, file_name, payload):
-        data = json.dumps(payload)
+        return self._put_object(file_name, data)
 
+    def _put_object(self, file_name, data):
         response = self.s3.Object(self.bucket_name, file_name).put(Body=data)
 
         # TODO celia 2024/8/27: Review error handling to access if check is necessary or should just throw exception
@@ -0,0 +1,442 @@
+import logging
+import mmap
+import os
+import shutil
+import struct
+import time
+import zlib
+from threading import Lock
+
+from metering import codec, validators
+
+# Record header: payload length, payload crc32, flags.
+_header = struct.Struct("<IIB")
+_cursor = struct.Struct("<QQ")
+
+_FLAG_CUSTOM = 1
+
+_fsync_policies = ("always", "segment", "never")
+
+# Subdirectories of the spools of forked processes (see `DiskSpool.for_child`),
+# and of those being replayed after their process is gone.
+_child_prefix = "pid-"
+_adopted_prefix = "adopted-"
+
+# How often (in seconds) the other spools sharing a directory are looked at.
+_scan_interval = 1
+
+
+def _is_alive(pid):
+    if not hasattr(os, "fork"):
+        return True  # no forked processes (and signal 0 means CTRL_C_EVENT)
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:  # e.g. not permitted, so it exists
+        pass
+    return True
+
+
+def _disk_usage(directory):
+    """
+    Returns the bytes taken by the segment files in the directory.
+    """
+    total = 0
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.name.endswith(DiskSpool.segment_suffix):
+                    try:
+                        total += entry.stat().st_size
+                    except OSError:  # deleted in the meantime
+                        pass
+    except OSError:
+        pass
+    return total
+
+
+class DiskSpool:
+    """
+    Durable, disk-backed, first-in-first-out store for batches of items that
+    could not be delivered.
+
+    Batches are appended to segment files in the given directory. Segments are
+    memory-mapped for reading and deleted once all their batches have been
+    acknowledged. The read position is persisted, so batches survive a
+    restart of the process (delivery is at least once: a batch might be
+    replayed again if the process crashes between sending and acknowledging
+    it).
+
+    The same spool instance can be shared by all the consumers of a producer,
+    for example:
+
+        create_ingest_client(api_key=..., spool=DiskSpool("/var/spool/amberflo"))
+
+    The current disk usage (in bytes) is available as `total_bytes`.
+
+    Forked processes spool to subdirectories of the directory (see
+    `for_child`), within the same `max_bytes`. The batches left by processes
+    that are gone are replayed by the spool of the directory itself (e.g.
+    that of the parent process).
+
+    This class is thread-safe.
+    """
+
+    segment_prefix = "segment-"
+    segment_suffix = ".spool"
+    cursor_name = "cursor"
+
+    def __init__(
+        self,
+        directory,
+        max_bytes=256 * 1024 * 1024,
+        segment_bytes=8 * 1024 * 1024,
+        fsync="segment",
+    ):
+        """
+        directory:
+            Where to keep the segment files. Created if it does not exist. It
+            should not be shared by different spools.
+
+        max_bytes:
+            Maximum disk usage (including the spools of forked processes). If
+            appending a batch would go over this limit, the batch is rejected.
+
+        segment_bytes:
+            Size after which a new segment file is started.
+
+        fsync:
+            When to force the written data to disk:
+            - "always": after every batch (safest, slowest);
+            - "segment": when a segment is complete;
+            - "never": leave it to the operating system.
+        """
+        validators.require_string("directory", directory, allow_none=False)
+        validators.require_positive_int("max_bytes", max_bytes, allow_none=False)
+        validators.require_positive_int(
+            "segment_bytes", segment_bytes, allow_none=False
+        )
+        validators.check(
+            fsync in _fsync_policies,
+            "'fsync' must be one of {}".format(_fsync_policies),
+        )
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.lock = Lock()
+
+        # Only one consumer at a time should replay the spooled batches.
+        self.replay_lock = Lock()
+
+        self.logger = logging.getLogger(__name__)
+
+        os.makedirs(directory, exist_ok=True)
+
+        self.segments = sorted(self._list_segments())
+        self.total_bytes = sum(os.path.getsize(self._path(s)) for s in self.segments)
+        self.read_segment, self.read_offset = self._load_cursor()
+        self.next_segment = max(
+            self.segments[-1] + 1 if self.segments else 0, self.read_segment
+        )
+        self.writer = None
+        self.reader = None
+        self.reader_segment = None
+
+        # The directory shared with the spools of forked processes (see
+        # `for_child`), and what is known about them.
+        self.root = directory
+        self.other_bytes = 0
+        self.next_scan_time = 0
+        self.orphan = None
+        self.next_adopt_time = 0
+
+    def append(self, batch, is_custom=False):
+        """
+        Durably stores a batch of items (which must be JSON serializable, or
+        `metering.codec.Fragment` instances). Returns whether it was stored or
+        not (i.e. the spool is full).
+        """
+        data = codec.encode(batch)
+        record = _header.pack(len(data), zlib.crc32(data), is_custom) + data
+
+        with self.lock:
+            if self.total_bytes + self._other_bytes() + len(record) > self.max_bytes:
+                self.logger.warning("Spool is full!")
+                return False
+
+            writer = self._writer()
+            writer.write(record)
+            writer.flush()
+            self.total_bytes += len(record)
+
+            if self.fsync == "always":
+                os.fsync(writer.fileno())
+
+            if writer.tell() >= self.segment_bytes:
+                self._close_writer()
+
+        return True
+
+    def peek(self):
+        """
+        Returns the oldest batch not yet acknowledged as a tuple
+        `(position, batch, is_custom)`, or None if the spool is empty.
+
+        Once it is empty, the batches left by forked processes that are gone
+        are returned (see `for_child`).
+        """
+        with self.lock:
+            entry = self._peek()
+
+        if entry is None and self.root == self.directory:
+            return self._peek_orphans()
+
+        return entry
+
+    def _peek(self):
+        while self.segments:
+            entry = self._read()
+            if entry is not None:
+                return entry
+            if not self._advance_segment():
+                return None
+
+        return None
+
+    def _peek_orphans(self):
+        while True:
+            if self.orphan is None:
+                self.orphan = self._adopt()
+                if self.orphan is None:
+                    return None
+
+            entry = self.orphan.peek()
+            if entry is not None:
+                position, batch, is_custom = entry
+                return (self.orphan, position), batch, is_custom
+
+            self.orphan.close()
+            shutil.rmtree(self.orphan.directory, ignore_errors=True)
+            self.logger.info("Replayed the spool of %s", self.orphan.directory)
+            self.orphan = None
+
+    def _adopt(self):
+        """
+        Returns the spool of a forked process that is gone (claiming it), or
+        None. Looks for one every `_scan_interval` seconds at most.
+        """
+        now = time.monotonic()
+        if now < self.next_adopt_time:
+            return None
+        self.next_adopt_time = now + _scan_interval
+
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+
+            if name.startswith(_child_prefix):
+                pid = name[len(_child_prefix) :]
+                if not pid.isdigit() or _is_alive(int(pid)):
+                    continue
+                adopted = os.path.join(self.directory, _adopted_prefix + pid)
+                try:
+                    os.rename(path, adopted)
+                except OSError:
+                    continue
+                path = adopted
+            elif not name.startswith(_adopted_prefix):
+                continue
+
+            orphan = DiskSpool(
+                path,
+                max_bytes=self.max_bytes,
+                segment_bytes=self.segment_bytes,
+                fsync=self.fsync,
+            )
+            orphan.root = self.directory
+            return orphan
+
+        return None
+
+    def ack(self, position):
+        """
+        Acknowledges the batch returned by `peek`, so it is not replayed again.
+        """
+        if len(position) == 2:  # of an adopted spool
+            orphan, position = position
+            orphan.ack(position)
+            return
+
+        segment, offset, size = position
+
+        with self.lock:
+            if segment != self.read_segment or offset != self.read_offset:
+                return
+
+            self.read_offset += size
+            self._save_cursor()
+
+    def close(self):
+        with self.lock:
+            self._close_writer()
+            self._close_reader()
+
+        if self.orphan is not None:
+            self.orphan.close()
+
+    def for_child(self):
+        """
+        Returns a new spool, with the same settings, in a subdirectory (of
+        the parent's directory) for the current process, e.g. to be used by
+        a forked child process instead of the spool inherited from its parent
+        (whose files and read position belong to the parent).
+
+        What is left in it once the process is gone is replayed by the spool
+        of the parent's directory.
+        """
+        child = DiskSpool(
+            os.path.join(self.root, _child_prefix + str(os.getpid())),
+            max_bytes=self.max_bytes,
+            segment_bytes=self.segment_bytes,
+            fsync=self.fsync,
+        )
+        child.root = self.root
+        return child
+
+    def _other_bytes(self):
+        """
+        Returns the bytes taken by the other spools sharing the directory
+        (see `for_child`), as of the last `_scan_interval` seconds at most.
+        """
+        now = time.monotonic()
+        if now < self.next_scan_time:
+            return self.other_bytes
+        self.next_scan_time = now + _scan_interval
+
+        directories = [self.root]
+        for name in os.listdir(self.root):
+            if name.startswith((_child_prefix, _adopted_prefix)):
+                directories.append(os.path.join(self.root, name))
+
+        self.other_bytes = sum(
+            _disk_usage(d) for d in directories if d != self.directory
+        )
+        return self.other_bytes
+
+    def _writer(self):
+        if self.writer is None:
+            segment = self.next_segment
+            self.next_segment += 1
+            self.segments.append(segment)
+            self.writer = open(self._path(segment), "ab")
+        return self.writer
+
+    def _close_writer(self):
+        if self.writer is None:
+            return
+
+        if self.fsync != "never":
+            os.fsync(self.writer.fileno())
+
+        self.writer.close()
+        self.writer = None
+
+    def _close_reader(self):
+        if self.reader is not None:
+            self.reader.close()
+        self.reader = None
+        self.reader_segment = None
+
+    def _map(self):
+        """
+        Returns the memory map of the segment being read, remapping it if it
+        has grown since.
+        """
+        path = self._path(self.read_segment)
+        size = os.path.getsize(path)
+
+        if self.reader is None or self.reader_segment != self.read_segment:
+            self._close_reader()
+        elif len(self.reader) >= size:
+            return self.reader
+        else:
+            self._close_reader()
+
+        if size == 0:
+            return None
+
+        with open(path, "rb") as f:
+            self.reader = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.reader_segment = self.read_segment
+        return self.reader
+
+    def _read(self):
+        if self.read_segment < self.segments[0]:
+            self.read_segment, self.read_offset = self.segments[0], 0
+
+        data = self._map()
+        offset = self.read_offset
+
+        if data is None or offset + _header.size > len(data):
+            return None
+
+        length, crc, flags = _header.unpack_from(data, offset)
+        start = offset + _header.size
+        payload = data[start : start + length]
+
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            # Incomplete (or corrupted) record, e.g. after a crash.
+            return None
+
+        batch = codec.loads(payload)
+        position = (self.read_segment, offset, _header.size + length)
+        return position, batch, bool(flags & _FLAG_CUSTOM)
+
+    def _advance_segment(self):
+        """
+        Deletes the segment being read if it is complete. Returns whether there
+        is a next segment to be read.
+        """
+        if self.writer is not None and self.read_segment == self.segments[-1]:
+            return False
+
+        self._close_reader()
+        segment = self.segments.pop(0)
+        path = self._path(segment)
+        self.total_bytes -= os.path.getsize(path)
+        os.remove(path)
+
+        self.read_segment, self.read_offset = segment + 1, 0
+        self._save_cursor()
+        return bool(self.segments)
+
+    def _list_segments(self):
+        for name in os.listdir(self.directory):
+            if name.startswith(self.segment_prefix) and name.endswith(
+                self.segment_suffix
+            ):
+                yield int(name[len(self.segment_prefix) : -len(self.segment_suffix)])
+
+    def _path(self, segment):
+        return os.path.join(
+            self.directory,
+            "{}{:020d}{}".format(self.segment_prefix, segment, self.segment_suffix),
+        )
+
+    def _load_cursor(self):
+        path = os.path.join(self.directory, self.cursor_name)
+        try:
+            with open(path, "rb") as f:
+                return _cursor.unpack(f.read(_cursor.size))
+        except (OSError, struct.error):
+            return (self.segments[0] if self.segments else 0), 0
+
+    def _save_cursor(self):
+        path = os.path.join(self.directory, self.cursor_name)
+        with open(path, "wb") as f:
+            f.write(_cursor.pack(self.read_segment, self.read_offset))
+            if self.fsync == "always":
+                os.fsync(f.fileno())
@@ -0,0 +1,106 @@
+"""
+This module generates the default unique ids of the meter records (see
+`metering.ingest.create_ingest_payload`), which the server uses to dedup
+them.
+
+By default, they are uuid4 values. A cheaper generator, such as a
+`SequentialIdGenerator`, can be plugged in with `use_unique_id_generator`.
+"""
+
+import itertools
+import os
+import time
+import weakref
+from threading import Lock
+from uuid import uuid4
+
+# Counter values per prefix, so that the ids have a fixed length.
+_max_count = 1 << 32
+
+
+def uuid4_id():
+    """
+    Returns a random (version 4) uuid, as a string.
+    """
+    return str(uuid4())
+
+
+_generate = uuid4_id
+
+
+def use_unique_id_generator(generate):
+    """
+    Replace the function that generates the default unique ids.
+
+    generate:
+        Function, callable from any thread, that returns a new globally
+        unique string on each call. If None, uuid4 values are used.
+    """
+    global _generate
+    _generate = generate or uuid4_id
+
+
+def new_unique_id():
+    """
+    Returns a new unique id, from the current generator.
+    """
+    return _generate()
+
+
+# Generators to reseed in forked child processes.
+_generators = weakref.WeakSet()
+
+
+def _reseed_after_fork():
+    for generator in list(_generators):
+        generator.lock = Lock()
+        generator.reseed()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reseed_after_fork)
+
+
+class SequentialIdGenerator:
+    """
+    Generates unique ids out of a prefix, made of the time (in milliseconds)
+    and 48 random bits, followed by a counter, as 32 hexadecimal characters.
+    For example, `018f2c3b9a10` `5e0c7d21a9b3` `0000002a`.
+
+    This is much cheaper than a uuid4 (which reads from `os.urandom` every
+    time), and the ids of a process are ordered by creation time. The prefix
+    is replaced when the counter runs out, and in forked child processes, so
+    ids are not repeated.
+
+    Use it with `use_unique_id_generator(SequentialIdGenerator())`. Instances
+    are thread-safe.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.reseed()
+        _generators.add(self)
+
+    def reseed(self):
+        """
+        Starts over with a new prefix.
+        """
+        prefix = "%012x%012x" % (
+            int(time.time() * 1000) & 0xFFFFFFFFFFFF,
+            int.from_bytes(os.urandom(6), "big"),
+        )
+        # A single attribute, so that each id is made of a prefix and a
+        # counter value of the same state.
+        self.state = (prefix, itertools.count())
+
+    def __call__(self):
+        prefix, counter = self.state
+        n = next(counter)
+
+        if n >= _max_count:
+            with self.lock:
+                if self.state[0] == prefix:
+                    self.reseed()
+            return self()
+
+        return "%s%08x" % (prefix, n)
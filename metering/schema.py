@@ -0,0 +1,154 @@
+"""
+This module validates records (i.e. payloads, as dictionaries) against
+schemas that are compiled once, e.g. to check a whole batch of records in a
+single pass that reports every invalid record, before it is sent.
+
+The checks are those of `metering.validators`, so, like them, they do not
+depend on `assert` statements (i.e. they still run with `python -O`).
+"""
+
+from metering import validators
+from metering.exceptions import ValidationError
+
+# The checks of a field. Each one is a function of the field name and its
+# (non-None) value, that returns an error message or None.
+
+string = validators.string_error
+positive_int = validators.positive_int_error
+positive_number = validators.positive_number_error
+string_list = validators.string_list_error
+string_dictionary = validators.string_dictionary_error
+string_list_dictionary = validators.string_list_dictionary_error
+
+
+def instance_of(data_type):
+    """
+    Returns a check that the value is of the type (or one of the types).
+    """
+
+    def check(name, value):
+        return validators.type_error(name, value, data_type)
+
+    return check
+
+
+number = instance_of((int, float))
+boolean = instance_of(bool)
+
+
+def one_of(values):
+    """
+    Returns a check that the value is one of the given ones (e.g. the values
+    of an `Enum`).
+    """
+    values = frozenset(values)
+    message = "{0!r} must be one of " + repr(sorted(values))
+
+    def check(name, value):
+        try:
+            if value in values:
+                return None
+        except TypeError:  # not hashable
+            pass
+        return message.format(name)
+
+    return check
+
+
+def nested(schema):
+    """
+    Returns a check that the value is a record of the (other) schema.
+    """
+
+    def check(name, value):
+        errors = schema.errors(value, name + ".")
+        return "; ".join(errors) if errors else None
+
+    return check
+
+
+class Schema:
+    """
+    The fields of a kind of record, and the check of each one, e.g.:
+
+        schema = Schema(
+            required={"meterApiName": string, "meterValue": number},
+            optional={"dimensions": string_dictionary},
+        )
+
+    The fields are compiled once into a flat list of checks, which is then
+    run for each record. Fields with a None value are treated as missing,
+    and fields not in the schema are ignored.
+    """
+
+    def __init__(self, required=None, optional=None):
+        """
+        required:
+            Dictionary of field name to check (see the functions of
+            `metering.schema`), of the fields that every record must have.
+
+        optional:
+            Same, for the fields that records may have.
+        """
+        self.fields = tuple(
+            [(name, check, True) for name, check in (required or {}).items()]
+            + [(name, check, False) for name, check in (optional or {}).items()]
+        )
+
+    def errors(self, record, prefix=""):
+        """
+        Returns the list of error messages of the record (empty if valid).
+
+        prefix:
+            Prepended to the field names, e.g. for nested records.
+        """
+        if not isinstance(record, dict):
+            name = prefix[:-1] or "record"
+            return [validators.type_error(name, record, dict)]
+
+        errors = []
+        get = record.get
+
+        for name, check, required in self.fields:
+            value = get(name)
+
+            if value is None:
+                if required:
+                    errors.append(validators.none_error(prefix + name))
+                continue
+
+            message = check(prefix + name, value)
+            if message is not None:
+                errors.append(message)
+
+        return errors
+
+    def validate(self, record):
+        """
+        Verifies that the record is valid. Raises a
+        `metering.exceptions.ValidationError` otherwise.
+        """
+        errors = self.errors(record)
+        if errors:
+            raise ValidationError("; ".join(errors), [(0, errors)])
+
+    def invalid(self, records):
+        """
+        Returns a list of (index, error messages) of the invalid records, in
+        order (empty if all of them are valid).
+        """
+        errors = self.errors
+        return [(i, e) for i, e in enumerate(map(errors, records)) if e]
+
+    def validate_many(self, records):
+        """
+        Verifies that all the records are valid. Raises a
+        `metering.exceptions.ValidationError` otherwise, whose `errors` are
+        the (index, error messages) of every invalid record.
+        """
+        invalid = self.invalid(records)
+        if invalid:
+            message = "{} invalid records, e.g. #{}: {}".format(
+                len(invalid), invalid[0][0], "; ".join(invalid[0][1])
+            )
+            raise ValidationError(message, invalid)
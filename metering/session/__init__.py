@@ -1,2 +1,3 @@
 from metering.session.api_session import ApiSession  # noqa
 from metering.session.ingest_session import IngestSession  # noqa
+from metering.session.async_ingest_session import AsyncIngestSession  # noqa
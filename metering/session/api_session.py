@@ -61,5 +61,6 @@ class ApiSession:
             raise ApiError(
                 response.status_code,
                 response.text,
+                response.headers,
             )
         return response.json()
@@ -0,0 +1,78 @@
+import logging
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from metering.version import USER_AGENT
+from metering.validators import require_string
+from metering.exceptions import ApiError
+from metering.session.ingest_session import _gzip
+
+
+class AsyncIngestSession:
+    """
+    This class is the `asyncio` counterpart of `IngestSession`, wrapping an
+    `aiohttp.ClientSession`. It handles:
+
+    - Standard headers (including authorization)
+    - Root URL for the APIs
+    - Processing responses (returning the raw text for good responses or an
+      exception for errors)
+    - Gzip-encoding the payloads
+    - Limiting the number of open connections
+
+    The underlying client session is created lazily, so that it is bound to the
+    running event loop.
+    """
+
+    root_url = "https://ingest.amberflo.io"
+
+    def __init__(self, api_key, max_connections=4):
+        require_string("api_key", api_key)
+
+        if not aiohttp:
+            raise ImportError("aiohttp is required to use the AsyncIngestSession")
+
+        self.headers = {
+            "Content-Type": "application/json",
+            "Accept": "application/json",
+            "X-API-KEY": api_key,
+            "Content-Encoding": "gzip",
+            "User-Agent": USER_AGENT,
+        }
+        self.max_connections = max_connections
+        self.session = None
+        self.logger = logging.getLogger(__name__)
+
+    def _get_session(self):
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections)
+            self.session = aiohttp.ClientSession(
+                headers=self.headers, connector=connector
+            )
+        return self.session
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def post(self, path, payload, params=None):
+        data = _gzip(payload)
+        session = self._get_session()
+        async with session.post(
+            self.root_url + path, data=data, params=params
+        ) as response:
+            text = await response.text()
+            return self._parse(response.status, text, response.headers)
+
+    def _parse(self, status_code, text, headers=None):
+        """
+        Returns the raw response or raise an exception on errors.
+        """
+        if status_code != 200:
+            self.logger.error("%s: %s", status_code, text)
+            raise ApiError(status_code, text, headers)
+        return text
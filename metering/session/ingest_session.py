@@ -1,15 +1,15 @@
-import json
 import logging
 from gzip import compress
 from requests import Session
 
+from metering import codec
 from metering.version import USER_AGENT
 from metering.validators import require_string
 from metering.exceptions import ApiError
 
 
 def _gzip(payload):
-    return compress(json.dumps(payload).encode())
+    return compress(codec.encode(payload))
 
 
 class IngestSession:
@@ -46,7 +46,23 @@ class IngestSession:
         self.session.close()
 
     def post(self, path, payload, params=None):
-        data = _gzip(payload)
+        return self.post_encoded(path, self.encode(payload), params=params)
+
+    def encode(self, payload):
+        """
+        Returns the request body for the payload, to be sent with
+        `post_encoded`.
+        """
+        return _gzip(payload)
+
+    def compress(self, data):
+        """
+        Returns the request body for the JSON `bytes`, to be sent with
+        `post_encoded`.
+        """
+        return compress(data)
+
+    def post_encoded(self, path, data, params=None):
         response = self.session.post(self.root_url + path, data=data, params=params)
         return self._parse(response)
 
@@ -59,5 +75,6 @@ class IngestSession:
             raise ApiError(
                 response.status_code,
                 response.text,
+                response.headers,
             )
         return response.text
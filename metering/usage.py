@@ -1,6 +1,6 @@
 from enum import Enum
 
-from metering import validators
+from metering import schema, validators
 from metering.session import ApiSession
 
 
@@ -172,6 +172,31 @@ def create_usage_query(
     return payload
 
 
+# The queries built by `create_usage_query` (see `metering.schema.Schema`).
+usage_query_schema = schema.Schema(
+    required={
+        "aggregation": schema.one_of(a.value for a in AggregationType),
+        "meterApiName": schema.string,
+        "timeGroupingInterval": schema.one_of(i.value for i in TimeGroupingInterval),
+        "timeRange": schema.nested(
+            schema.Schema(
+                required={"startTimeInSeconds": schema.positive_int},
+                optional={"endTimeInSeconds": schema.positive_int},
+            )
+        ),
+    },
+    optional={
+        "groupBy": schema.string_list,
+        "filter": schema.string_list_dictionary,
+        "take": schema.nested(
+            schema.Schema(
+                required={"limit": schema.positive_int, "isAscending": schema.boolean}
+            )
+        ),
+    },
+)
+
+
 def create_all_usage_query(
     time_grouping_interval,
     time_range,
@@ -1,101 +1,161 @@
 """
-This module contains functions that perform basic parameter validatorss.
+This module contains functions that perform basic parameter validations.
+
+They raise a `metering.exceptions.ValidationError` (an `AssertionError`)
+explicitly, so, unlike `assert` statements, they still run with `python -O`.
+
+The `*_error` functions return the error message for a (non-None) value, or
+None if it is valid. They are the checks used by `metering.schema`.
 """
 
+from metering.exceptions import ValidationError
 
-def require_string_dictionary(name, value, allow_none=True):
+
+def check(condition, message):
     """
-    Verifies that a given value is a dict[str,str].
+    Verifies that a condition holds, e.g. in place of an `assert` statement.
     """
-    require(name, value, dict, allow_none)
+    if not condition:
+        raise ValidationError(message)
 
-    if value is None:
-        return
 
-    key_name = name + ".<key>"
-    for k, v in value.items():
-        require_string(key_name, k, allow_none=False)
-        require_string(name + "." + k, v, allow_none=False)
+def require_string_dictionary(name, value, allow_none=True):
+    """
+    Verifies that a given value is a dict[str,str].
+    """
+    _require(name, value, allow_none, string_dictionary_error)
 
 
 def require_string_list_dictionary(name, value, allow_none=True):
     """
     Verifies that a given value is a dict[str,list[str]].
     """
-    require(name, value, dict, allow_none)
-
-    if value is None:
-        return
-
-    key_name = name + ".<key>"
-    for k, v in value.items():
-        require_string(key_name, k, allow_none=False)
-        require_string_list(name + "." + k, v, allow_none=False)
+    _require(name, value, allow_none, string_list_dictionary_error)
 
 
 def require_string_list(name, value, allow_none=True):
     """
     Verifies that a given value is a list[str].
     """
-    require(name, value, list, allow_none)
-
-    if value is None:
-        return
-
-    assert value, "{0!r} may not be an empty list".format(name)
-
-    for i, v in enumerate(value):
-        require_string("{}.{}".format(name, i), v, allow_none=False)
+    _require(name, value, allow_none, string_list_error)
 
 
 def require_string(name, value, allow_none=True):
     """
     Verifies that a given value is a non-empty, non-whitespace string.
     """
-    require(name, value, str, allow_none)
-
-    if value is None:
-        return
-
-    assert value and value.strip(), "{0!r} may not be an empty string".format(name)
+    _require(name, value, allow_none, string_error)
 
 
 def require_positive_int(name, value, allow_none=True):
     """
     Verifies that a given value is a positive integer.
     """
-    require(name, value, int, allow_none)
-
-    if value is None:
-        return
-
-    assert value > 0, "{0!r} must be 1 or greater".format(name)
+    _require(name, value, allow_none, positive_int_error)
 
 
 def require_positive_number(name, value, allow_none=True):
     """
     Verifies that a given value is a positive number (integer or float).
     """
-    require(name, value, (int, float), allow_none)
-
-    if value is None:
-        return
-
-    assert value > 0, "{0!r} must be greater than 0".format(name)
+    _require(name, value, allow_none, positive_number_error)
 
 
 def require(name, value, data_type, allow_none=True):
     """
     Verifies that a given value is of the provided data_type (or a sub class of it).
     """
+    if value is None:
+        if not allow_none:
+            raise ValidationError(none_error(name))
+        return
 
-    assert value is not None or allow_none, "{0!r} may not be None".format(name)
+    if not isinstance(value, data_type):
+        raise ValidationError(type_error(name, value, data_type))
 
+
+def _require(name, value, allow_none, error):
     if value is None:
+        if not allow_none:
+            raise ValidationError(none_error(name))
         return
 
-    assert isinstance(value, data_type), "{0!r} must be {1}, but is: {2}".format(
-        name,
-        data_type,
-        value.__class__,
-    )
+    message = error(name, value)
+    if message is not None:
+        raise ValidationError(message)
+
+
+def none_error(name):
+    return "{0!r} may not be None".format(name)
+
+
+def type_error(name, value, data_type):
+    if isinstance(value, data_type):
+        return None
+    return "{0!r} must be {1}, but is: {2}".format(name, data_type, value.__class__)
+
+
+def string_error(name, value):
+    if not isinstance(value, str):
+        return type_error(name, value, str)
+    if not value.strip():
+        return "{0!r} may not be an empty string".format(name)
+    return None
+
+
+def positive_int_error(name, value):
+    if not isinstance(value, int):
+        return type_error(name, value, int)
+    if value <= 0:
+        return "{0!r} must be 1 or greater".format(name)
+    return None
+
+
+def positive_number_error(name, value):
+    if not isinstance(value, (int, float)):
+        return type_error(name, value, (int, float))
+    if value <= 0:
+        return "{0!r} must be greater than 0".format(name)
+    return None
+
+
+def string_list_error(name, value):
+    if not isinstance(value, list):
+        return type_error(name, value, list)
+    if not value:
+        return "{0!r} may not be an empty list".format(name)
+
+    for i, v in enumerate(value):
+        message = _item_error("{}.{}".format(name, i), v, string_error)
+        if message is not None:
+            return message
+
+    return None
+
+
+def string_dictionary_error(name, value):
+    return _dictionary_error(name, value, string_error)
+
+
+def string_list_dictionary_error(name, value):
+    return _dictionary_error(name, value, string_list_error)
+
+
+def _dictionary_error(name, value, value_error):
+    if not isinstance(value, dict):
+        return type_error(name, value, dict)
+
+    for k, v in value.items():
+        message = _item_error(name + ".<key>", k, string_error)
+        if message is None:
+            message = _item_error(name + "." + k, v, value_error)
+        if message is not None:
+            return message
+
+    return None
+
+
+def _item_error(name, value, error):
+    if value is None:
+        return none_error(name)
+    return error(name, value)
@@ -52,7 +52,10 @@ def lambda_handler(records, context):  # noqa: C901
 
             client.send(record)
 
-    client.shutdown()
+    # Leave some time to spare before the lambda times out.
+    timeout = context.get_remaining_time_in_millis() / 1000 - 2
+    report = client.shutdown(timeout=max(0, timeout), extra_threads=2)
+    print("INFO: Shutdown report {}".format(report))
 
     return ""
 
@@ -51,7 +51,8 @@ def main():
     )
     records = cur.fetchall()
 
-    # 3. ingest the events
+    # 3. ingest the events (all at once)
+    events = []
     for record in records:
         completed_at = record["completed_at"].replace(tzinfo=timezone.utc)
 
@@ -65,7 +66,10 @@ def main():
                 "host_name": record["host_name"],
             },
         )
-        client.send(event)
+        events.append(event)
+
+    accepted, rejected = client.send_many(events)
+    print("Accepted {} events, rejected {}".format(accepted, rejected))
 
     # 4. close postgres connection
     cur.close()
@@ -30,6 +30,12 @@ extras_require = {
     "s3": [
         "boto3",  # https://boto3.amazonaws.com/v1/documentation/api/latest/index.html
     ],
+    "async": [
+        "aiohttp",  # https://docs.aiohttp.org/
+    ],
+    "orjson": [
+        "orjson",  # https://github.com/ijl/orjson
+    ],
     "openai": [
         "openai",  # https://platform.openai.com/docs/api-reference/introduction
     ],
@@ -0,0 +1,45 @@
+import os
+import unittest
+from time import time
+
+from metering.ingest import (
+    AsyncIngestApiClient,
+    create_ingest_payload,
+)
+
+API_KEY = os.environ.get("TEST_API_KEY")
+
+
+@unittest.skipIf(API_KEY is None, "Needs Amberflo's API key")
+class TestAsyncIngestApiClient(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.client = AsyncIngestApiClient(API_KEY)
+
+        timestamp = int(round(time() * 1000))
+
+        self.meters = [
+            create_ingest_payload(
+                meter_api_name="my meter",
+                meter_value=1.2,
+                meter_time_in_millis=timestamp + 10 * i,
+                customer_id="123",
+            )
+            for i in range(10)
+        ]
+
+    async def asyncTearDown(self):
+        await self.client.close()
+
+    async def test_can_send_many_meters(self):
+        response = await self.client.send(self.meters)
+        self.assertEqual(response, "{} records were ingested".format(len(self.meters)))
+
+    async def test_can_send_many_meters_custom(self):
+        custom_meters = [
+            {"customerId": m["customerId"], "created": m["meterTimeInMillis"]}
+            for m in self.meters
+        ]
+        response = await self.client.send_custom(custom_meters)
+        self.assertEqual(
+            response, "{} records were ingested".format(len(custom_meters))
+        )
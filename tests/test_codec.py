@@ -0,0 +1,49 @@
+import json
+import unittest
+from unittest.mock import patch
+
+from metering import codec
+
+
+class TestCodec(unittest.TestCase):
+    def test_dumps_and_loads(self):
+        obj = {"a": [1, 2.5, "x", None, True], "b": {"c": "ü"}}
+
+        data = codec.dumps(obj)
+
+        self.assertIsInstance(data, bytes)
+        self.assertEqual(codec.loads(data), obj)
+        self.assertEqual(json.loads(data), obj)
+
+    def test_standard_library_fallback(self):
+        self.assertEqual(codec._json_dumps({"a": [1, 2]}), b'{"a":[1,2]}')
+
+    def test_fragment_is_serialized_once(self):
+        fragment = codec.fragment({"a": 1})
+
+        self.assertIsInstance(fragment, codec.Fragment)
+        self.assertIs(codec.fragment(fragment), fragment)
+
+    def test_encode_list_joins_fragments(self):
+        payload = [codec.fragment({"a": 1}), {"b": 2}, "c"]
+
+        self.assertEqual(json.loads(codec.encode(payload)), [{"a": 1}, {"b": 2}, "c"])
+        self.assertEqual(codec.encode([]), b"[]")
+
+    def test_encode_single_object(self):
+        self.assertEqual(json.loads(codec.encode({"a": 1})), {"a": 1})
+        self.assertEqual(codec.encode(codec.fragment({"a": 1})), codec.dumps({"a": 1}))
+
+    def test_non_serializable_object(self):
+        with self.assertRaises(TypeError):
+            codec.dumps(object())
+
+    def test_use_json_codec(self):
+        def dumps(obj):
+            return b'"custom"'
+
+        with patch.object(codec, "_dumps"), patch.object(codec, "_loads"):
+            codec.use_json_codec(dumps, json.loads)
+            # Lists without fragments are serialized in a single call.
+            self.assertEqual(codec.encode([1, 2]), b'"custom"')
+            self.assertEqual(codec.encode([codec.Fragment(b"1"), 2]), b'[1,"custom"]')
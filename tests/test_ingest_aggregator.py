@@ -0,0 +1,149 @@
+import unittest
+from time import sleep
+
+from metering.ingest import create_ingest_payload
+from metering.ingest.aggregator import MeterAggregator
+from metering.usage import AggregationType
+
+
+def _payload(value=1, meter="my-meter", customer="c1", time=1619445706000, **kw):
+    return create_ingest_payload(
+        meter_api_name=meter,
+        meter_value=value,
+        meter_time_in_millis=time,
+        customer_id=customer,
+        **kw
+    )
+
+
+class TestMeterAggregator(unittest.TestCase):
+    def setUp(self):
+        self.aggregator = MeterAggregator(
+            interval_in_secs=60,
+            aggregations={
+                "count-meter": AggregationType.COUNT,
+                "min-meter": AggregationType.MIN,
+                "max-meter": AggregationType.MAX,
+            },
+        )
+
+    def test_folds_records_with_same_key_and_bucket(self):
+        for i in range(10):
+            self.assertTrue(self.aggregator.add(_payload(i, time=1619445660000 + i)))
+
+        [record] = self.aggregator.drain(force=True)
+
+        self.assertEqual(record["meterValue"], sum(range(10)))
+        self.assertEqual(record["meterTimeInMillis"], 1619445660000)
+        self.assertEqual(record["meterApiName"], "my-meter")
+        self.assertEqual(record["customerId"], "c1")
+        self.assertNotIn("dimensions", record)
+        self.assertEqual(len(self.aggregator), 0)
+
+    def test_aggregation_types(self):
+        expected = {"count-meter": 5, "min-meter": 1, "max-meter": 5}
+
+        for meter in expected:
+            for i in range(1, 6):
+                self.aggregator.add(_payload(i, meter=meter))
+
+        records = self.aggregator.drain(force=True)
+
+        self.assertEqual(
+            {r["meterApiName"]: r["meterValue"] for r in records}, expected
+        )
+
+    def test_does_not_fold_different_keys(self):
+        self.aggregator.add(_payload(customer="c1"))
+        self.aggregator.add(_payload(customer="c2"))
+        self.aggregator.add(_payload(meter="other"))
+        self.aggregator.add(_payload(dimensions={"region": "us"}))
+        self.aggregator.add(_payload(dimensions={"region": "eu"}))
+        self.aggregator.add(_payload(time=1619445706000 + 60000))
+
+        self.assertEqual(len(self.aggregator.drain(force=True)), 6)
+
+    def test_dimensions_order_does_not_matter(self):
+        self.aggregator.add(_payload(dimensions={"a": "1", "b": "2"}))
+        self.aggregator.add(_payload(dimensions={"b": "2", "a": "1"}))
+
+        [record] = self.aggregator.drain(force=True)
+
+        self.assertEqual(record["meterValue"], 2)
+        self.assertEqual(record["dimensions"], {"a": "1", "b": "2"})
+
+    def test_unique_id_is_deterministic(self):
+        payloads = [_payload(unique_id="id-{}".format(i)) for i in range(3)]
+
+        for p in payloads:
+            self.aggregator.add(p)
+        [first] = self.aggregator.drain(force=True)
+
+        for p in payloads:
+            self.aggregator.add(p)
+        [second] = self.aggregator.drain(force=True)
+
+        self.aggregator.add(payloads[0])
+        [third] = self.aggregator.drain(force=True)
+
+        self.assertEqual(first["uniqueId"], second["uniqueId"])
+        self.assertNotEqual(first["uniqueId"], third["uniqueId"])
+
+    def test_skips_repeated_unique_ids(self):
+        payload = _payload(5)
+
+        self.assertTrue(self.aggregator.add(payload))
+        self.assertTrue(self.aggregator.add(payload))
+        self.aggregator.add(_payload(2))
+        [record] = self.aggregator.drain(force=True)
+
+        self.assertEqual(record["meterValue"], 7)
+
+    def test_remembers_the_latest_unique_ids_only(self):
+        for i in range(1000):
+            self.aggregator.add(_payload(unique_id="id-{}".format(i)))
+        self.aggregator.add(_payload(unique_id="id-999"))
+
+        [entry] = self.aggregator.records.values()
+        self.assertEqual(len(entry.recent), 16)
+        self.assertEqual(entry.count, 1000)
+
+    def test_unique_id_without_unique_ids(self):
+        payloads = [
+            {k: v for k, v in _payload(value).items() if k != "uniqueId"}
+            for value in (3, 7)
+        ]
+
+        self.aggregator.add(payloads[0])
+        [first] = self.aggregator.drain(force=True)
+        self.aggregator.add(payloads[1])
+        [second] = self.aggregator.drain(force=True)
+
+        self.assertNotEqual(first["uniqueId"], second["uniqueId"])
+
+    def test_does_not_fold_other_payloads(self):
+        self.assertFalse(self.aggregator.add(1))
+        self.assertFalse(self.aggregator.add({"customerId": "c1"}))
+
+    def test_only_folds_listed_meters_without_default(self):
+        aggregator = MeterAggregator(
+            aggregations={"my-meter": AggregationType.SUM}, default_aggregation=None
+        )
+
+        self.assertTrue(aggregator.add(_payload()))
+        self.assertFalse(aggregator.add(_payload(meter="other")))
+
+    def test_rejects_new_records_beyond_limit(self):
+        aggregator = MeterAggregator(max_records=1)
+
+        self.assertTrue(aggregator.add(_payload()))
+        self.assertTrue(aggregator.add(_payload()))
+        self.assertFalse(aggregator.add(_payload(customer="c2")))
+
+    def test_drain_waits_for_interval(self):
+        aggregator = MeterAggregator(interval_in_secs=0.05)
+        aggregator.add(_payload())
+
+        self.assertEqual(aggregator.drain(), [])
+        sleep(0.06)
+        self.assertEqual(len(aggregator.drain()), 1)
@@ -0,0 +1,214 @@
+import asyncio
+import unittest
+from unittest.mock import Mock
+
+from metering.exceptions import ApiError
+from metering.ingest import AsyncProducer, create_async_ingest_client
+from metering.ingest import AsyncIngestApiClient
+
+
+def _dummy_delay(*args, **kwargs):
+    while True:
+        yield 0.01
+
+
+class _DummyBackend:
+    def __init__(self):
+        self.batches = []
+        self.custom_batches = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.error = None
+        self.calls = 0
+
+    async def send(self, payload):
+        await self._work()
+        self.batches.append(payload)
+
+    async def send_custom(self, payload):
+        await self._work()
+        self.custom_batches.append(payload)
+
+    async def _work(self):
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        if self.error:
+            raise self.error
+
+
+class TestAsyncProducer(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.client = AsyncProducer(
+            {},
+            _DummyBackend,
+            max_queue_size=100,
+            max_in_flight=2,
+            batch_size=10,
+            send_interval_in_secs=0.05,
+            retries=2,
+            backoff_delay=_dummy_delay,
+        )
+
+    async def test_shutdown_after_sending_some_items(self):
+        for i in range(95):
+            self.assertTrue(self.client.send(i))
+
+        await self.client.shutdown()
+
+        sent = [i for batch in self.client.backend.batches for i in batch]
+        self.assertEqual(sorted(sent), list(range(95)))
+        self.assertTrue(all(len(b) <= 10 for b in self.client.backend.batches))
+        self.assertTrue(self.client.queue.empty())
+
+    async def test_shutdown_after_sending_some_items_custom(self):
+        for i in range(95):
+            self.assertTrue(self.client.send_custom(i))
+
+        await self.client.shutdown()
+
+        sent = [i for batch in self.client.backend.custom_batches for i in batch]
+        self.assertEqual(sorted(sent), list(range(95)))
+        self.assertTrue(self.client.custom_queue.empty())
+
+    async def test_respects_max_in_flight(self):
+        for i in range(100):
+            self.client.send(i)
+
+        await self.client.flush()
+
+        self.assertEqual(self.client.backend.max_in_flight, 2)
+        await self.client.join()
+
+    async def test_join_without_flush(self):
+        for i in range(90):
+            self.client.send(i)
+
+        await self.client.join()
+
+        self.assertFalse(self.client.queue.empty())
+
+    async def test_empty_shutdown(self):
+        # does not raise
+        await self.client.shutdown()
+
+    async def test_meter(self):
+        self.assertTrue(
+            self.client.meter(
+                meter_api_name="my-meter",
+                meter_value=1,
+                meter_time_in_millis=1619445706909,
+                customer_id="my-customer",
+            )
+        )
+
+        await self.client.shutdown()
+
+        [[record]] = self.client.backend.batches
+        self.assertEqual(record["meterApiName"], "my-meter")
+
+
+class TestAsyncProducerQueueIsFull(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.client = AsyncProducer({}, _DummyBackend, max_queue_size=1)
+
+    async def asyncTearDown(self):
+        await self.client.join()
+
+    async def test_full_queue(self):
+        self.client.send(0)  # picked up by the batching task
+        await asyncio.sleep(0)
+
+        self.assertTrue(self.client.send(1))
+        self.assertFalse(self.client.send(2))
+
+    async def test_full_queue_custom(self):
+        self.client.send_custom(0)
+        await asyncio.sleep(0)
+
+        self.assertTrue(self.client.send_custom(1))
+        self.assertFalse(self.client.send_custom(2))
+
+    async def test_send_wait_times_out(self):
+        client = AsyncProducer(
+            {}, _DummyBackend, max_queue_size=1, batch_size=1, max_in_flight=1
+        )
+
+        client.send(0)  # being sent
+        await asyncio.sleep(0)
+        client.send(1)  # waiting to be sent
+        await asyncio.sleep(0)
+        client.send(2)  # in the queue
+
+        self.assertFalse(await client.send_wait(3, timeout=0.001))
+        await client.join()
+
+
+class TestAsyncProducerBackpressure(unittest.IsolatedAsyncioTestCase):
+    async def test_send_wait_waits_for_room(self):
+        client = AsyncProducer(
+            {}, _DummyBackend, max_queue_size=1, batch_size=1, max_in_flight=1
+        )
+
+        for i in range(10):
+            self.assertTrue(await client.send_wait(i, timeout=1))
+
+        await client.shutdown()
+
+        sent = [i for batch in client.backend.batches for i in batch]
+        self.assertEqual(sent, list(range(10)))
+
+
+class TestAsyncProducerWithErrorCallback(unittest.IsolatedAsyncioTestCase):
+    async def test_error_callback_is_called_after_retries(self):
+        on_error_callback = Mock(return_value=None)
+        error = ApiError(500, "internal server error")
+
+        client = AsyncProducer(
+            {},
+            _DummyBackend,
+            batch_size=10,
+            send_interval_in_secs=0.01,
+            on_error=on_error_callback,
+            retries=2,
+            backoff_delay=_dummy_delay,
+        )
+        for i in range(10):
+            client.send(i)
+        client.backend.error = error
+
+        await client.shutdown()
+
+        self.assertEqual(client.backend.calls, 3)
+        on_error_callback.assert_called_once_with(error, list(range(10)))
+
+    async def test_does_not_retry_on_api_error_400(self):
+        on_error_callback = Mock(return_value=None)
+        error = ApiError(400, "bad request")
+
+        client = AsyncProducer(
+            {},
+            _DummyBackend,
+            send_interval_in_secs=0.01,
+            on_error=on_error_callback,
+            backoff_delay=_dummy_delay,
+        )
+        client.send_custom(1)
+        client.backend.error = error
+
+        await client.shutdown()
+
+        self.assertEqual(client.backend.calls, 1)
+        on_error_callback.assert_called_once_with(error, [1])
+
+
+class TestCreateAsyncIngestClient(unittest.IsolatedAsyncioTestCase):
+    async def test_create_api_client(self):
+        client = create_async_ingest_client(api_key="foo", max_in_flight=3)
+        client.send({})
+        self.assertIsInstance(client.backend, AsyncIngestApiClient)
+        self.assertEqual(client.backend.client.max_connections, 3)
+        await client.join()
+        await client.backend.close()
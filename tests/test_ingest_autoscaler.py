@@ -0,0 +1,56 @@
+import unittest
+
+from metering.ingest.autoscaler import Autoscaler
+from metering.ingest.backend_pool import BackendPool
+
+
+class TestAutoscaler(unittest.TestCase):
+    def setUp(self):
+        self.autoscaler = Autoscaler(
+            max_threads=4, queue_depth=100, queue_age_in_secs=1, idle_in_secs=10
+        )
+
+    def test_scales_up_on_queue_depth(self):
+        self.assertEqual(self.autoscaler.decide(2, 1, 100, 0, 0), 1)
+
+    def test_scales_up_on_queue_age(self):
+        self.assertEqual(self.autoscaler.decide(2, 1, 5, 1.5, 0), 1)
+
+    def test_does_not_go_over_max_threads(self):
+        self.assertEqual(self.autoscaler.decide(4, 1, 1000, 5, 0), 0)
+
+    def test_scales_down_when_idle(self):
+        self.assertEqual(self.autoscaler.decide(2, 1, 0, 0, 10), -1)
+
+    def test_does_not_go_under_min_threads(self):
+        self.assertEqual(self.autoscaler.decide(1, 1, 0, 0, 60), 0)
+
+    def test_does_not_scale_down_with_a_backlog(self):
+        self.assertEqual(self.autoscaler.decide(4, 1, 1000, 0, 60), 0)
+
+    def test_invalid_parameters(self):
+        self.assertRaises(AssertionError, Autoscaler, max_threads=0)
+        self.assertRaises(AssertionError, Autoscaler, idle_in_secs=-1)
+
+
+class TestBackendPool(unittest.TestCase):
+    def test_reuses_released_backends(self):
+        pool = BackendPool(dict, {"api_key": "key"})
+
+        a = pool.acquire()
+        b = pool.acquire()
+        self.assertIsNot(a, b)
+        self.assertEqual(a, {"api_key": "key"})
+
+        pool.release(a)
+        self.assertEqual(len(pool), 1)
+        self.assertIs(pool.acquire(), a)
+        self.assertEqual(pool.created, 2)
+
+    def test_max_idle(self):
+        pool = BackendPool(dict, {}, max_idle=1)
+
+        pool.release(pool.acquire())
+        pool.release({})
+
+        self.assertEqual(len(pool), 1)
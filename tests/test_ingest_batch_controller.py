@@ -0,0 +1,66 @@
+import unittest
+
+from metering.exceptions import ApiError
+from metering.ingest.batch_controller import AdaptiveBatchController
+
+
+class TestAdaptiveBatchController(unittest.TestCase):
+    def setUp(self):
+        self.controller = AdaptiveBatchController(
+            batch_size=100,
+            min_batch_size=10,
+            max_batch_size=130,
+            batch_size_step=10,
+            send_interval_in_secs=0.5,
+            min_send_interval_in_secs=0.1,
+            max_send_interval_in_secs=2,
+            target_latency_in_secs=1,
+        )
+
+    def test_grows_batch_size_additively_on_fast_full_batches(self):
+        for expected in [110, 120, 130, 130]:
+            self.controller.record(self.controller.batch_size, 0.1, 0)
+            self.assertEqual(self.controller.batch_size, expected)
+
+    def test_does_not_grow_batch_size_on_incomplete_batches(self):
+        self.controller.record(50, 0.1, 0)
+        self.assertEqual(self.controller.batch_size, 100)
+
+    def test_shrinks_batch_size_multiplicatively_on_slow_requests(self):
+        for expected in [50, 25, 12, 10]:
+            self.controller.record(self.controller.batch_size, 2, 0)
+            self.assertEqual(self.controller.batch_size, expected)
+
+    def test_backs_off_send_interval_when_throttled(self):
+        for expected in [1, 2, 2]:
+            self.controller.record(100, 0.1, 0, ApiError(429, "rate limited"))
+            self.assertEqual(self.controller.send_interval, expected)
+
+        self.assertEqual(self.controller.batch_size, 100)
+        self.assertEqual(self.controller.settings()["throttled"], 3)
+
+        # recovers slowly
+        self.controller.record(10, 0.1, 0)
+        self.assertLess(self.controller.send_interval, 2)
+        self.assertGreater(self.controller.send_interval, 0.5)
+
+    def test_shortens_send_interval_with_backlog(self):
+        for expected in [0.25, 0.125, 0.1]:
+            self.controller.record(10, 0.1, 1000)
+            self.assertEqual(self.controller.send_interval, expected)
+
+        # recovers slowly
+        self.controller.record(10, 0.1, 0)
+        self.assertAlmostEqual(self.controller.send_interval, 0.2)
+
+    def test_settings(self):
+        self.controller.record(10, 0.3, 0)
+        self.assertEqual(
+            self.controller.settings(),
+            {
+                "batch_size": 100,
+                "send_interval_in_secs": 0.5,
+                "last_latency_in_secs": 0.3,
+                "throttled": 0,
+            },
+        )
@@ -0,0 +1,129 @@
+import unittest
+from threading import Thread
+from time import sleep
+
+from metering.ingest.batch_queue import BatchQueue
+from metering.ingest.doorbell import Doorbell
+
+
+class TestBatchQueue(unittest.TestCase):
+    def test_put_many_within_capacity(self):
+        queue = BatchQueue(10)
+
+        self.assertEqual(queue.put_many(range(5)), 5)
+
+        self.assertEqual(queue.qsize(), 5)
+        self.assertEqual(queue.unfinished_tasks, 5)
+        self.assertEqual([queue.get() for _ in range(5)], list(range(5)))
+
+    def test_put_many_beyond_capacity(self):
+        queue = BatchQueue(3)
+        queue.put("x")
+
+        self.assertEqual(queue.put_many(range(5)), 2)
+        self.assertEqual([queue.get() for _ in range(3)], ["x", 0, 1])
+
+    def test_put_many_all_or_nothing(self):
+        queue = BatchQueue(3)
+
+        self.assertEqual(queue.put_many(range(5), all_or_nothing=True), 0)
+        self.assertTrue(queue.empty())
+        self.assertEqual(queue.put_many(range(3), all_or_nothing=True), 3)
+
+    def test_put_many_unbounded(self):
+        queue = BatchQueue()
+
+        self.assertEqual(queue.put_many(range(1000)), 1000)
+
+    def test_put_many_wakes_up_consumers(self):
+        queue = BatchQueue()
+        results = []
+
+        threads = [Thread(target=lambda: results.append(queue.get())) for _ in range(3)]
+        for t in threads:
+            t.start()
+
+        queue.put_many(range(3))
+
+        for t in threads:
+            t.join(1)
+        self.assertEqual(sorted(results), [0, 1, 2])
+
+    def test_put_evicting(self):
+        queue = BatchQueue(2)
+
+        self.assertEqual(queue.put_evicting(0), [])
+        self.assertEqual(queue.put_evicting(1), [])
+        self.assertEqual(queue.put_evicting(2), [0])
+
+        self.assertEqual(queue.unfinished_tasks, 2)
+        self.assertEqual([queue.get(), queue.get()], [1, 2])
+
+    def test_join_with_timeout(self):
+        queue = BatchQueue()
+        queue.put(1)
+
+        self.assertFalse(queue.join(timeout=0.01))
+
+        queue.get()
+        queue.task_done()
+
+        self.assertTrue(queue.join(timeout=0.01))
+
+    def test_put_rings_doorbell(self):
+        doorbell = Doorbell()
+        queue = BatchQueue(doorbell=doorbell)
+
+        queue.put(1)
+        queue.put_many([2, 3])
+        queue.put_many([])
+
+        self.assertEqual(doorbell.seq, 2)
+
+
+class TestDoorbell(unittest.TestCase):
+    def test_wait_returns_at_once_if_rung_since(self):
+        doorbell = Doorbell()
+        seq = doorbell.seq
+        doorbell.ring()
+
+        self.assertEqual(doorbell.wait(seq, timeout=10), seq + 1)
+
+    def test_wait_times_out(self):
+        doorbell = Doorbell()
+
+        self.assertEqual(doorbell.wait(doorbell.seq, timeout=0.01), 0)
+
+    def test_ring_wakes_up_waiters(self):
+        doorbell = Doorbell()
+        results = []
+
+        t = Thread(target=lambda: results.append(doorbell.wait(0, timeout=10)))
+        t.start()
+        doorbell.ring()
+        t.join(1)
+
+        self.assertEqual(results, [1])
+
+    def test_ring_wakes_up_one_waiter_or_everyone(self):
+        doorbell = Doorbell()
+        results = []
+
+        def wait():
+            results.append(doorbell.wait(0, timeout=10))
+
+        threads = [Thread(target=wait) for _ in range(2)]
+        for t in threads:
+            t.start()
+        while doorbell.waiters < 2:
+            sleep(0.001)
+
+        doorbell.ring()
+        sleep(0.1)
+        self.assertEqual(len(results), 1)
+
+        doorbell.ring(everyone=True)
+        for t in threads:
+            t.join(1)
+        self.assertEqual(len(results), 2)
+        self.assertEqual(doorbell.waiters, 0)
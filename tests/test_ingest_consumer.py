@@ -1,9 +1,19 @@
+import json
+import tempfile
 import unittest
+from time import sleep
 from unittest.mock import patch, Mock
 from queue import Queue
 
+from metering import codec
 from metering.exceptions import ApiError
+from metering.ingest.batch_queue import BatchQueue
 from metering.ingest.consumer import ThreadedConsumer, backoff_delay
+from metering.ingest.doorbell import Doorbell
+from metering.ingest.rate_limiter import RateLimiter
+from metering.ingest.retry_scheduler import RetryScheduler
+from metering.ingest.spool import DiskSpool
+from metering.ingest.batch_controller import AdaptiveBatchController
 
 
 def _dummy_delay(*args, **kwargs):
@@ -227,6 +237,570 @@ class TestIngestThreadedConsumerWithErrorCallback(unittest.TestCase):
         self.on_error_callback.assert_not_called()
 
 
+class _PickyBackend:
+    """
+    Rejects the batches that hold any of the bad items, with a client error.
+    """
+
+    def __init__(self, bad=(), error=ApiError(400, "bad request")):
+        self.bad = set(bad)
+        self.error = error
+        self.requests = 0
+        self.sent = []
+
+    def send(self, batch):
+        self.requests += 1
+        if self.bad.intersection(batch):
+            raise self.error
+        self.sent.extend(batch)
+
+
+class TestIngestThreadedConsumerBisection(unittest.TestCase):
+    def _consume(self, backend, items, **kwargs):
+        queue = Queue()
+        for i in items:
+            queue.put(i)
+
+        on_error = Mock(return_value=None)
+        consumer = ThreadedConsumer(
+            queue,
+            Queue(),
+            backend,
+            retries=2,
+            batch_size=100,
+            send_interval_in_secs=0,
+            on_error=on_error,
+            backoff_delay=_dummy_delay,
+            bisect_failed_batches=True,
+            **kwargs
+        )
+        consumer.consume()
+        return on_error
+
+    def test_sends_all_but_the_bad_records(self):
+        backend = _PickyBackend(bad={3, 70})
+        on_error = self._consume(backend, range(100))
+
+        self.assertEqual(
+            sorted(backend.sent), [i for i in range(100) if i not in (3, 70)]
+        )
+        self.assertEqual(
+            sorted(c.args[1] for c in on_error.call_args_list), [[3], [70]]
+        )
+        self.assertLessEqual(backend.requests, 1 + 2 * 2 * 7)
+
+    def test_bounds_the_number_of_requests(self):
+        backend = _PickyBackend(bad=range(64))
+        on_error = self._consume(backend, range(64))
+
+        self.assertEqual(backend.sent, [])
+        self.assertEqual(
+            sorted(i for c in on_error.call_args_list for i in c.args[1]),
+            list(range(64)),
+        )
+        self.assertLessEqual(backend.requests, 1 + 2 * 7 * 4 + 1)
+
+    def test_does_not_bisect_on_retriable_errors(self):
+        backend = _PickyBackend(bad={3}, error=ApiError(500, "internal server error"))
+        on_error = self._consume(backend, range(10))
+
+        self.assertEqual(backend.requests, 3)
+        on_error.assert_called_once_with(backend.error, list(range(10)))
+
+    def test_with_retry_scheduler(self):
+        backend = _PickyBackend(bad={5})
+        on_error = self._consume(
+            backend, range(10), retry_scheduler=RetryScheduler(max_items=100)
+        )
+
+        self.assertEqual(len(backend.sent), 9)
+        on_error.assert_called_once_with(backend.error, [5])
+
+
+class TestIngestThreadedConsumerWithSpool(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.queue = Queue()
+        self.custom_queue = Queue()
+        self.on_error_callback = Mock(return_value=None)
+        self.spool = DiskSpool(self.tmp.name)
+        self.consumer = ThreadedConsumer(
+            self.queue,
+            self.custom_queue,
+            _DummyBackend(),
+            retries=1,
+            batch_size=10,
+            send_interval_in_secs=0.1,
+            on_error=self.on_error_callback,
+            backoff_delay=_dummy_delay,
+            spool=self.spool,
+            replay_interval_in_secs=60,
+        )
+
+    def tearDown(self):
+        self.spool.close()
+        self.tmp.cleanup()
+
+    def test_spools_failed_batch_and_replays_it(self):
+        for i in range(5):
+            self.queue.put(i)
+            self.custom_queue.put(i)
+
+        with patch.object(_DummyBackend, "send") as mock_send, patch.object(
+            _DummyBackend, "send_custom"
+        ) as mock_send_custom:
+            mock_send.side_effect = ApiError(500, "internal server error")
+            mock_send_custom.side_effect = ApiError(503, "unavailable")
+            self.assertEqual(self.consumer.consume(), -5)
+            self.assertEqual(self.consumer.consume_custom(), -5)
+
+        self.on_error_callback.assert_not_called()
+
+        with patch.object(_DummyBackend, "send") as mock_send, patch.object(
+            _DummyBackend, "send_custom"
+        ) as mock_send_custom:
+            self.assertEqual(self.consumer.replay(), 5)
+            self.assertEqual(self.consumer.replay(), 5)
+            self.assertEqual(self.consumer.replay(), 0)
+
+            mock_send.assert_called_once_with(list(range(5)))
+            mock_send_custom.assert_called_once_with(list(range(5)))
+
+    def test_does_not_spool_non_retriable_errors(self):
+        self.queue.put(1)
+        error = ApiError(400, "bad request")
+
+        with patch.object(_DummyBackend, "send") as mock_send:
+            mock_send.side_effect = error
+            self.consumer.consume()
+
+        self.on_error_callback.assert_called_once_with(error, [1])
+        self.assertEqual(self.consumer.replay(), 0)
+
+    def test_waits_before_replaying_again_after_failure(self):
+        self.spool.append([1])
+
+        with patch.object(_DummyBackend, "send") as mock_send:
+            mock_send.side_effect = Exception("still down")
+            self.assertEqual(self.consumer.replay(), -1)
+            self.assertEqual(self.consumer.replay(), 0)
+            self.assertEqual(mock_send.call_count, 1)
+
+        self.on_error_callback.assert_not_called()
+
+    def test_drops_replayed_batch_on_non_retriable_error(self):
+        self.spool.append([1])
+        error = ApiError(400, "bad request")
+
+        with patch.object(_DummyBackend, "send") as mock_send:
+            mock_send.side_effect = error
+            self.assertEqual(self.consumer.replay(), -1)
+
+        self.on_error_callback.assert_called_once_with(error, [1])
+        self.assertIsNone(self.spool.peek())
+
+
+def _no_delay(*args, **kwargs):
+    while True:
+        yield 0
+
+
+class TestIngestThreadedConsumerWithRetryScheduler(unittest.TestCase):
+    def setUp(self):
+        self.queue = Queue()
+        self.custom_queue = Queue()
+        self.on_error_callback = Mock(return_value=None)
+        self.scheduler = RetryScheduler()
+        self.consumer = ThreadedConsumer(
+            self.queue,
+            self.custom_queue,
+            _DummyBackend(),
+            retries=2,
+            batch_size=10,
+            send_interval_in_secs=0.01,
+            on_error=self.on_error_callback,
+            backoff_delay=_no_delay,
+            retry_scheduler=self.scheduler,
+        )
+
+    def test_failed_batch_is_scheduled_without_blocking(self):
+        self.queue.put(1)
+        self.queue.put(2)
+
+        with patch.object(_DummyBackend, "send") as mock_send:
+            mock_send.side_effect = [ApiError(503, "unavailable"), None]
+
+            self.assertEqual(self.consumer.consume(), -2)
+            self.assertEqual(len(self.scheduler), 1)
+            self.assertEqual(self.queue.unfinished_tasks, 2)
+
+            self.assertEqual(self.consumer.retry(), 2)
+            self.assertEqual(mock_send.call_count, 2)
+
+        self.assertEqual(self.queue.unfinished_tasks, 0)
+        self.on_error_callback.assert_not_called()
+
+    def test_gives_up_after_all_attempts(self):
+        self.custom_queue.put(1)
+        error = Exception("still down")
+
+        with patch.object(_DummyBackend, "send_custom") as mock_send:
+            mock_send.side_effect = error
+
+            self.assertEqual(self.consumer.consume_custom(), -1)
+            self.assertEqual(self.consumer.retry(), -1)
+            self.assertEqual(self.consumer.retry(), -1)
+            self.assertEqual(self.consumer.retry(), 0)
+            self.assertEqual(mock_send.call_count, 3)
+
+        self.on_error_callback.assert_called_once_with(error, [1])
+        self.assertEqual(self.custom_queue.unfinished_tasks, 0)
+
+    def test_does_not_schedule_non_retriable_errors(self):
+        self.queue.put(1)
+        error = ApiError(400, "bad request")
+
+        with patch.object(_DummyBackend, "send") as mock_send:
+            mock_send.side_effect = error
+            self.consumer.consume()
+
+        self.assertEqual(len(self.scheduler), 0)
+        self.on_error_callback.assert_called_once_with(error, [1])
+
+    def test_gives_up_if_scheduler_is_full(self):
+        self.scheduler.max_batches = 1
+        self.scheduler.schedule("other", 1, 1, None, 60)
+        self.queue.put(1)
+        error = Exception("down")
+
+        with patch.object(_DummyBackend, "send") as mock_send:
+            mock_send.side_effect = error
+            self.consumer.consume()
+
+        self.on_error_callback.assert_called_once_with(error, [1])
+
+    def test_scheduled_batches_are_given_up_on_join(self):
+        self.consumer.backoff_delay = _dummy_delay
+        self.consumer.start()
+        error = Exception("down")
+
+        with patch.object(_DummyBackend, "send") as mock_send:
+            mock_send.side_effect = error
+            self.queue.put(1)
+            sleep(0.1)
+            self.consumer.join()
+
+        self.on_error_callback.assert_called_once_with(error, [1])
+        self.assertEqual(self.queue.unfinished_tasks, 0)
+
+
+class TestIngestThreadedConsumerWithRateLimiter(unittest.TestCase):
+    def test_requests_go_through_the_rate_limiter(self):
+        queue = Queue()
+        limiter = RateLimiter()
+        consumer = ThreadedConsumer(
+            queue,
+            Queue(),
+            _DummyBackend(),
+            retries=1,
+            send_interval_in_secs=0.01,
+            backoff_delay=_no_delay,
+            rate_limiter=limiter,
+        )
+        queue.put(1)
+
+        with patch.object(_DummyBackend, "send") as mock_send, patch.object(
+            limiter, "acquire"
+        ) as mock_acquire:
+            error = ApiError(429, "rate limited", {"Retry-After": "0"})
+            mock_send.side_effect = [error, None]
+
+            self.assertEqual(consumer.consume(), 1)
+            self.assertEqual(mock_acquire.call_count, 2)
+
+        self.assertEqual(limiter.state()["throttled"], 1)
+
+
+class TestIngestThreadedConsumerByteBudget(unittest.TestCase):
+    def setUp(self):
+        self.queue = Queue()
+        self.on_error_callback = Mock(return_value=None)
+
+    def _consumer(self, **kwargs):
+        return ThreadedConsumer(
+            self.queue,
+            Queue(),
+            _DummyBackend(),
+            batch_size=100,
+            send_interval_in_secs=0.1,
+            on_error=self.on_error_callback,
+            backoff_delay=_dummy_delay,
+            **kwargs
+        )
+
+    def test_stops_at_target_bytes(self):
+        consumer = self._consumer(batch_target_bytes=50)
+
+        for i in range(20):
+            self.queue.put("x" * 8)  # 11 bytes each, serialized in a batch
+
+        with patch.object(_DummyBackend, "send") as mock_send:
+            self.assertEqual(consumer.consume(), 5)
+            mock_send.assert_called_once_with(["x" * 8] * 5)
+
+    def test_never_exceeds_max_bytes(self):
+        consumer = self._consumer(batch_max_bytes=50)
+
+        for size in [10, 10, 10, 20, 10]:
+            self.queue.put("x" * size)
+
+        with patch.object(_DummyBackend, "send") as mock_send:
+            consumer.consume()
+            consumer.consume()
+            batches = [c[0][0] for c in mock_send.call_args_list]
+
+        self.assertEqual(batches, [["x" * 10] * 3, ["x" * 20, "x" * 10]])
+        for batch in batches:
+            self.assertLessEqual(len(json.dumps(batch)), 50)
+        self.assertEqual(self.queue.unfinished_tasks, 0)
+
+    def test_rejects_item_larger_than_max_bytes(self):
+        consumer = self._consumer(batch_max_bytes=50)
+
+        self.queue.put("x" * 100)
+        self.queue.put("y")
+
+        with patch.object(_DummyBackend, "send") as mock_send:
+            self.assertEqual(consumer.consume(), 1)
+            mock_send.assert_called_once_with(["y"])
+
+        [(error, batch)] = [c[0] for c in self.on_error_callback.call_args_list]
+        self.assertIsInstance(error, ValueError)
+        self.assertEqual(batch, ["x" * 100])
+        self.assertEqual(self.queue.unfinished_tasks, 0)
+
+    def test_carried_over_item_is_sent_when_stopped(self):
+        doorbell = Doorbell()
+        lanes = {
+            "polling": (Queue(), Queue()),
+            "event-driven": (
+                BatchQueue(doorbell=doorbell),
+                BatchQueue(doorbell=doorbell),
+            ),
+        }
+
+        for name, (queue, custom_queue) in lanes.items():
+            with self.subTest(name):
+                backend = Mock(spec=_DummyBackend)
+                consumer = ThreadedConsumer(
+                    queue, custom_queue, backend, batch_max_bytes=50
+                )
+
+                # Stops while sending the first batch, after taking the second
+                # item, which does not fit in it.
+                backend.send.side_effect = lambda p: setattr(consumer, "running", False)
+                queue.put("x" * 30)
+                queue.put("y" * 30)
+
+                consumer.start()
+                consumer.join()
+
+                batches = [c[0][0] for c in backend.send.call_args_list]
+                self.assertEqual(batches, [["x" * 30], ["y" * 30]])
+                self.assertEqual(queue.unfinished_tasks, 0)
+
+
+class TestIngestThreadedConsumerWithBatchController(unittest.TestCase):
+    def setUp(self):
+        self.queue = Queue()
+        self.controller = AdaptiveBatchController(batch_size=5, min_batch_size=2)
+        self.consumer = ThreadedConsumer(
+            self.queue,
+            Queue(),
+            _DummyBackend(),
+            retries=1,
+            batch_size=100,
+            send_interval_in_secs=0.1,
+            backoff_delay=_dummy_delay,
+            batch_controller=self.controller,
+        )
+
+    def test_uses_and_tunes_the_controller_batch_size(self):
+        for i in range(20):
+            self.queue.put(i)
+
+        self.assertEqual(self.consumer.consume(), 5)
+        self.assertEqual(self.controller.batch_size, 15)
+
+    def test_reports_every_attempt(self):
+        self.queue.put(1)
+
+        with patch.object(_DummyBackend, "send") as mock_send:
+            mock_send.side_effect = ApiError(429, "rate limited")
+            self.consumer.consume()
+
+        self.assertEqual(self.controller.settings()["throttled"], 2)
+
+
+class _EncodingBackend:
+    def __init__(self):
+        self.events = []
+        self.sent = []
+        self.failures = 0
+
+    def encode(self, payload):
+        self.events.append(("encode", codec.loads(codec.encode(payload[:1]))[0]))
+        return codec.encode(payload)
+
+    def send_encoded(self, data):
+        self.events.append(("start", json.loads(data)[0]))
+        sleep(0.05)
+        self.events.append(("end", json.loads(data)[0]))
+        if self.failures:
+            self.failures -= 1
+            raise ApiError(500, "internal server error")
+        self.sent.append(json.loads(data))
+
+    def send_custom_encoded(self, data):
+        self.sent.append(json.loads(data))
+
+
+class TestIngestThreadedConsumerEncodedBatches(unittest.TestCase):
+    def test_encodes_once_for_all_attempts(self):
+        queue = Queue()
+        backend = _EncodingBackend()
+        backend.failures = 2
+        consumer = ThreadedConsumer(
+            queue,
+            Queue(),
+            backend,
+            retries=2,
+            send_interval_in_secs=0.01,
+            backoff_delay=_dummy_delay,
+        )
+
+        queue.put(1)
+
+        self.assertEqual(consumer.consume(), 1)
+        self.assertEqual([e for e, _ in backend.events].count("encode"), 1)
+        self.assertEqual(backend.sent, [[1]])
+
+    def test_pipeline_encodes_next_batch_while_sending(self):
+        queue = Queue()
+        custom_queue = Queue()
+        backend = _EncodingBackend()
+        consumer = ThreadedConsumer(
+            queue,
+            custom_queue,
+            backend,
+            batch_size=1,
+            send_interval_in_secs=0.01,
+            sleep_interval_in_secs=0.01,
+            backoff_delay=_dummy_delay,
+            pipeline_depth=2,
+        )
+
+        for i in range(3):
+            queue.put(i)
+        custom_queue.put("custom")
+
+        consumer.start()
+        queue.join()
+        custom_queue.join()
+        consumer.join()
+
+        self.assertIn([2], backend.sent)
+        self.assertIn(["custom"], backend.sent)
+        # the second batch was encoded before the first one finished sending
+        self.assertLess(
+            backend.events.index(("encode", 1)), backend.events.index(("end", 0))
+        )
+
+    def test_join_sends_batches_already_in_the_pipeline(self):
+        queue = Queue()
+        backend = _EncodingBackend()
+        consumer = ThreadedConsumer(
+            queue,
+            Queue(),
+            backend,
+            batch_size=1,
+            send_interval_in_secs=0.01,
+            backoff_delay=_dummy_delay,
+            pipeline_depth=2,
+        )
+        consumer.start()
+
+        for i in range(2):
+            queue.put(i)
+        sleep(0.03)
+
+        consumer.join()
+
+        self.assertEqual(backend.sent, [[0], [1]])
+        self.assertEqual(queue.unfinished_tasks, 0)
+
+    def test_join_more_than_once(self):
+        consumer = ThreadedConsumer(
+            Queue(), Queue(), _EncodingBackend(), pipeline_depth=1
+        )
+        consumer.start()
+
+        for _ in range(3):
+            consumer.join()
+
+        self.assertFalse(consumer.sender.is_alive())
+
+
+class TestIngestThreadedConsumerFragments(unittest.TestCase):
+    def test_reuses_serialized_items(self):
+        queue = Queue()
+        backend = _EncodingBackend()
+        consumer = ThreadedConsumer(
+            queue,
+            Queue(),
+            backend,
+            send_interval_in_secs=0.01,
+            batch_max_bytes=1000,
+            backoff_delay=_dummy_delay,
+        )
+
+        queue.put({"a": 1})
+        queue.put(codec.fragment({"b": 2}))
+
+        with patch.object(codec, "_dumps", wraps=codec._dumps) as mock_dumps:
+            with patch.object(_EncodingBackend, "encode") as mock_encode:
+                mock_encode.side_effect = codec.encode
+                consumer.consume()
+
+            # only the item that was not serialized yet
+            mock_dumps.assert_called_once_with({"a": 1})
+
+        self.assertEqual(backend.sent, [[{"a": 1}, {"b": 2}]])
+
+    def test_rejects_items_that_cannot_be_serialized(self):
+        queue = Queue()
+        on_error_callback = Mock(return_value=None)
+        consumer = ThreadedConsumer(
+            queue,
+            Queue(),
+            _DummyBackend(),
+            send_interval_in_secs=0.01,
+            batch_target_bytes=1000,
+            on_error=on_error_callback,
+            backoff_delay=_dummy_delay,
+        )
+
+        queue.put(object())
+        queue.put(1)
+
+        with patch.object(_DummyBackend, "send") as mock_send:
+            self.assertEqual(consumer.consume(), 1)
+            mock_send.assert_called_once_with([1])
+
+        on_error_callback.assert_called_once()
+        self.assertEqual(queue.unfinished_tasks, 0)
+
+
 class TestIngestThreadedConsumerShortSendInterval(unittest.TestCase):
     def test_respects_send_interval_even_if_queue_has_items(self):
         queue = Queue()
@@ -267,6 +841,65 @@ class TestIngestThreadedConsumerShortSendInterval(unittest.TestCase):
         self.assertLess(n, 10000)
 
 
+class TestIngestThreadedConsumerEventDriven(unittest.TestCase):
+    def setUp(self):
+        self.doorbell = Doorbell()
+        self.queue = BatchQueue(doorbell=self.doorbell)
+        self.custom_queue = BatchQueue(doorbell=self.doorbell)
+        self.backend = Mock(spec=_DummyBackend)
+        self.consumer = ThreadedConsumer(
+            self.queue,
+            self.custom_queue,
+            self.backend,
+            batch_size=10,
+            send_interval_in_secs=0.2,
+            backoff_delay=_dummy_delay,
+        )
+        self.consumer.start()
+
+    def tearDown(self):
+        self.consumer.join()
+
+    def test_full_batch_is_sent_without_waiting(self):
+        self.queue.put_many(range(10))
+
+        self.queue.join()
+
+        self.backend.send.assert_called_once_with(list(range(10)))
+
+    def test_incomplete_batch_is_sent_after_send_interval(self):
+        self.queue.put(1)
+
+        sleep(0.1)
+        self.backend.send.assert_not_called()
+
+        self.queue.join()
+        self.backend.send.assert_called_once_with([1])
+
+    def test_both_queues_are_collected_at_once(self):
+        self.queue.put(1)
+        self.custom_queue.put(2)
+
+        sleep(0.3)
+
+        self.backend.send.assert_called_once_with([1])
+        self.backend.send_custom.assert_called_once_with([2])
+
+    def test_idle_consumer_waits_for_doorbell(self):
+        with patch.object(self.consumer, "_step") as mock_step:
+            sleep(0.3)
+
+        self.assertEqual(mock_step.call_count, 0)
+
+    def test_pending_batch_is_sent_when_stopped(self):
+        self.custom_queue.put(1)
+        sleep(0.05)
+
+        self.consumer.join()
+
+        self.backend.send_custom.assert_called_once_with([1])
+
+
 class TestBackoffDelay(unittest.TestCase):
     def test_default_backoff_delay(self):
         expected = [None, 2, 6, 12, 20, 40, 80, 80]
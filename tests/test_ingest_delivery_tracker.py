@@ -0,0 +1,44 @@
+import unittest
+from unittest.mock import Mock
+
+from metering.ingest.delivery_tracker import DeliveryTracker, new_future
+
+
+class TestDeliveryTracker(unittest.TestCase):
+    def test_resolves_tracked_items(self):
+        tracker = DeliveryTracker()
+        first, second = {"id": 1}, {"id": 2}
+        on_delivery = Mock()
+        futures = [new_future(on_delivery), new_future()]
+
+        tracker.track(first, futures[0])
+        tracker.track(second, futures[1])
+        self.assertEqual(len(tracker), 2)
+
+        tracker.resolve([first, {"id": 3}])
+        self.assertEqual(futures[0].result(), "sent")
+        on_delivery.assert_called_once_with(futures[0])
+        self.assertFalse(futures[1].done())
+
+        error = ValueError("bad record")
+        tracker.resolve([second], error=error)
+        self.assertIs(futures[1].exception(), error)
+        self.assertEqual(len(tracker), 0)
+
+    def test_same_item_tracked_twice(self):
+        tracker = DeliveryTracker()
+        item = {"id": 1}
+        futures = [new_future(), new_future()]
+
+        for future in futures:
+            tracker.track(item, future)
+
+        tracker.resolve([item], "spooled")
+        self.assertEqual(futures[0].result(), "spooled")
+        self.assertFalse(futures[1].done())
+
+        tracker.resolve([item])
+        self.assertEqual(futures[1].result(), "sent")
+
+    def test_futures_cannot_be_cancelled(self):
+        self.assertFalse(new_future().cancel())
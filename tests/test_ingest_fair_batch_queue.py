@@ -0,0 +1,99 @@
+import unittest
+from queue import Full
+
+from metering.ingest.doorbell import Doorbell
+from metering.ingest.fair_batch_queue import FairBatchQueue
+
+
+def _item(customer, n):
+    return {"customerId": customer, "n": n}
+
+
+class TestFairBatchQueue(unittest.TestCase):
+    def test_takes_turns_between_keys(self):
+        queue = FairBatchQueue()
+        queue.put_many([_item("noisy", n) for n in range(5)])
+        queue.put(_item("quiet", 0))
+        queue.put(_item("other", 0))
+
+        items = [queue.get() for _ in range(7)]
+
+        self.assertEqual(
+            [(i["customerId"], i["n"]) for i in items],
+            [
+                ("noisy", 0),
+                ("quiet", 0),
+                ("other", 0),
+                ("noisy", 1),
+                ("noisy", 2),
+                ("noisy", 3),
+                ("noisy", 4),
+            ],
+        )
+        self.assertTrue(queue.empty())
+
+    def test_quota_per_key(self):
+        queue = FairBatchQueue(max_size_per_key=2)
+        queue.put(_item("noisy", 0))
+        queue.put(_item("noisy", 1))
+
+        self.assertRaises(Full, queue.put, _item("noisy", 2))
+        queue.put(_item("quiet", 0))
+
+        self.assertEqual(queue.depth("noisy"), 2)
+        self.assertEqual(queue.depth("quiet"), 1)
+        self.assertEqual(queue.qsize(), 3)
+
+    def test_put_many_rejects_per_key(self):
+        queue = FairBatchQueue(max_size_per_key=2)
+        items = [_item("noisy", n) for n in range(4)] + [_item("quiet", 0)]
+
+        self.assertEqual(queue.put_many(items), 3)
+        self.assertEqual(queue.depth("noisy"), 2)
+        self.assertEqual(queue.depth("quiet"), 1)
+
+        self.assertEqual(queue.put_many([_item("quiet", 1)] * 2, True), 0)
+        self.assertEqual(queue.depth("quiet"), 1)
+
+    def test_maxsize(self):
+        queue = FairBatchQueue(3)
+
+        self.assertEqual(queue.put_many([_item("a", 0), _item("b", 0)]), 2)
+        self.assertEqual(queue.put_many([_item("c", 0), _item("d", 0)]), 1)
+        self.assertRaises(Full, queue.put, _item("e", 0), block=False)
+
+    def test_put_evicting_over_quota(self):
+        queue = FairBatchQueue(max_size_per_key=2)
+        queue.put_many([_item("noisy", 0), _item("noisy", 1), _item("quiet", 0)])
+
+        self.assertEqual(queue.put_evicting(_item("noisy", 2)), [_item("noisy", 0)])
+        self.assertEqual(queue.put_evicting(_item("quiet", 1)), [])
+        self.assertEqual(queue.unfinished_tasks, 4)
+
+    def test_put_evicting_when_full(self):
+        queue = FairBatchQueue(3)
+        queue.put_many([_item("noisy", 0), _item("noisy", 1), _item("quiet", 0)])
+
+        self.assertEqual(queue.put_evicting(_item("other", 0)), [_item("noisy", 0)])
+        self.assertEqual(queue.depth("other"), 1)
+        self.assertEqual(queue.qsize(), 3)
+
+    def test_explicit_keys(self):
+        queue = FairBatchQueue(key=lambda item: item[0])
+        queue.put_many([b"1", b"2"], keys=["a", "a"])
+        queue.put(b"3", key="b")
+
+        self.assertEqual([queue.get() for _ in range(3)], [b"1", b"3", b"2"])
+
+    def test_tracks_enqueue_times(self):
+        doorbell = Doorbell()
+        queue = FairBatchQueue(doorbell=doorbell)
+        self.assertEqual(queue.age(), 0)
+
+        queue.put(_item("a", 0))
+
+        self.assertEqual(doorbell.seq, 1)
+        self.assertGreaterEqual(queue.age(), 0)
+        queue.get()
+        self.assertIsNotNone(queue.last_enqueued_at)
+        self.assertEqual(queue.age(), 0)
@@ -0,0 +1,115 @@
+import unittest
+from queue import Full
+from threading import Thread
+from time import sleep
+from unittest.mock import patch
+
+from metering import codec
+from metering.ingest.batch_queue import BatchQueue
+from metering.ingest.fair_batch_queue import FairBatchQueue
+from metering.ingest.memory_budget import MemoryBudget, serialized_size
+
+
+class TestMemoryBudget(unittest.TestCase):
+    def test_reserve_and_release(self):
+        budget = MemoryBudget(10)
+
+        self.assertTrue(budget.reserve(6))
+        self.assertFalse(budget.reserve(6))
+        budget.release(6)
+        self.assertTrue(budget.reserve(10))
+        self.assertEqual(budget.used, 10)
+
+    def test_wait(self):
+        budget = MemoryBudget(10)
+        budget.reserve(10)
+
+        self.assertFalse(budget.wait(5, timeout=0.01))
+        self.assertFalse(budget.wait(11))
+
+        Thread(target=lambda: (sleep(0.02), budget.release(5))).start()
+        self.assertTrue(budget.wait(5, timeout=2))
+
+    def test_serialized_size(self):
+        self.assertEqual(serialized_size({"a": 1}), len(b'{"a":1}'))
+        self.assertEqual(serialized_size(codec.fragment([1, 2])), len(b"[1,2]"))
+
+    def test_invalid_max_bytes(self):
+        self.assertRaises(AssertionError, MemoryBudget, 0)
+
+
+class TestBatchQueueWithMemoryBudget(unittest.TestCase):
+    def setUp(self):
+        self.budget = MemoryBudget(10, measure=len)
+
+    def test_budget_is_shared_by_queues(self):
+        queue = BatchQueue(budget=self.budget)
+        custom_queue = BatchQueue(budget=self.budget)
+
+        queue.put("aaaaaa")
+        self.assertRaises(Full, custom_queue.put, "bbbbbb", block=False)
+        custom_queue.put("bbbb")
+
+        self.assertEqual((queue.bytes, custom_queue.bytes), (6, 4))
+
+        queue.get()
+        custom_queue.put("bbbbbb")
+        self.assertEqual(self.budget.used, 10)
+
+    def test_blocking_put_waits_for_bytes(self):
+        queue = BatchQueue(budget=self.budget)
+        queue.put("a" * 10)
+
+        self.assertRaises(Full, queue.put, "b", timeout=0.01)
+
+        Thread(target=lambda: (sleep(0.02), queue.get())).start()
+        queue.put("b", timeout=2)
+
+        self.assertEqual(queue.bytes, 1)
+
+    def test_put_many_within_budget(self):
+        queue = BatchQueue(budget=self.budget)
+
+        self.assertEqual(queue.put_many(["aaaa", "bbbbbbbb", "cccc"]), 2)
+        self.assertEqual(list(queue.queue), ["aaaa", "cccc"])
+
+        self.assertEqual(queue.put_many(["dd", "eee"], all_or_nothing=True), 0)
+        self.assertEqual(self.budget.used, 8)
+
+    def test_put_evicting_makes_room_in_bytes(self):
+        queue = BatchQueue(budget=self.budget)
+        queue.put_many(["aaaa", "bbbb"])
+
+        self.assertEqual(queue.put_evicting("cccccccc"), ["aaaa", "bbbb"])
+        self.assertEqual(queue.unfinished_tasks, 1)
+        self.assertRaises(Full, queue.put_evicting, "d" * 11)
+
+    def test_put_evicting_does_not_evict_in_vain(self):
+        queue = BatchQueue(budget=self.budget)
+        custom_queue = BatchQueue(budget=self.budget)
+        queue.put("aaaa")
+        custom_queue.put("bbbbbb")
+
+        self.assertRaises(Full, queue.put_evicting, "cccccc")
+        self.assertEqual(list(queue.queue), ["aaaa"])
+
+    def test_put_evicting_returns_items_evicted_in_vain(self):
+        queue = BatchQueue(budget=self.budget)
+        queue.put_many(["aaaa", "bbbb"])
+
+        # The bytes are taken by another queue while evicting.
+        with patch.object(self.budget, "reserve", return_value=False):
+            with self.assertRaises(Full) as raised:
+                queue.put_evicting("cccc")
+
+        self.assertEqual(raised.exception.evicted, ["aaaa", "bbbb"])
+        self.assertEqual(queue.unfinished_tasks, 0)
+
+    def test_fair_queue(self):
+        queue = FairBatchQueue(key=lambda item: item[0], budget=self.budget)
+        queue.put_many(["aaaa", "aaaa", "bb"])
+
+        self.assertEqual(queue.put_evicting("cccc"), ["aaaa"])
+        self.assertEqual(queue.bytes, 10)
+        self.assertEqual(queue.get(), "aaaa")
+        self.assertEqual(self.budget.used, 6)
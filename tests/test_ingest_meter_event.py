@@ -0,0 +1,78 @@
+import json
+import tracemalloc
+import unittest
+from uuid import uuid4
+
+from metering import codec
+from metering.ingest import MeterEvent, create_ingest_payload
+from metering.ingest.aggregator import MeterAggregator
+from metering.ingest.fair_batch_queue import FairBatchQueue
+
+_args = ("my-meter", 1.5, 1700000000000, "customer-1")
+_dimensions = {"region": "us-west-2"}
+
+
+class TestMeterEvent(unittest.TestCase):
+    def test_same_payload_as_the_dictionary_form(self):
+        unique_id = str(uuid4())
+        event = MeterEvent(*_args, dimensions=_dimensions, unique_id=unique_id)
+
+        self.assertEqual(
+            event.to_payload(),
+            create_ingest_payload(*_args, dimensions=_dimensions, unique_id=unique_id),
+        )
+
+    def test_unique_id_is_generated_once(self):
+        event = MeterEvent(*_args)
+        self.assertIsNone(event._unique_id)
+
+        unique_id = event.unique_id
+
+        self.assertEqual(len(unique_id), 36)
+        self.assertEqual(event.to_payload()["uniqueId"], unique_id)
+        self.assertNotIn("dimensions", event.to_payload())
+
+    def test_validation(self):
+        with self.assertRaises(AssertionError):
+            MeterEvent(None, 1, 1700000000000, "customer-1")
+
+        with self.assertRaises(AssertionError):
+            MeterEvent(*_args, dimensions={"a": 1})
+
+    def test_dictionary_access(self):
+        event = MeterEvent(*_args)
+
+        self.assertEqual(event["customerId"], "customer-1")
+        self.assertEqual(event.get("meterValue"), 1.5)
+        self.assertIn("meterApiName", event)
+        self.assertNotIn("dimensions", event)
+        self.assertIsNone(event.get("dimensions"))
+        self.assertRaises(KeyError, lambda: event["other"])
+
+    def test_serialization(self):
+        events = [MeterEvent(*_args), MeterEvent(*_args, dimensions=_dimensions)]
+
+        for encode in (codec.encode, lambda b: codec.join(map(codec.fragment, b))):
+            batch = json.loads(encode(events))
+            self.assertEqual(batch, [e.to_payload() for e in events])
+
+    def test_aggregation_and_fair_queueing(self):
+        aggregator = MeterAggregator(60)
+        self.assertTrue(aggregator.add(MeterEvent(*_args)))
+        self.assertTrue(aggregator.add(create_ingest_payload(*_args)))
+        self.assertEqual(aggregator.drain(force=True)[0]["meterValue"], 3)
+
+        queue = FairBatchQueue()
+        queue.put(MeterEvent(*_args))
+        self.assertEqual(queue.depth("customer-1"), 1)
+
+    def test_takes_less_memory(self):
+        def measure(create):
+            tracemalloc.start()
+            events = [create(*_args) for _ in range(1000)]
+            size = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            self.assertEqual(len(events), 1000)
+            return size
+
+        self.assertLess(measure(MeterEvent) * 2, measure(create_ingest_payload))
@@ -0,0 +1,86 @@
+import unittest
+from threading import Thread
+
+from metering.ingest.histogram import Histogram
+from metering.ingest.metrics import ProducerMetrics, to_openmetrics
+
+
+class TestHistogram(unittest.TestCase):
+    def test_cumulative_buckets(self):
+        histogram = Histogram((1, 10))
+
+        for value in (0.5, 1, 5, 50):
+            histogram.observe(value)
+
+        snapshot = histogram.snapshot()
+
+        self.assertEqual(snapshot["buckets"], [(1, 2), (10, 3), (float("inf"), 4)])
+        self.assertEqual(snapshot["sum"], 56.5)
+        self.assertEqual(snapshot["count"], 4)
+
+
+class TestProducerMetrics(unittest.TestCase):
+    def test_counters_per_lane(self):
+        metrics = ProducerMetrics()
+
+        metrics.count("enqueued", n=3)
+        metrics.count("enqueued", is_custom=True)
+        metrics.count("dropped")
+
+        stats = metrics.snapshot()
+
+        self.assertEqual(stats["regular"]["enqueued"], 3)
+        self.assertEqual(stats["regular"]["dropped"], 1)
+        self.assertEqual(stats["custom"]["enqueued"], 1)
+        self.assertEqual(stats["custom"]["sent"], 0)
+
+    def test_counters_from_many_threads(self):
+        metrics = ProducerMetrics()
+
+        def run():
+            for _ in range(1000):
+                metrics.count("sent")
+
+        threads = [Thread(target=run) for _ in range(4)]
+        for t in threads:
+            t.start()
+        metrics.count("sent")
+        for t in threads:
+            t.join()
+
+        self.assertEqual(metrics.snapshot()["regular"]["sent"], 4001)
+        # The counters of the finished threads are folded, and kept.
+        self.assertEqual(len(metrics.shards), 1)
+        self.assertEqual(metrics.snapshot()["regular"]["sent"], 4001)
+
+    def test_counters_from_short_lived_threads(self):
+        metrics = ProducerMetrics()
+
+        for _ in range(100):
+            thread = Thread(target=metrics.count, args=("sent",))
+            thread.start()
+            thread.join()
+
+        # Finished threads are folded without waiting for a snapshot.
+        self.assertLessEqual(len(metrics.shards), 16)
+        self.assertEqual(metrics.snapshot()["regular"]["sent"], 100)
+
+    def test_openmetrics(self):
+        metrics = ProducerMetrics()
+        metrics.count("sent", n=5)
+        metrics.observe("request_seconds", 0.2)
+
+        stats = metrics.snapshot()
+        stats["regular"]["queue_depth"] = 7
+        stats["custom"]["queue_depth"] = 0
+
+        text = to_openmetrics(stats)
+
+        self.assertIn("# TYPE amberflo_ingest_sent counter\n", text)
+        self.assertIn('amberflo_ingest_sent_total{lane="regular"} 5\n', text)
+        self.assertIn('amberflo_ingest_queue_depth{lane="regular"} 7\n', text)
+        self.assertIn('amberflo_ingest_request_seconds_bucket{le="0.1"} 0\n', text)
+        self.assertIn('amberflo_ingest_request_seconds_bucket{le="0.25"} 1\n', text)
+        self.assertIn('amberflo_ingest_request_seconds_bucket{le="+Inf"} 1\n', text)
+        self.assertIn("amberflo_ingest_request_seconds_count 1\n", text)
+        self.assertTrue(text.endswith("# EOF\n"))
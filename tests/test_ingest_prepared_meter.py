@@ -0,0 +1,118 @@
+import json
+import unittest
+
+from metering import codec
+from metering.ingest import MeterEvent, ThreadedProducer
+
+
+class _DummyBackend:
+    def send(self, payload):
+        pass
+
+
+def _producer(**kwargs):
+    return ThreadedProducer({}, _DummyBackend, threads=0, **kwargs)
+
+
+class TestPreparedMeter(unittest.TestCase):
+    def _emit(self, producer):
+        self.addCleanup(producer.join)
+        dimensions = {"region": "us-west-2"}
+        api_calls = producer.prepare("ApiCalls", dimensions=dimensions)
+        dimensions["region"] = "changed"
+
+        self.assertTrue(api_calls(1, customer_id="customer-1"))
+        self.assertTrue(api_calls(2.5, "customer-2", 1700000000000, "id-2"))
+
+        return list(producer.queue.queue)
+
+    def _check(self, payloads):
+        first, second = payloads
+
+        self.assertEqual(len(first.pop("uniqueId")), 36)
+        self.assertGreater(first.pop("meterTimeInMillis"), 1700000000000)
+        self.assertEqual(
+            first,
+            {
+                "meterApiName": "ApiCalls",
+                "meterValue": 1,
+                "customerId": "customer-1",
+                "dimensions": {"region": "us-west-2"},
+            },
+        )
+        self.assertEqual(
+            second,
+            {
+                "uniqueId": "id-2",
+                "meterApiName": "ApiCalls",
+                "meterValue": 2.5,
+                "customerId": "customer-2",
+                "meterTimeInMillis": 1700000000000,
+                "dimensions": {"region": "us-west-2"},
+            },
+        )
+
+    def test_dictionaries(self):
+        self._check(self._emit(_producer()))
+
+    def test_meter_events(self):
+        events = self._emit(_producer(compact_events=True))
+
+        self.assertTrue(all(isinstance(e, MeterEvent) for e in events))
+        self._check([e.to_payload() for e in events])
+
+    def test_pre_encoded(self):
+        fragments = self._emit(_producer(encode_on_send=True))
+
+        self.assertTrue(all(isinstance(f, codec.Fragment) for f in fragments))
+        self._check(json.loads(codec.join(fragments)))
+
+    def test_folded_on_overflow(self):
+        producer = _producer(
+            encode_on_send=True, overflow="aggregate", max_queue_size=1
+        )
+        self.addCleanup(producer.join)
+
+        emit = producer.prepare("ApiCalls", customer_id="customer-1")
+
+        self.assertTrue(emit(1))
+        self.assertTrue(emit(2))  # folded, since it is not serialized yet
+        self.assertEqual(producer.stats()["regular"]["folded"], 1)
+
+    def test_static_customer(self):
+        for encode_on_send in (False, True):
+            producer = _producer(encode_on_send=encode_on_send)
+            self.addCleanup(producer.join)
+
+            emit = producer.prepare("ApiCalls", customer_id="customer-1")
+            emit(1)
+            emit(1, customer_id="customer-2")
+
+            payloads = json.loads(codec.encode(list(producer.queue.queue)))
+            self.assertEqual(
+                [p["customerId"] for p in payloads], ["customer-1", "customer-2"]
+            )
+            self.assertNotIn("dimensions", payloads[0])
+
+    def test_validation(self):
+        producer = _producer()
+        self.addCleanup(producer.join)
+
+        with self.assertRaises(AssertionError):
+            producer.prepare("")
+
+        with self.assertRaises(AssertionError):
+            producer.prepare("ApiCalls", dimensions={"region": 1})
+
+        emit = producer.prepare("ApiCalls")
+
+        with self.assertRaises(AssertionError):
+            emit(1)  # no customer
+
+        with self.assertRaises(AssertionError):
+            emit("1", customer_id="customer-1")
+
+        with self.assertRaises(AssertionError):
+            emit(1, customer_id="customer-1", meter_time_in_millis=-1)
+
+        self.assertTrue(producer.queue.empty())
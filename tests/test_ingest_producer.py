@@ -1,8 +1,21 @@
+import json
+import os
+import signal
+import tempfile
+import time
 import unittest
+from threading import Event, Thread
+from queue import Full
 from time import sleep
 from unittest.mock import patch, Mock
 
-from metering.ingest import ThreadedProducer
+from metering import codec
+from metering.exceptions import ApiError
+from metering.ingest import MeterEvent, ThreadedProducer, create_ingest_payload
+from metering.ingest import producer as producer_module
+from metering.ingest.autoscaler import Autoscaler
+from metering.ingest.rate_limiter import RateLimiter
+from metering.ingest.spool import DiskSpool
 
 
 def _dummy_delay(*args, **kwargs):
@@ -161,6 +174,721 @@ class TestIngestConsumerQueueIsFull(unittest.TestCase):
         self.assertFalse(self.client.send_custom(2))
 
 
+class TestIngestConsumerBulkEnqueue(unittest.TestCase):
+    def setUp(self):
+        self.client = ThreadedProducer({}, _DummyBackend, max_queue_size=10, threads=0)
+
+    def test_send_many(self):
+        self.assertEqual(self.client.send_many(range(8)), (8, 0))
+        self.assertEqual(self.client.send_many(range(5)), (2, 3))
+        self.assertEqual(self.client.queue.qsize(), 10)
+
+    def test_send_many_reject_all(self):
+        self.client.send_many(range(8))
+
+        self.assertEqual(self.client.send_many(range(5), overflow="reject_all"), (0, 5))
+        self.assertEqual(self.client.queue.qsize(), 8)
+
+    def test_send_custom_many(self):
+        self.assertEqual(self.client.send_custom_many(range(12)), (10, 2))
+        self.assertEqual(self.client.custom_queue.qsize(), 10)
+
+    def test_invalid_overflow_policy(self):
+        with self.assertRaises(AssertionError):
+            self.client.send_many([1], overflow="explode")
+
+    def test_meter_many(self):
+        rows = [
+            {
+                "meter_api_name": "my-meter",
+                "meter_value": 1,
+                "meter_time_in_millis": 1619445706909,
+                "customer_id": "c1",
+            },
+            ("my-meter", 2, 1619445706909, "c2", {"region": "us"}),
+            {"meter_api_name": "my-meter"},  # invalid
+            ("my-meter", "not a number", 1619445706909, "c2"),  # invalid
+        ]
+
+        self.assertEqual(self.client.meter_many(rows), (2, 2))
+
+        first, second = self.client.queue.get(), self.client.queue.get()
+        self.assertEqual(first["customerId"], "c1")
+        self.assertEqual(second["dimensions"], {"region": "us"})
+
+    def test_send_many_with_aggregation(self):
+        client = ThreadedProducer(
+            {}, _DummyBackend, threads=0, aggregate_interval_in_secs=60
+        )
+        payload = create_ingest_payload(
+            meter_api_name="my-meter",
+            meter_value=1,
+            meter_time_in_millis=1619445706909,
+            customer_id="c1",
+        )
+
+        self.assertEqual(client.send_many([payload, payload, 1]), (3, 0))
+        self.assertEqual(client.queue.qsize(), 1)
+        client.join()
+
+
+def _meter(i=0):
+    return create_ingest_payload("my-meter", 1, 1700000000000, "customer-{}".format(i))
+
+
+class TestIngestConsumerOverflowPolicies(unittest.TestCase):
+    def _client(self, **kwargs):
+        client = ThreadedProducer(
+            {}, _DummyBackend, max_queue_size=2, threads=0, **kwargs
+        )
+        self.addCleanup(client.join)
+        return client
+
+    def _counter(self, client, name, lane="regular"):
+        return client.stats()[lane][name]
+
+    def test_block_until_timeout(self):
+        client = self._client(overflow="block", overflow_timeout_in_secs=0.05)
+        client.send_many([1, 2])
+
+        start = time.monotonic()
+        self.assertEqual(client.send_many([3, 4]), (0, 2))
+
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(self._counter(client, "blocked"), 2)
+        self.assertEqual(self._counter(client, "dropped"), 2)
+
+    def test_block_until_there_is_room(self):
+        client = self._client(overflow="block")
+        client.send_many([1, 2])
+
+        def consume():
+            sleep(0.05)
+            client.queue.get()
+            client.queue.task_done()
+
+        Thread(target=consume).start()
+
+        self.assertTrue(client.send(3))
+        self.assertEqual(self._counter(client, "blocked"), 1)
+        self.assertEqual(list(client.queue.queue), [2, 3])
+
+    def test_drop_oldest(self):
+        client = self._client()
+        client.send_many([1, 2])
+
+        self.assertEqual(client.send_many([3, 4, 5], overflow="drop_oldest"), (3, 0))
+        self.assertTrue(client.send_custom(1, overflow="drop_oldest"))
+
+        self.assertEqual(list(client.queue.queue), [4, 5])
+        self.assertEqual(self._counter(client, "evicted"), 3)
+        self.assertEqual(self._counter(client, "enqueued"), 5)
+
+    def test_spill(self):
+        with tempfile.TemporaryDirectory() as directory:
+            spool = DiskSpool(directory)
+            client = self._client(overflow="spill", spool=spool)
+
+            self.assertEqual(client.send_many([1, 2, 3, 4]), (4, 0))
+            self.assertTrue(client.send_custom(5))
+
+            self.assertEqual(spool.peek()[1:], ([3, 4], False))
+            self.assertEqual(self._counter(client, "spilled"), 2)
+            self.assertEqual(self._counter(client, "spilled", "custom"), 0)
+            client.join()
+            spool.close()
+
+    def test_spill_requires_a_spool(self):
+        with self.assertRaises(AssertionError):
+            ThreadedProducer({}, _DummyBackend, threads=0, overflow="spill")
+
+        client = self._client()
+        with self.assertRaises(AssertionError):
+            client.send(1, overflow="spill")
+
+    def test_aggregate(self):
+        client = self._client(overflow="aggregate")
+        client.send_many([_meter(0), _meter(1)])
+
+        self.assertTrue(client.send(_meter(2)))
+        self.assertTrue(client.send(_meter(2)))
+        self.assertFalse(client.send("not a meter record"))
+
+        self.assertEqual(client.queue.qsize(), 2)
+        self.assertEqual(len(client.aggregator), 1)
+        self.assertEqual(self._counter(client, "folded"), 2)
+        self.assertEqual(self._counter(client, "dropped"), 1)
+
+    def test_aggregate_rejects_custom_payloads(self):
+        client = self._client(overflow="aggregate")
+        client.send_many([_meter(0), _meter(1)])
+        client.send_custom(_meter(0))
+        client.send_custom(_meter(1))
+
+        self.assertFalse(client.send_custom(_meter(2)))
+
+        self.assertEqual(len(client.aggregator), 0)
+        self.assertEqual(self._counter(client, "folded", "custom"), 0)
+        self.assertEqual(self._counter(client, "dropped", "custom"), 1)
+
+    def test_aggregate_requires_an_aggregator(self):
+        client = self._client()
+
+        with self.assertRaises(AssertionError):
+            client.send(_meter(), overflow="aggregate")
+
+        with self.assertRaises(AssertionError):
+            self._client(overflow="aggregate").send_custom({}, overflow="aggregate")
+
+
+class TestIngestConsumerWithAggregation(unittest.TestCase):
+    def test_folds_meter_records_before_sending(self):
+        client = ThreadedProducer(
+            {},
+            _DummyBackend,
+            threads=1,
+            aggregate_interval_in_secs=60,
+            backoff_delay=_dummy_delay,
+        )
+
+        with patch.object(_DummyBackend, "send") as mock_send:
+            for i in range(100):
+                client.meter(
+                    meter_api_name="my-meter",
+                    meter_value=1,
+                    meter_time_in_millis=1619445660000 + i,
+                    customer_id="c1",
+                )
+            client.send(1)  # not a meter record, so not folded
+
+            self.assertEqual(client.queue.qsize(), 1)
+
+            client.shutdown()
+
+        batch = mock_send.call_args[0][0]
+        self.assertIn(1, batch)
+        [record] = [r for r in batch if r != 1]
+        self.assertEqual(record["meterValue"], 100)
+
+    def test_releases_folded_records_after_interval(self):
+        client = ThreadedProducer(
+            {},
+            _DummyBackend,
+            threads=0,
+            aggregate_interval_in_secs=0.05,
+        )
+
+        client.send(
+            create_ingest_payload(
+                meter_api_name="my-meter",
+                meter_value=1,
+                meter_time_in_millis=1619445660000,
+                customer_id="c1",
+            )
+        )
+        self.assertEqual(client.queue.qsize(), 0)
+
+        sleep(0.2)
+        self.assertEqual(client.queue.qsize(), 1)
+        client.join()
+
+
+class TestIngestConsumerEncodeOnSend(unittest.TestCase):
+    def test_payloads_are_serialized_when_enqueued(self):
+        client = ThreadedProducer({}, _DummyBackend, threads=0, encode_on_send=True)
+
+        client.send({"a": 1})
+        client.send_custom({"b": 2})
+
+        self.assertEqual(client.queue.get(), codec.dumps({"a": 1}))
+        self.assertIsInstance(client.custom_queue.get(), codec.Fragment)
+
+    def test_rejects_payloads_that_cannot_be_serialized(self):
+        client = ThreadedProducer({}, _DummyBackend, threads=0, encode_on_send=True)
+
+        with self.assertRaises(TypeError):
+            client.send(object())
+
+
+class TestIngestConsumerStats(unittest.TestCase):
+    def test_stats(self):
+        client = ThreadedProducer(
+            {},
+            _DummyBackend,
+            max_queue_size=5,
+            threads=1,
+            batch_size=3,
+            send_interval_in_secs=0.1,
+            backoff_delay=_dummy_delay,
+        )
+
+        with patch.object(_DummyBackend, "send"):
+            client.send_many(range(7))
+            client.send_custom(1)
+            client.flush()
+
+        client.join()
+        stats = client.stats()
+
+        self.assertEqual(stats["regular"]["enqueued"], 5)
+        self.assertEqual(stats["regular"]["dropped"], 2)
+        self.assertEqual(stats["regular"]["sent"], 5)
+        self.assertEqual(stats["regular"]["queue_depth"], 0)
+        self.assertEqual(stats["custom"]["sent"], 1)
+        self.assertEqual(
+            stats["request_seconds"]["count"], stats["batch_size"]["count"]
+        )
+        self.assertEqual(
+            stats["delivery_seconds"]["count"], stats["batch_size"]["count"]
+        )
+        self.assertIn(
+            'amberflo_ingest_sent_total{lane="custom"} 1', client.openmetrics()
+        )
+
+
+class _PipeBackend:
+    def __init__(self, fd):
+        self.fd = fd
+
+    def send(self, payload):
+        for item in payload:
+            os.write(self.fd, (json.dumps(item) + "\n").encode())
+
+    def send_custom(self, payload):
+        self.send(payload)
+
+
+class TestIngestConsumerFork(unittest.TestCase):
+    def test_fork_hooks_release_locks(self):
+        client = ThreadedProducer({}, _DummyBackend, threads=0)
+
+        producer_module._before_fork()
+        self.assertTrue(client.queue.mutex.locked())
+        producer_module._after_fork_in_parent()
+
+        self.assertTrue(client.send(1))
+        client.join()
+
+    def test_restart_after_fork_discards_inherited_items(self):
+        client = ThreadedProducer({}, _DummyBackend, threads=0)
+        client.send(1)
+        queue = client.queue
+
+        producer_module._before_fork()
+        producer_module._after_fork_in_child()
+
+        self.assertIsNot(client.queue, queue)
+        self.assertTrue(client.queue.empty())
+        client.join()
+
+    def test_restart_after_fork_reopens_the_spool(self):
+        with tempfile.TemporaryDirectory() as directory:
+            spool = DiskSpool(directory)
+            client = ThreadedProducer({}, _DummyBackend, threads=0, spool=spool)
+
+            producer_module._before_fork()
+            producer_module._after_fork_in_child()
+
+            child_spool = client.consumer_args["spool"]
+            self.assertIsNot(child_spool, spool)
+            self.assertEqual(os.path.dirname(child_spool.directory), directory)
+            client.join()
+            child_spool.close()
+            spool.close()
+
+    def test_joined_producers_are_not_restarted(self):
+        client = ThreadedProducer({}, _DummyBackend, threads=0)
+        client.join()
+        queue = client.queue
+
+        producer_module._before_fork()
+        producer_module._after_fork_in_child()
+
+        self.assertIs(client.queue, queue)
+
+    @unittest.skipUnless(hasattr(os, "fork"), "requires fork")
+    def test_child_process_gets_its_own_pipeline(self):
+        read_fd, write_fd = os.pipe()
+        client = ThreadedProducer(
+            {"fd": write_fd}, _PipeBackend, threads=1, send_interval_in_secs=0.05
+        )
+        client.send("parent")
+
+        pid = os.fork()
+
+        if pid == 0:  # child
+            signal.alarm(10)  # don't hang if the consumers are gone
+            client.send("child")
+            client.flush()
+            client.join()
+            os._exit(0)
+
+        _, status = os.waitpid(pid, 0)
+        client.shutdown()
+        os.close(write_fd)
+
+        with os.fdopen(read_fd) as f:
+            sent = sorted(json.loads(line) for line in f)
+
+        self.assertEqual(status, 0)
+        self.assertEqual(sent, ["child", "parent"])
+
+
+def _slow_delay(*args, **kwargs):
+    while True:
+        yield 60
+
+
+class TestIngestConsumerBoundedFlush(unittest.TestCase):
+    def test_flush_does_not_linger(self):
+        client = ThreadedProducer(
+            {}, _DummyBackend, threads=1, send_interval_in_secs=60
+        )
+        client.send(1)
+
+        start = time.monotonic()
+        report = client.flush(timeout=5)
+
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(
+            report, {"delivered": 1, "failed": 0, "spooled": 0, "pending": 0}
+        )
+        client.join()
+
+    def test_shutdown_gives_up_at_the_deadline(self):
+        on_error = Mock()
+        client = ThreadedProducer(
+            {},
+            _DummyBackend,
+            threads=1,
+            on_error=on_error,
+            backoff_delay=_slow_delay,
+        )
+
+        with patch.object(_DummyBackend, "send") as mock_send:
+            mock_send.side_effect = Exception("down")
+            client.send(1)
+
+            start = time.monotonic()
+            report = client.shutdown(timeout=0.3)
+
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(
+            report, {"delivered": 0, "failed": 1, "spooled": 0, "pending": 0}
+        )
+        on_error.assert_called_once()
+
+    def test_shutdown_does_not_wait_for_the_rate_limiter(self):
+        on_error = Mock()
+        limiter = RateLimiter()
+        limiter.record(ApiError(429, "too many requests", {"Retry-After": "60"}))
+        client = ThreadedProducer(
+            {}, _DummyBackend, threads=1, on_error=on_error, rate_limiter=limiter
+        )
+        client.send(1)
+
+        start = time.monotonic()
+        report = client.shutdown(timeout=0.3)
+
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(
+            report, {"delivered": 0, "failed": 1, "spooled": 0, "pending": 0}
+        )
+        on_error.assert_called_once()
+
+    def test_flush_with_extra_threads(self):
+        client = ThreadedProducer({}, _DummyBackend, threads=0)
+        client.send_many(range(10))
+
+        report = client.flush(timeout=5, extra_threads=2)
+
+        self.assertEqual(report["delivered"], 10)
+        self.assertEqual(report["pending"], 0)
+        client.join()
+
+    def test_flush_times_out(self):
+        client = ThreadedProducer({}, _DummyBackend, threads=0)
+        client.send_many(range(10))
+
+        report = client.flush(timeout=0.1)
+
+        self.assertEqual(report["delivered"], 0)
+        self.assertEqual(report["pending"], 10)
+        client.join()
+
+    def test_shutdown_spools_what_is_left(self):
+        with tempfile.TemporaryDirectory() as directory:
+            spool = DiskSpool(directory)
+            client = ThreadedProducer({}, _DummyBackend, threads=0, spool=spool)
+            client.send_many(range(10))
+            client.send_custom(1)
+
+            report = client.shutdown(timeout=0.1)
+
+            self.assertEqual(
+                report, {"delivered": 0, "failed": 0, "spooled": 11, "pending": 0}
+            )
+            self.assertIsNone(spool.writer)  # closed
+            self.assertEqual(spool.peek()[1:], (list(range(10)), False))
+            spool.close()
+
+    def test_join_after_shutdown(self):
+        client = ThreadedProducer({}, _DummyBackend, threads=1, pipeline_depth=1)
+        client.send(1)
+
+        client.shutdown()
+        client.join()
+        client.join()
+
+        self.assertTrue(client.queue.empty())
+
+
+class TestIngestConsumerAutoscaling(unittest.TestCase):
+    def test_scales_with_the_queue(self):
+        autoscaler = Autoscaler(
+            max_threads=2, queue_depth=1, idle_in_secs=0.2, interval_in_secs=0.02
+        )
+        client = ThreadedProducer(
+            {}, _DummyBackend, threads=0, autoscaler=autoscaler, batch_size=5
+        )
+
+        with patch.object(_DummyBackend, "send") as mock_send:
+            client.send_many(range(10))
+
+            self.assertTrue(client.queue.join(timeout=2))
+            self.assertGreater(client.stats()["threads"], 0)
+            self.assertEqual(mock_send.call_count, 2)
+
+            sleep(0.5)
+
+            self.assertEqual(client.stats()["threads"], 0)
+            self.assertGreater(len(client.backend_pool), 0)
+
+            created = client.backend_pool.created
+            client.send(1)
+            client.flush(timeout=2)
+
+        self.assertEqual(client.backend_pool.created, created)
+        client.join()
+
+    def test_stopping_a_busy_consumer_does_not_hold_up_flush(self):
+        sending, release = Event(), Event()
+
+        def send(payload):
+            sending.set()
+            release.wait(5)
+
+        autoscaler = Autoscaler(max_threads=2, interval_in_secs=60)
+        client = ThreadedProducer(
+            {}, _DummyBackend, threads=1, autoscaler=autoscaler, batch_size=1
+        )
+        [consumer] = client.consumers
+
+        with patch.object(_DummyBackend, "send", side_effect=send):
+            client.send(1)
+            self.assertTrue(sending.wait(2))
+
+            with patch.object(autoscaler, "decide", return_value=-1):
+                scaler = Thread(target=client._scale)
+                scaler.start()
+                sleep(0.05)
+
+            start = time.monotonic()
+            client.flush(timeout=0.1)
+            self.assertLess(time.monotonic() - start, 1)
+
+            released_at = time.monotonic()
+            release.set()
+            scaler.join()
+
+        self.assertEqual(client.consumers, [])
+        self.assertGreaterEqual(consumer.last_active, released_at)
+        client.join()
+
+
+class TestIngestConsumerCompactEvents(unittest.TestCase):
+    def test_meter_enqueues_meter_events(self):
+        client = ThreadedProducer({}, _DummyBackend, threads=0, compact_events=True)
+
+        self.assertTrue(client.meter("my-meter", 1, 1700000000000, "customer-1"))
+        self.assertEqual(
+            client.meter_many([("my-meter", 2, 1700000000000, "customer-2")]), (1, 0)
+        )
+
+        events = list(client.queue.queue)
+        self.assertTrue(all(isinstance(e, MeterEvent) for e in events))
+        self.assertEqual([e.customer_id for e in events], ["customer-1", "customer-2"])
+
+        client.join()
+
+
+class TestIngestConsumerMemoryBound(unittest.TestCase):
+    def test_max_queue_bytes(self):
+        client = ThreadedProducer(
+            {}, _DummyBackend, threads=0, max_queue_bytes=100, encode_on_send=True
+        )
+        payload = {"value": "x" * 30}  # 42 bytes
+
+        self.assertTrue(client.send(payload))
+        self.assertTrue(client.send_custom(payload))
+        self.assertFalse(client.send(payload))
+
+        stats = client.stats()
+        self.assertEqual(stats["regular"]["queue_bytes"], 42)
+        self.assertEqual(stats["custom"]["queue_bytes"], 42)
+        self.assertEqual(stats["regular"]["dropped"], 1)
+        self.assertIn("amberflo_ingest_queue_bytes", client.openmetrics())
+
+        client.join()
+
+
+class TestIngestConsumerFairQueueing(unittest.TestCase):
+    def test_noisy_customer_does_not_fill_the_queue(self):
+        for encode_on_send in (False, True):
+            with self.subTest(encode_on_send=encode_on_send):
+                client = ThreadedProducer(
+                    {},
+                    _DummyBackend,
+                    threads=0,
+                    fair_queue_key="customerId",
+                    max_queue_size_per_key=3,
+                    encode_on_send=encode_on_send,
+                )
+
+                noisy = [{"customerId": "noisy"}] * 5
+                self.assertEqual(client.send_many(noisy), (3, 2))
+                self.assertFalse(client.send({"customerId": "noisy"}))
+                self.assertTrue(client.send({"customerId": "quiet"}))
+                self.assertEqual(client.queue.depth("quiet"), 1)
+
+                client.join()
+
+
+class TestIngestConsumerValidation(unittest.TestCase):
+    def test_invalid_payloads_are_rejected(self):
+        client = ThreadedProducer({}, _DummyBackend, threads=0, validate_payloads=True)
+        invalid = dict(_meter(), meterValue="1")
+
+        self.assertFalse(client.send(invalid))
+        self.assertTrue(client.send(_meter()))
+        self.assertEqual(client.send_many([_meter(1), invalid, {}]), (1, 2))
+        self.assertTrue(client.send_custom(invalid))
+
+        self.assertEqual(client.queue.qsize(), 2)
+        self.assertEqual(client.stats()["regular"]["invalid"], 3)
+
+        client.join()
+
+    def test_pre_encoded_payloads_are_not_checked(self):
+        client = ThreadedProducer(
+            {},
+            _DummyBackend,
+            threads=0,
+            validate_payloads=True,
+            encode_on_send=True,
+        )
+
+        self.assertTrue(client.prepare("my-meter", customer_id="c1")(1))
+        self.assertTrue(client.send(codec.fragment(_meter())))
+        self.assertFalse(client.send(dict(_meter(), meterValue="1")))
+
+        self.assertEqual(client.queue.qsize(), 2)
+        self.assertEqual(client.stats()["regular"]["invalid"], 1)
+
+        client.join()
+
+
+class TestIngestConsumerDeliveryTracking(unittest.TestCase):
+    def test_futures_are_resolved_when_sent(self):
+        for encode_on_send in (False, True):
+            with self.subTest(encode_on_send=encode_on_send):
+                client = ThreadedProducer(
+                    {},
+                    _DummyBackend,
+                    threads=1,
+                    track_delivery=True,
+                    encode_on_send=encode_on_send,
+                    send_interval_in_secs=0.01,
+                )
+
+                futures = [
+                    client.meter("my-meter", i, 1700000000000, "c1") for i in (1, 2)
+                ]
+                futures.append(client.send_custom({"custom": True}))
+
+                self.assertEqual([f.result(timeout=5) for f in futures], ["sent"] * 3)
+                self.assertEqual(len(client.delivery_tracker), 0)
+
+                client.shutdown()
+
+    def test_futures_of_failed_batches(self):
+        error = ApiError(400, "bad request")
+        on_delivery = Mock()
+
+        with patch.object(_DummyBackend, "send", side_effect=error):
+            client = ThreadedProducer(
+                {}, _DummyBackend, threads=1, send_interval_in_secs=0.01
+            )
+
+            self.assertTrue(client.send(_meter(), on_delivery=on_delivery))
+            client.flush()
+            client.join()
+
+        future = on_delivery.call_args.args[0]
+        self.assertIs(future.exception(), error)
+
+    def test_futures_of_rejected_and_evicted_items(self):
+        client = ThreadedProducer(
+            {}, _DummyBackend, threads=0, max_queue_size=1, track_delivery=True
+        )
+
+        first = client.send(_meter(1))
+        rejected = client.send(_meter(2))
+        self.assertIsInstance(rejected.exception(), Full)
+
+        client.send(_meter(3), overflow="drop_oldest")
+        self.assertIsInstance(first.exception(), Full)
+
+        client.join()
+
+    def test_futures_of_items_evicted_in_vain(self):
+        client = ThreadedProducer(
+            {}, _DummyBackend, threads=0, max_queue_bytes=1000, track_delivery=True
+        )
+        first = client.send(_meter(1))
+
+        # The bytes are taken by the other queue while evicting.
+        with patch.object(client.queue.budget, "reserve", return_value=False):
+            rejected = client.send(_meter(2), overflow="drop_oldest")
+
+        self.assertIsInstance(first.exception(), Full)
+        self.assertIsInstance(rejected.exception(), Full)
+        self.assertEqual(client.stats()["regular"]["evicted"], 1)
+        self.assertEqual(client.queue.unfinished_tasks, 0)
+
+        client.join()
+
+    def test_futures_of_spilled_and_folded_items(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            spool = DiskSpool(tmp)
+            client = ThreadedProducer(
+                {},
+                _DummyBackend,
+                threads=0,
+                max_queue_size=1,
+                track_delivery=True,
+                spool=spool,
+                aggregate_interval_in_secs=60,
+            )
+
+            self.assertEqual(client.send(_meter(1)).result(), "folded")
+            client.send(1)
+            self.assertEqual(client.send(2, overflow="spill").result(), "spooled")
+
+            client.join()
+            spool.close()
+
+
 class TestIngestConsumerWithErrorCallback(unittest.TestCase):
     def test_error_callback_is_called_if_there_is_an_error(self):
         on_error_callback = Mock(return_value=None)
@@ -0,0 +1,110 @@
+import time
+import unittest
+from threading import Thread
+
+from metering.exceptions import ApiError
+from metering.ingest.rate_limiter import RateLimiter
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_unlimited_by_default(self):
+        limiter = RateLimiter()
+
+        start = time.monotonic()
+        for _ in range(100):
+            limiter.acquire()
+
+        self.assertLess(time.monotonic() - start, 0.1)
+
+    def test_limits_rate_after_burst(self):
+        limiter = RateLimiter(rate=50, burst=5)
+
+        start = time.monotonic()
+        for _ in range(10):
+            limiter.acquire()
+
+        # 5 requests at once, then 5 more at 50 per second.
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+    def test_honors_retry_after(self):
+        limiter = RateLimiter()
+        limiter.record(ApiError(429, "slow down", {"retry-after": "0.1"}))
+
+        self.assertEqual(limiter.state()["throttled"], 1)
+
+        start = time.monotonic()
+        limiter.acquire()
+
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+    def test_acquire_with_timeout(self):
+        limiter = RateLimiter()
+        limiter.record(ApiError(429, "slow down", {"Retry-After": "60"}))
+
+        start = time.monotonic()
+        self.assertFalse(limiter.acquire(timeout=0.05))
+        self.assertLess(time.monotonic() - start, 1)
+
+        self.assertTrue(RateLimiter().acquire(timeout=0))
+
+    def test_retry_after_is_bounded(self):
+        limiter = RateLimiter(max_retry_after_in_secs=0.05)
+        limiter.record(ApiError(429, "slow down", {"Retry-After": "3600"}))
+
+        self.assertLessEqual(limiter.state()["paused_for_in_secs"], 0.05)
+
+    def test_opens_circuit_after_consecutive_failures(self):
+        limiter = RateLimiter(failure_threshold=2, reset_timeout_in_secs=0.1)
+
+        limiter.record(ApiError(500, "internal server error"))
+        limiter.record(None)
+        limiter.record(ConnectionError())
+        self.assertEqual(limiter.state()["circuit"], "closed")
+
+        limiter.record(ApiError(503, "unavailable"))
+        self.assertEqual(limiter.state()["circuit"], "open")
+
+        start = time.monotonic()
+        limiter.acquire()  # the trial request
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+        self.assertEqual(limiter.state()["circuit"], "half-open")
+
+        limiter.record(None)
+        self.assertEqual(limiter.state()["circuit"], "closed")
+
+    def test_client_errors_are_not_failures(self):
+        limiter = RateLimiter(failure_threshold=1)
+
+        limiter.record(ApiError(400, "bad request"))
+
+        self.assertEqual(limiter.state()["circuit"], "closed")
+
+    def test_only_one_trial_request_while_half_open(self):
+        limiter = RateLimiter(failure_threshold=1, reset_timeout_in_secs=10)
+        limiter.record(Exception())
+        limiter.paused_until = 0
+
+        limiter.acquire()
+
+        acquired = []
+        t = Thread(target=lambda: acquired.append(limiter.acquire()))
+        t.start()
+        t.join(0.1)
+        self.assertEqual(acquired, [])
+
+        limiter.record(None)
+        t.join(1)
+        self.assertEqual(acquired, [True])
+
+
+class TestApiErrorRetryAfter(unittest.TestCase):
+    def test_seconds(self):
+        self.assertEqual(ApiError(429, "", {"Retry-After": "7"}).retry_after, 7)
+
+    def test_http_date(self):
+        error = ApiError(429, "", {"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"})
+        self.assertEqual(error.retry_after, 0)
+
+    def test_missing_or_invalid(self):
+        self.assertIsNone(ApiError(429, "").retry_after)
+        self.assertIsNone(ApiError(429, "", {"Retry-After": "soon"}).retry_after)
@@ -0,0 +1,60 @@
+import unittest
+from time import sleep
+
+from metering.ingest.retry_scheduler import RetryScheduler
+
+
+class TestRetryScheduler(unittest.TestCase):
+    def test_pops_due_retries_in_order(self):
+        scheduler = RetryScheduler()
+        error = Exception()
+
+        self.assertTrue(scheduler.schedule("b", 1, 1, error, 0.02))
+        self.assertTrue(scheduler.schedule("a", 1, 2, error, 0.01))
+        self.assertTrue(scheduler.schedule("c", 1, 1, error, 10))
+
+        self.assertIsNone(scheduler.pop_due())
+
+        sleep(0.03)
+
+        self.assertEqual(scheduler.pop_due(), ("a", 2))
+        self.assertEqual(scheduler.pop_due(), ("b", 1))
+        self.assertIsNone(scheduler.pop_due())
+        self.assertEqual(len(scheduler), 1)
+
+    def test_next_due(self):
+        scheduler = RetryScheduler()
+        self.assertIsNone(scheduler.next_due())
+
+        scheduler.schedule("a", 1, 1, None, 10)
+
+        self.assertIsNotNone(scheduler.next_due())
+
+    def test_max_batches(self):
+        scheduler = RetryScheduler(max_batches=1)
+
+        self.assertTrue(scheduler.schedule("a", 1, 1, None, 10))
+        self.assertFalse(scheduler.schedule("b", 1, 1, None, 10))
+        self.assertEqual(scheduler.rejected, 1)
+
+    def test_max_items(self):
+        scheduler = RetryScheduler(max_items=10)
+
+        self.assertTrue(scheduler.schedule("a", 6, 1, None, 0))
+        self.assertFalse(scheduler.schedule("b", 6, 1, None, 0))
+
+        scheduler.pop_due()
+
+        self.assertEqual(scheduler.items, 0)
+        self.assertTrue(scheduler.schedule("b", 6, 1, None, 0))
+
+    def test_drain(self):
+        scheduler = RetryScheduler()
+        error = Exception()
+
+        scheduler.schedule("b", 1, 1, error, 20)
+        scheduler.schedule("a", 1, 1, error, 10)
+
+        self.assertEqual(scheduler.drain(), [("a", error), ("b", error)])
+        self.assertEqual(len(scheduler), 0)
+        self.assertEqual(scheduler.items, 0)
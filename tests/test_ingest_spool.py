@@ -0,0 +1,157 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from metering import codec
+from metering.ingest.spool import DiskSpool
+
+
+class TestDiskSpool(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self.tmp.name, "spool")
+        self.spools = []
+
+    def tearDown(self):
+        for spool in self.spools:
+            spool.close()
+        self.tmp.cleanup()
+
+    def _spool(self, **kwargs):
+        spool = DiskSpool(self.directory, **kwargs)
+        self.spools.append(spool)
+        return spool
+
+    def _drain(self, spool):
+        batches = []
+        while True:
+            entry = spool.peek()
+            if entry is None:
+                return batches
+            position, batch, is_custom = entry
+            batches.append((batch, is_custom))
+            spool.ack(position)
+
+    def test_empty_spool(self):
+        spool = self._spool()
+        self.assertIsNone(spool.peek())
+
+    def test_peek_returns_oldest_batch_until_acked(self):
+        spool = self._spool()
+        spool.append([1, 2])
+        spool.append([{"a": "b"}], is_custom=True)
+
+        position, batch, is_custom = spool.peek()
+        self.assertEqual(batch, [1, 2])
+        self.assertFalse(is_custom)
+
+        # not acked yet
+        self.assertEqual(spool.peek()[1], [1, 2])
+
+        spool.ack(position)
+        _, batch, is_custom = spool.peek()
+        self.assertEqual(batch, [{"a": "b"}])
+        self.assertTrue(is_custom)
+
+    def test_stores_fragments(self):
+        spool = self._spool()
+        spool.append([codec.fragment({"a": 1}), {"b": 2}])
+
+        self.assertEqual(spool.peek()[1], [{"a": 1}, {"b": 2}])
+
+    def test_rolls_and_deletes_segments(self):
+        spool = self._spool(segment_bytes=64, fsync="always")
+
+        for i in range(10):
+            spool.append(list(range(i, i + 10)))
+
+        segments = [n for n in os.listdir(self.directory) if n.endswith(".spool")]
+        self.assertGreater(len(segments), 1)
+
+        batches = self._drain(spool)
+        self.assertEqual([b[0][0] for b in batches], list(range(10)))
+
+        segments = [n for n in os.listdir(self.directory) if n.endswith(".spool")]
+        self.assertLessEqual(len(segments), 1)
+
+        # can keep using it
+        spool.append([42])
+        self.assertEqual(self._drain(spool), [([42], False)])
+
+    def test_survives_restart(self):
+        spool = self._spool(segment_bytes=64)
+        for i in range(5):
+            spool.append([i])
+        position, _, _ = spool.peek()
+        spool.ack(position)
+        spool.close()
+
+        spool = self._spool(segment_bytes=64)
+        self.assertEqual([b for b, _ in self._drain(spool)], [[1], [2], [3], [4]])
+
+    def test_ignores_incomplete_record(self):
+        spool = self._spool()
+        spool.append([1])
+        spool.close()
+
+        [segment] = [n for n in os.listdir(self.directory) if n.endswith(".spool")]
+        with open(os.path.join(self.directory, segment), "ab") as f:
+            f.write(b"\x10\x00\x00")  # truncated header
+
+        spool = self._spool()
+        self.assertEqual(self._drain(spool), [([1], False)])
+
+    def test_rejects_batches_beyond_max_bytes(self):
+        spool = self._spool(max_bytes=100)
+
+        self.assertTrue(spool.append(list(range(10))))
+        self.assertFalse(spool.append(list(range(100))))
+
+    def test_for_child(self):
+        spool = self._spool(max_bytes=1000, fsync="never")
+        spool.append([1])
+
+        child = spool.for_child()
+        self.spools.append(child)
+        child.append([2])
+
+        self.assertEqual(
+            child.directory,
+            os.path.join(self.directory, "pid-{}".format(os.getpid())),
+        )
+        self.assertEqual((child.max_bytes, child.fsync), (1000, "never"))
+        self.assertEqual(self._drain(child), [([2], False)])
+        self.assertEqual(self._drain(spool), [([1], False)])
+
+    def test_children_share_max_bytes(self):
+        spool = self._spool(max_bytes=100)
+        child = spool.for_child()
+        self.spools.append(child)
+
+        self.assertTrue(child.append(list(range(20))))  # 59 bytes
+        self.assertFalse(spool.append(list(range(20))))
+        self.assertTrue(spool.append([1]))
+
+    def test_replays_spools_of_processes_that_are_gone(self):
+        spool = self._spool()
+        spool.append([0])
+        child = spool.for_child()
+        child.append([1])
+        child.close()
+
+        # The child is still alive.
+        self.assertEqual(self._drain(spool), [([0], False)])
+
+        spool.next_adopt_time = 0
+        with patch("metering.ingest.spool._is_alive", return_value=False):
+            self.assertEqual(self._drain(spool), [([1], False)])
+
+        self.assertFalse(os.path.exists(child.directory))
+        self.assertFalse(
+            any(n.startswith("adopted-") for n in os.listdir(self.directory))
+        )
+
+    def test_invalid_fsync_policy(self):
+        with self.assertRaises(AssertionError):
+            DiskSpool(self.directory, fsync="sometimes")
@@ -0,0 +1,79 @@
+import itertools
+import os
+import unittest
+from threading import Thread
+
+from metering.ingest import create_ingest_payload
+from metering.ingest import unique_id
+from metering.ingest.unique_id import SequentialIdGenerator, use_unique_id_generator
+
+
+class TestSequentialIdGenerator(unittest.TestCase):
+    def test_ids_are_ordered(self):
+        generate = SequentialIdGenerator()
+        ids = [generate() for _ in range(1000)]
+
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(len(set(ids)), 1000)
+        self.assertTrue(all(len(i) == 32 for i in ids))
+        int(ids[0], 16)
+
+    def test_ids_are_unique_across_threads(self):
+        generate = SequentialIdGenerator()
+        ids = []
+
+        def run():
+            ids.extend(generate() for _ in range(10000))
+
+        threads = [Thread(target=run) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(len(set(ids)), 40000)
+
+    def test_new_prefix_when_the_counter_runs_out(self):
+        generate = SequentialIdGenerator()
+        prefix = generate()[:24]
+        generate.state = (prefix, itertools.count(unique_id._max_count - 1))
+
+        last, first = generate(), generate()
+
+        self.assertEqual(last, prefix + "ffffffff")
+        self.assertNotEqual(first[:24], prefix)
+        self.assertEqual(first[24:], "00000000")
+
+    def test_new_prefix_in_forked_process(self):
+        if not hasattr(os, "fork"):
+            self.skipTest("os.fork is not available")
+
+        generate = SequentialIdGenerator()
+        parent = generate()
+        read_fd, write_fd = os.pipe()
+
+        pid = os.fork()
+        if pid == 0:
+            os.write(write_fd, generate().encode())
+            os._exit(0)
+
+        os.close(write_fd)
+        child = os.read(read_fd, 100).decode()
+        os.close(read_fd)
+        os.waitpid(pid, 0)
+
+        self.assertNotEqual(child[:24], parent[:24])
+
+
+class TestUseUniqueIdGenerator(unittest.TestCase):
+    def tearDown(self):
+        use_unique_id_generator(None)
+
+    def test_default_ids(self):
+        payload = create_ingest_payload("my-meter", 1, 1700000000000, "customer-1")
+        self.assertEqual(len(payload["uniqueId"]), 36)
+
+        use_unique_id_generator(lambda: "my-id")
+
+        payload = create_ingest_payload("my-meter", 1, 1700000000000, "customer-1")
+        self.assertEqual(payload["uniqueId"], "my-id")
@@ -0,0 +1,105 @@
+import subprocess
+import sys
+import unittest
+
+from metering import schema
+from metering.customer import create_customer_payload, customer_payload_schema
+from metering.exceptions import ValidationError
+from metering.ingest import create_ingest_payload
+from metering.ingest.api_client import ingest_payload_schema
+from metering.usage import (
+    AggregationType,
+    Take,
+    TimeGroupingInterval,
+    TimeRange,
+    create_usage_query,
+    usage_query_schema,
+)
+
+
+def _meter(**fields):
+    payload = create_ingest_payload("my-meter", 1, 1700000000000, "customer-1")
+    payload.update(fields)
+    return payload
+
+
+class TestSchema(unittest.TestCase):
+    def test_errors(self):
+        s = schema.Schema(
+            required={"name": schema.string, "count": schema.positive_int},
+            optional={"tags": schema.string_list},
+        )
+
+        self.assertEqual(s.errors({"name": "x", "count": 1, "other": None}), [])
+        self.assertEqual(
+            s.errors({"name": " ", "tags": []}),
+            [
+                "'name' may not be an empty string",
+                "'count' may not be None",
+                "'tags' may not be an empty list",
+            ],
+        )
+        self.assertEqual(len(s.errors("not a record")), 1)
+
+    def test_nested(self):
+        s = schema.Schema(
+            required={"range": schema.nested(schema.Schema({"start": schema.number}))}
+        )
+
+        self.assertEqual(s.errors({"range": {"start": 1}}), [])
+        self.assertEqual(s.errors({"range": {}}), ["'range.start' may not be None"])
+
+    def test_one_of(self):
+        s = schema.Schema(required={"kind": schema.one_of(["a", "b"])})
+
+        self.assertEqual(s.errors({"kind": "a"}), [])
+        self.assertEqual(
+            s.errors({"kind": ["a"]}), ["'kind' must be one of ['a', 'b']"]
+        )
+
+    def test_validate_many_reports_every_invalid_record(self):
+        records = [_meter(), _meter(meterValue="1"), _meter(), {}, _meter()]
+
+        self.assertEqual([i for i, _ in ingest_payload_schema.invalid(records)], [1, 3])
+
+        with self.assertRaises(ValidationError) as cm:
+            ingest_payload_schema.validate_many(records)
+
+        self.assertIsInstance(cm.exception, AssertionError)
+        self.assertEqual([i for i, _ in cm.exception.errors], [1, 3])
+        self.assertEqual(len(cm.exception.errors[1][1]), 4)
+
+        ingest_payload_schema.validate_many(records[:1])
+
+    def test_payload_builders(self):
+        ingest_payload_schema.validate(_meter(dimensions={"region": "us"}))
+        customer_payload_schema.validate(
+            create_customer_payload("c1", "Customer", enabled=True, traits={"a": "b"})
+        )
+        usage_query_schema.validate(
+            create_usage_query(
+                AggregationType.SUM,
+                "my-meter",
+                TimeGroupingInterval.DAY,
+                TimeRange(1700000000, 1700086400),
+                group_by=["customerId"],
+                usage_filter={"customerId": ["c1"]},
+                take=Take(10),
+            )
+        )
+
+        with self.assertRaises(ValidationError):
+            usage_query_schema.validate({"aggregation": "AVERAGE"})
+
+
+class TestOptimizedMode(unittest.TestCase):
+    def test_validation_does_not_depend_on_assert(self):
+        code = (
+            "from metering import validators\n"
+            "try:\n"
+            "    validators.require_string('name', '', allow_none=False)\n"
+            "except AssertionError:\n"
+            "    print('rejected')\n"
+        )
+        output = subprocess.check_output([sys.executable, "-O", "-c", code])
+        self.assertEqual(output.strip(), b"rejected")